@@ -0,0 +1,324 @@
+"""
+Prediction audit log backed by SQLite.
+
+Requests only enqueue a record; a background thread serializes and writes
+records in batched transactions (WAL mode), so /predict never waits on disk
+I/O. The queue is bounded: when it is full, records go to an overflow list
+the writer drains after its current batch, and past that to a spill file,
+so a request never waits on SQLite and no record is dropped. A batch that
+still fails after a few retries is spilled too; spilled records are
+replayed into the database once writes succeed again (or on the next
+start). Only a record that cannot be serialized at all is dropped, and it
+is logged and counted. `close()` drains everything still queued before
+returning.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    case_id TEXT,
+    model_version TEXT,
+    probability REAL,
+    request_json TEXT NOT NULL,
+    response_json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_case_id ON predictions (case_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_predictions_created_at ON predictions (created_at);
+"""
+
+INSERT = """
+INSERT INTO predictions (created_at, case_id, model_version, probability, request_json, response_json)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+_STOP = object()
+
+# A failing batch is retried this many times, backing off from RETRY_DELAY seconds, before it is spilled
+WRITE_ATTEMPTS = 3
+RETRY_DELAY = 0.2
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _to_json(value):
+    if hasattr(value, 'model_dump_json'):
+        return value.model_dump_json()
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+class AuditLog:
+    """Non-blocking, batched writer for prediction records"""
+
+    def __init__(self, path='audit_log.db', max_queue=10000, batch_size=500, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.max_chunks = max(1, max_queue // batch_size)
+        self.max_overflow = max_queue
+        self.overflow = []
+        self.overflow_lock = threading.Lock()
+        self.spill_path = f"{path}.spill"
+        self.spill_lock = threading.Lock()
+        self.spill_pending = os.path.exists(self.spill_path) or os.path.exists(f"{self.spill_path}.replay")
+        self.written = 0
+        self.overflow_writes = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.stats_lock = threading.Lock()
+
+        conn = connect(path)
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+        self.thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self.thread.start()
+
+    def record(self, created_at, case_id, model_version, probability, request, response):
+        """Queue one prediction; serialization happens on the writer thread"""
+        item = (created_at, case_id, model_version, probability, request, response)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self._overflow([item])
+
+    def record_many(self, items):
+        """Queue many (created_at, case_id, model_version, probability, request, response) tuples.
+
+        Items travel in batch_size chunks, one queue slot each; chunks beyond
+        what max_queue records' worth of slots allows take the same overflow
+        path as single records, so a bulk request never grows the queue past
+        the same memory bound.
+        """
+        overflow = []
+        for start in range(0, len(items), self.batch_size):
+            chunk = items[start:start + self.batch_size]
+            if overflow or self.queue.qsize() >= self.max_chunks:
+                overflow.extend(chunk)
+                continue
+            try:
+                self.queue.put_nowait(chunk)
+            except queue.Full:
+                overflow.extend(chunk)
+        if overflow:
+            self._overflow(overflow)
+
+    def _overflow(self, items):
+        """Hand items the queue has no room for to the writer, or to the spill file past max_overflow"""
+        with self.overflow_lock:
+            accepted = len(self.overflow) + len(items) <= self.max_overflow
+            if accepted:
+                self.overflow.extend(items)
+        if not accepted:
+            self._spill(self._serialize(items))
+        with self.stats_lock:
+            self.overflow_writes += len(items)
+
+    def _serialize(self, items):
+        """Rows for INSERT; a record that fails to serialize is logged and left out of the batch"""
+        rows = []
+        for item in items:
+            try:
+                created_at, case_id, model_version, probability, request, response = item
+                rows.append((created_at, case_id, model_version, float(probability),
+                             _to_json(request), _to_json(response)))
+            except Exception as e:
+                print(f"Audit log record {str(item)[:200]} could not be serialized, dropped: {e!r}")
+                with self.stats_lock:
+                    self.rejected += 1
+        return rows
+
+    def _insert(self, conn, rows):
+        with conn:
+            conn.executemany(INSERT, rows)
+        with self.stats_lock:
+            self.written += len(rows)
+
+    def _write(self, conn, items):
+        """Insert items, retrying with backoff; a batch that keeps failing is spilled"""
+        rows = self._serialize(items)
+        if not rows:
+            return
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                self._insert(conn, rows)
+                return
+            except sqlite3.Error as e:
+                error = e
+                if attempt + 1 < WRITE_ATTEMPTS:
+                    time.sleep(RETRY_DELAY * 2 ** attempt)
+        print(f"Audit log write failed ({len(rows)} records, spilled to {self.spill_path}): {error}")
+        self._spill(rows)
+
+    def _spill(self, rows):
+        with self.spill_lock:
+            with open(self.spill_path, 'a') as f:
+                f.writelines(json.dumps(row) + '\n' for row in rows)
+            self.spill_pending = True
+        with self.stats_lock:
+            self.spilled += len(rows)
+
+    def _replay(self, conn):
+        """Move spilled records into the database; they stay spilled if SQLite still fails"""
+        replay_path = f"{self.spill_path}.replay"
+        with self.spill_lock:
+            # A .replay file left by an interrupted replay goes first
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    self.spill_pending = False
+                    return
+                os.replace(self.spill_path, replay_path)
+        rows = []
+        with open(replay_path) as f:
+            for line in f:
+                try:
+                    rows.append(tuple(json.loads(line)))
+                except ValueError:
+                    # A line cut short by a crash mid-append
+                    continue
+        try:
+            # One transaction, so a failed replay leaves nothing half-inserted to duplicate later
+            self._insert(conn, rows)
+        except sqlite3.Error as e:
+            print(f"Audit log replay of {self.spill_path} failed, will retry: {e}")
+            return
+        os.remove(replay_path)
+        with self.spill_lock:
+            self.spill_pending = os.path.exists(self.spill_path)
+
+    def _drain_overflow(self, conn):
+        with self.overflow_lock:
+            overflow, self.overflow = self.overflow, []
+        for start in range(0, len(overflow), self.batch_size):
+            self._write(conn, overflow[start:start + self.batch_size])
+
+    def _run(self):
+        conn = connect(self.path)
+        stopping = False
+        while not stopping:
+            try:
+                stopping = self._step(conn)
+            except Exception as e:
+                # The thread is the only writer; an unexpected error must not end it
+                print(f"Audit log writer error, continuing: {e!r}")
+        try:
+            if self.spill_pending:
+                self._replay(conn)
+        finally:
+            conn.close()
+
+    def _step(self, conn):
+        """Write one batch (or catch up when idle); True once the stop marker is seen"""
+        try:
+            item = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            # Idle: catch up on anything spilled while SQLite was failing
+            self._drain_overflow(conn)
+            if self.spill_pending:
+                self._replay(conn)
+            return False
+
+        stopping = False
+        batch = []
+        while True:
+            if item is _STOP:
+                stopping = True
+            elif isinstance(item, list):
+                batch.extend(item)
+            else:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                break
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+        if batch:
+            self._write(conn, batch)
+        self._drain_overflow(conn)
+        return stopping
+
+    def close(self, timeout=30):
+        """Flush everything queued and stop the writer"""
+        if not self.thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.queue.put(_STOP, timeout=max(0.01, deadline - time.monotonic()))
+                break
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    return
+        self.thread.join(max(0, deadline - time.monotonic()))
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'queued': self.queue.qsize(),
+                'written': self.written,
+                'overflow_writes': self.overflow_writes,
+                'overflow_queued': len(self.overflow),
+                'spilled': self.spilled,
+                'rejected': self.rejected
+            }
+
+    def query(self, case_id=None, start=None, end=None, limit=100):
+        """Records filtered by case id and/or ISO timestamp range, newest first"""
+        clauses, params = [], []
+        if case_id is not None:
+            clauses.append("case_id = ?")
+            params.append(case_id)
+        if start is not None:
+            clauses.append("created_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("created_at < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+
+        conn = connect(self.path)
+        try:
+            rows = conn.execute(
+                f"SELECT id, created_at, case_id, model_version, probability, request_json, response_json "
+                f"FROM predictions {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                params
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return [
+            {
+                'id': row[0],
+                'created_at': row[1],
+                'case_id': row[2],
+                'model_version': row[3],
+                'probability': row[4],
+                'request': json.loads(row[5]),
+                'response': json.loads(row[6])
+            }
+            for row in rows
+        ]
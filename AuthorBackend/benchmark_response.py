@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark /predict response construction and serialization.
+
+Compares the previous path (pydantic PredictionResponse built from nested
+ActionableRecommendation models, re-validated through response_model, then
+rendered by the stdlib JSONResponse) with the current fast path (prebuilt
+dicts rendered by FastJSONResponse), checks that both produce identical
+bytes, and reports each path's share of total in-process /predict latency.
+
+    python benchmark_response.py --n 2000
+"""
+import argparse
+import random
+import time
+
+from fastapi.responses import JSONResponse
+
+import api_v2
+from api_v2 import (
+    PriorAuthRequest, PredictionResponse, FastJSONResponse, build_response, rank_denial_reasons,
+    prepare_features_from_request, score_features, rules_engine, orjson
+)
+
+
+def random_request(rng):
+    return PriorAuthRequest(
+        patient_age=rng.randint(25, 85),
+        patient_gender=rng.choice(['M', 'F']),
+        payer=rng.choice(['UnitedHealth', 'Anthem', 'Aetna', 'BCBS', 'Cigna', 'Humana']),
+        procedure_category=rng.choice(['imaging', 'surgery', 'injection']),
+        procedure_code=rng.choice(['72148', '29827', '64483']),
+        primary_diagnosis=rng.choice(['M54.5', 'M51.26']),
+        diagnosis_months=rng.randint(1, 36),
+        pt_weeks=rng.randint(0, 12),
+        tried_nsaids=rng.random() < 0.5,
+        tried_injections=rng.random() < 0.5,
+        pain_current=rng.randint(3, 10),
+        pain_trend=rng.choice(['stable', 'worsening', 'improving']),
+        has_neurological_symptoms=rng.random() < 0.35,
+        imaging_findings=rng.choice(['normal', 'mild', 'moderate', 'severe']),
+        work_status=rng.choice(['working_full', 'light_duty', 'cannot_work']),
+        includes_failed_conservative=rng.random() < 0.5,
+        includes_medical_necessity=rng.random() < 0.5,
+        includes_work_impact=rng.random() < 0.5,
+        documentation_complete=rng.random() < 0.5,
+        submission_day=rng.choice(['Monday', 'Wednesday', 'Friday']),
+        urgent=rng.random() < 0.1
+    )
+
+
+def score(request):
+    """Everything /predict does before building the response"""
+    features = prepare_features_from_request(request)
+    probabilities, reason_probabilities = score_features(features)
+    probability = float(probabilities[0])
+    insights = rules_engine.evaluate([request], [probability])[0]
+    return probability, insights, reason_probabilities
+
+
+def previous_path(probability, insights, reason_probabilities):
+    response = PredictionResponse(**build_response(probability, insights, rank_denial_reasons(reason_probabilities, 1)[0]))
+    # What FastAPI's response_model handling did with the returned model
+    content = response.model_dump()
+    validated = PredictionResponse.model_validate(content)
+    return JSONResponse(validated.model_dump(mode='json')).body
+
+
+def fast_path(probability, insights, reason_probabilities):
+    return FastJSONResponse(build_response(probability, insights, rank_denial_reasons(reason_probabilities, 1)[0])).body
+
+
+def timed(fn, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - start) / len(args_list) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=2000, help='Number of random requests')
+    args = parser.parse_args()
+
+    api_v2.load_artifacts()
+    rng = random.Random(42)
+    requests = [random_request(rng) for _ in range(args.n)]
+    scored = [score(r) for r in requests]
+
+    mismatches = sum(previous_path(*s) != fast_path(*s) for s in scored)
+
+    score_us = timed(lambda r: score(r), [(r,) for r in requests])
+    previous_us = timed(previous_path, scored)
+    fast_us = timed(fast_path, scored)
+
+    print("="*60)
+    print("/predict RESPONSE PATH BENCHMARK")
+    print("="*60)
+    print(f"\n  Requests: {args.n} (orjson {'available' if orjson else 'NOT installed, stdlib fallback'})")
+    print(f"  Identical bytes: {args.n - mismatches}/{args.n}")
+    print(f"\n  Features + scoring + rules: {score_us:8.1f} us")
+    print(f"  Response (previous):        {previous_us:8.1f} us  "
+          f"({previous_us / (score_us + previous_us):.1%} of total)")
+    print(f"  Response (fast path):       {fast_us:8.1f} us  "
+          f"({fast_us / (score_us + fast_us):.1%} of total)")
+    print(f"\n  Response speedup: {previous_us / fast_us:.1f}x, "
+          f"per-request saving {previous_us - fast_us:.1f} us")
+
+    api_v2.audit_log.close()
+
+
+if __name__ == "__main__":
+    main()
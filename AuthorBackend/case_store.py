@@ -0,0 +1,592 @@
+"""
+Case repository for the Cases and Patients screens.
+
+Cases live in SQLite with one composite index per list filter, each ending in
+(submitted_at, case_id). List queries use keyset pagination on that pair, so
+every page is a bounded index range scan no matter how deep the client pages
+or how many cases are stored.
+
+submitted_at is the real submission time and is NULL when unknown: cases
+imported from a CSV without a submitted_at column have none (the training
+data only records the weekday). Undated cases list after all dated ones,
+never match a submitted_from/submitted_to filter, and aggregate under an
+empty day. The weekday aggregates use the CSV's submission_day_of_week
+or the API's submission_day where a row has one, and the submitted_at
+date otherwise.
+
+Dashboard statistics come from materialized aggregates: counts and
+prediction sums per payer x procedure_category x submission day x weekday
+(and per denial reason), kept current by triggers on every insert, update and
+delete of a case, including imports and recorded predictions. A dashboard
+query therefore reads one row per group instead of rescanning all cases.
+
+Bulk import from a training CSV:
+    python case_store.py --import training_data_v2.csv
+"""
+import argparse
+import base64
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    case_id TEXT PRIMARY KEY,
+    patient_id TEXT,
+    payer TEXT,
+    procedure_category TEXT,
+    procedure_code TEXT,
+    primary_diagnosis TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    denial_reason TEXT,
+    submitted_at TEXT,
+    submission_weekday INTEGER,
+    approval_probability REAL,
+    model_version TEXT,
+    predicted_at TEXT,
+    data_json TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_cases_submitted ON cases (submitted_at, case_id);
+CREATE INDEX IF NOT EXISTS idx_cases_payer ON cases (payer, submitted_at, case_id);
+CREATE INDEX IF NOT EXISTS idx_cases_procedure ON cases (procedure_code, submitted_at, case_id);
+CREATE INDEX IF NOT EXISTS idx_cases_status ON cases (status, submitted_at, case_id);
+CREATE INDEX IF NOT EXISTS idx_cases_patient ON cases (patient_id, submitted_at, case_id);
+"""
+
+AGGREGATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS case_stats (
+    payer TEXT NOT NULL,
+    procedure_category TEXT NOT NULL,
+    day TEXT NOT NULL,
+    weekday INTEGER NOT NULL,
+    cases INTEGER NOT NULL,
+    approved INTEGER NOT NULL,
+    denied INTEGER NOT NULL,
+    predicted INTEGER NOT NULL,
+    probability_sum REAL NOT NULL,
+    PRIMARY KEY (payer, procedure_category, day, weekday)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS denial_stats (
+    payer TEXT NOT NULL,
+    procedure_category TEXT NOT NULL,
+    day TEXT NOT NULL,
+    denial_reason TEXT NOT NULL,
+    cases INTEGER NOT NULL,
+    PRIMARY KEY (payer, procedure_category, day, denial_reason)
+) WITHOUT ROWID;
+"""
+
+
+def group_key(row):
+    return (f"coalesce({row}.payer, ''), coalesce({row}.procedure_category, ''), "
+            f"coalesce(substr({row}.submitted_at, 1, 10), '')")
+
+
+def case_stats_delta(row, sign):
+    """Add (sign 1) or remove (sign -1) one case's contribution; row is NEW or OLD"""
+    return f"""
+    INSERT INTO case_stats VALUES (
+        {group_key(row)}, coalesce({row}.submission_weekday, -1), {sign},
+        {sign} * ({row}.status = 'approved'), {sign} * ({row}.status = 'denied'),
+        {sign} * ({row}.approval_probability IS NOT NULL), {sign} * coalesce({row}.approval_probability, 0)
+    ) ON CONFLICT (payer, procedure_category, day, weekday) DO UPDATE SET
+        cases = cases + excluded.cases,
+        approved = approved + excluded.approved,
+        denied = denied + excluded.denied,
+        predicted = predicted + excluded.predicted,
+        probability_sum = probability_sum + excluded.probability_sum;"""
+
+
+def denial_stats_delta(row, sign):
+    return f"""
+    INSERT INTO denial_stats VALUES ({group_key(row)}, {row}.denial_reason, {sign})
+    ON CONFLICT (payer, procedure_category, day, denial_reason) DO UPDATE SET cases = cases + excluded.cases;"""
+
+
+# Only updates to these columns can move a case between aggregate rows
+CASE_STATS_COLUMNS = 'payer, procedure_category, submitted_at, submission_weekday, status, approval_probability'
+DENIAL_STATS_COLUMNS = 'payer, procedure_category, submitted_at, denial_reason'
+
+AGGREGATE_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS case_stats_insert AFTER INSERT ON cases BEGIN
+    {case_stats_delta('NEW', 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS case_stats_update AFTER UPDATE OF {CASE_STATS_COLUMNS} ON cases BEGIN
+    {case_stats_delta('OLD', -1)}
+    {case_stats_delta('NEW', 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS case_stats_delete AFTER DELETE ON cases BEGIN
+    {case_stats_delta('OLD', -1)}
+END;
+CREATE TRIGGER IF NOT EXISTS denial_stats_insert AFTER INSERT ON cases
+WHEN NEW.denial_reason IS NOT NULL BEGIN
+    {denial_stats_delta('NEW', 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS denial_stats_remove AFTER UPDATE OF {DENIAL_STATS_COLUMNS} ON cases
+WHEN OLD.denial_reason IS NOT NULL BEGIN
+    {denial_stats_delta('OLD', -1)}
+END;
+CREATE TRIGGER IF NOT EXISTS denial_stats_add AFTER UPDATE OF {DENIAL_STATS_COLUMNS} ON cases
+WHEN NEW.denial_reason IS NOT NULL BEGIN
+    {denial_stats_delta('NEW', 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS denial_stats_delete AFTER DELETE ON cases
+WHEN OLD.denial_reason IS NOT NULL BEGIN
+    {denial_stats_delta('OLD', -1)}
+END;
+"""
+
+# GROUP BY expressions for approval_stats(by=...)
+STAT_DIMENSIONS = {
+    'payer': 'payer',
+    'procedure_category': 'procedure_category',
+    'day': 'day',
+    'weekday': 'weekday',
+}
+
+# submission_weekday is an index into this list, as strftime('%w') counts; -1 in case_stats is unknown
+WEEKDAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+# The same weekday in SQL, for stores written before cases had the column
+WEEKDAY_SQL = f"""coalesce(
+    CASE json_extract(data_json, '$.submission_day_of_week')
+        {' '.join(f"WHEN '{day}' THEN {number}" for number, day in enumerate(WEEKDAYS))}
+    END,
+    CASE json_extract(data_json, '$.submission_day')
+        {' '.join(f"WHEN '{day}' THEN {number}" for number, day in enumerate(WEEKDAYS))}
+    END,
+    CAST(strftime('%w', substr(submitted_at, 1, 10)) AS INTEGER)
+)"""
+
+COLUMNS = [
+    'case_id', 'patient_id', 'payer', 'procedure_category', 'procedure_code',
+    'primary_diagnosis', 'status', 'denial_reason', 'submitted_at', 'submission_weekday',
+    'approval_probability', 'model_version', 'predicted_at', 'data_json'
+]
+
+FILTERS = ['patient_id', 'payer', 'procedure_code', 'status']
+
+_UPSERT = f"""
+INSERT INTO cases ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})
+ON CONFLICT(case_id) DO UPDATE SET
+    patient_id = excluded.patient_id,
+    payer = excluded.payer,
+    procedure_category = excluded.procedure_category,
+    procedure_code = excluded.procedure_code,
+    primary_diagnosis = excluded.primary_diagnosis,
+    {{outcome}}submitted_at = coalesce(excluded.submitted_at, cases.submitted_at),
+    submission_weekday = coalesce(excluded.submission_weekday, cases.submission_weekday),
+    data_json = excluded.data_json
+"""
+
+# Rows that carry no outcome of their own (a resubmitted form) keep the stored status and denial reason
+UPSERT = _UPSERT.format(outcome='status = excluded.status,\n    denial_reason = excluded.denial_reason,\n    ')
+UPSERT_KEEP_OUTCOME = _UPSERT.format(outcome='')
+
+
+def encode_cursor(submitted_at, case_id):
+    return base64.urlsafe_b64encode(json.dumps([submitted_at, case_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        submitted_at, case_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    return submitted_at, case_id
+
+
+def case_status(row):
+    """Training rows carry an outcome; anything else is still pending"""
+    if 'status' in row and row['status']:
+        return row['status']
+    if 'approved' in row and row['approved'] in (0, 1, '0', '1'):
+        return 'approved' if int(row['approved']) == 1 else 'denied'
+    return 'pending'
+
+
+def sets_outcome(row):
+    """Whether a row states its own status, outcome or denial reason"""
+    return (bool(row.get('status')) or row.get('approved') in (0, 1, '0', '1')
+            or row.get('denial_reason') not in (None, 'none'))
+
+
+def submission_weekday(row, submitted_at):
+    """The recorded submission_day_of_week (training rows) or submission_day (POST /cases),
+    else the weekday of submitted_at"""
+    for field in ('submission_day_of_week', 'submission_day'):
+        if row.get(field) in WEEKDAYS:
+            return WEEKDAYS.index(row[field])
+    if submitted_at:
+        try:
+            return (datetime.fromisoformat(str(submitted_at)[:10]).weekday() + 1) % 7
+        except ValueError:
+            pass
+    return None
+
+
+def row_to_record(row, submitted_at):
+    denial_reason = row.get('denial_reason')
+    submitted_at = row.get('submitted_at') or submitted_at
+    return (
+        str(row['case_id']),
+        row.get('patient_id'),
+        row.get('payer'),
+        row.get('procedure_category'),
+        str(row['procedure_code']) if row.get('procedure_code') is not None else None,
+        row.get('primary_diagnosis'),
+        case_status(row),
+        denial_reason if denial_reason not in (None, 'none') else None,
+        submitted_at,
+        submission_weekday(row, submitted_at),
+        None,
+        None,
+        None,
+        json.dumps(row, default=str)
+    )
+
+
+class CaseStore:
+    """SQLite-backed case repository with keyset-paginated listing"""
+
+    def __init__(self, path='cases.db'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._add_weekday()
+        self._allow_undated()
+        aggregate_columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(case_stats)")}
+        if aggregate_columns and 'weekday' not in aggregate_columns:
+            # Aggregates from before the weekday dimension are dropped with their triggers and rebuilt
+            with self.conn:
+                for trigger in self.conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'cases'"
+                ).fetchall():
+                    self.conn.execute(f"DROP TRIGGER {trigger['name']}")
+                self.conn.execute("DROP TABLE case_stats")
+                self.conn.execute("DROP TABLE denial_stats")
+            aggregate_columns = set()
+        self.conn.executescript(AGGREGATE_SCHEMA + AGGREGATE_TRIGGERS)
+        # Stores created before the aggregates existed are backfilled once
+        if not aggregate_columns:
+            self.rebuild_aggregates()
+
+    def _add_weekday(self):
+        """Stores created before submission_weekday existed get it added and backfilled once"""
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(cases)")}
+        if 'submission_weekday' in columns:
+            return
+        with self.conn:
+            self.conn.execute("ALTER TABLE cases ADD COLUMN submission_weekday INTEGER")
+            self.conn.execute(f"UPDATE cases SET submission_weekday = {WEEKDAY_SQL}")
+
+    def _allow_undated(self):
+        """Stores created when submitted_at was NOT NULL get the column relaxed once"""
+        columns = {row['name']: row for row in self.conn.execute("PRAGMA table_info(cases)")}
+        if not columns['submitted_at']['notnull']:
+            return
+        # SQLite cannot drop a NOT NULL constraint in place; copy into a fresh table
+        indexes = [row[0] for row in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_cases_%'"
+        )]
+        with self.conn:
+            self.conn.execute("ALTER TABLE cases RENAME TO cases_old")
+            for index in indexes:
+                self.conn.execute(f"DROP INDEX {index}")
+        self.conn.executescript(SCHEMA)
+        # Dropping the old table drops its triggers too; __init__ creates them on the new one
+        with self.conn:
+            self.conn.execute(f"INSERT INTO cases SELECT {', '.join(COLUMNS)} FROM cases_old")
+            self.conn.execute("DROP TABLE cases_old")
+
+    def close(self):
+        self.conn.close()
+
+    def upsert_cases(self, rows, submitted_at=None):
+        """Insert or update case dicts in one transaction; rows without submitted_at are submitted now"""
+        submitted_at = submitted_at or datetime.utcnow().isoformat()
+        self._upsert(rows, submitted_at)
+
+    def _upsert(self, rows, submitted_at):
+        with self.lock, self.conn:
+            for outcome, group in itertools.groupby(rows, key=sets_outcome):
+                self.conn.executemany(UPSERT if outcome else UPSERT_KEEP_OUTCOME,
+                                      [row_to_record(row, submitted_at) for row in group])
+
+    def import_csv(self, path, chunksize=50000):
+        """Bulk import cases from a CSV such as training_data_v2.csv
+
+        Each row keeps its own submitted_at column if the CSV has one and is
+        undated (NULL) otherwise; the import time says nothing about when a
+        historical case was submitted.
+        """
+        import pandas as pd
+
+        total = 0
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            self._upsert(chunk.to_dict('records'), None)
+            total += len(chunk)
+            print(f"  Imported {total} cases...")
+        self.conn.execute("ANALYZE")
+        return total
+
+    def get_case(self, case_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM cases WHERE case_id = ?", (case_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list_cases(self, limit=50, cursor=None, submitted_from=None, submitted_to=None, **filters):
+        """One page of cases, newest first, plus the cursor for the next page"""
+        clauses, params = [], []
+        for field in FILTERS:
+            if filters.get(field) is not None:
+                clauses.append(f"{field} = ?")
+                params.append(filters[field])
+        if submitted_from is not None:
+            clauses.append("submitted_at >= ?")
+            params.append(submitted_from)
+        if submitted_to is not None:
+            clauses.append("submitted_at < ?")
+            params.append(submitted_to)
+        after_at, after_id = decode_cursor(cursor) if cursor is not None else (None, None)
+
+        # Dated cases come first, then undated ones; each part is one index range scan
+        parts = []
+        if cursor is None:
+            parts.append(("submitted_at IS NOT NULL", []))
+        elif after_at is not None:
+            parts.append(("(submitted_at, case_id) < (?, ?)", [after_at, after_id]))
+        if submitted_from is None and submitted_to is None:
+            if cursor is not None and after_at is None:
+                parts.append(("submitted_at IS NULL AND case_id < ?", [after_id]))
+            else:
+                parts.append(("submitted_at IS NULL", []))
+
+        rows = []
+        with self.lock:
+            for clause, extra in parts:
+                if len(rows) > limit:
+                    break
+                rows += self._page(clauses + [clause], params + extra, limit + 1 - len(rows))
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['submitted_at'], rows[-1]['case_id'])
+
+        return {
+            'cases': [self._to_dict(row, include_data=False) for row in rows],
+            'next_cursor': next_cursor
+        }
+
+    def _page(self, clauses, params, limit):
+        return self.conn.execute(
+            f"SELECT * FROM cases WHERE {' AND '.join(clauses)} ORDER BY submitted_at DESC, case_id DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+
+    def record_prediction(self, case_id, probability, model_version, predicted_at):
+        """Store the latest score for a case; unknown case ids are ignored"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE cases SET approval_probability = ?, model_version = ?, predicted_at = ? WHERE case_id = ?",
+                (float(probability), model_version, predicted_at, case_id)
+            )
+
+    def record_predictions(self, rows):
+        """record_prediction for many (case_id, probability, model_version, predicted_at) in one transaction"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE cases SET approval_probability = ?, model_version = ?, predicted_at = ? WHERE case_id = ?",
+                [(float(probability), model_version, predicted_at, case_id)
+                 for case_id, probability, model_version, predicted_at in rows]
+            )
+
+    def count_cases(self):
+        with self.lock:
+            return self.conn.execute("SELECT count(*) FROM cases").fetchone()[0]
+
+    def case_data_batches(self, batch_size=1000):
+        """All cases as lists of (case_id, form data), in case_id order, one keyset page per batch"""
+        last = ''
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT case_id, data_json FROM cases WHERE case_id > ? ORDER BY case_id LIMIT ?",
+                    (last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [(case_id, json.loads(data) if data else None) for case_id, data in rows]
+            last = rows[-1][0]
+
+    def rebuild_aggregates(self):
+        """Recompute case_stats and denial_stats from the cases table"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM case_stats")
+            self.conn.execute("DELETE FROM denial_stats")
+            self.conn.execute(f"""
+                INSERT INTO case_stats
+                SELECT {group_key('cases')}, coalesce(submission_weekday, -1), count(*), sum(status = 'approved'), sum(status = 'denied'),
+                       count(approval_probability), coalesce(sum(approval_probability), 0)
+                FROM cases GROUP BY 1, 2, 3, 4
+            """)
+            self.conn.execute(f"""
+                INSERT INTO denial_stats
+                SELECT {group_key('cases')}, denial_reason, count(*)
+                FROM cases WHERE denial_reason IS NOT NULL GROUP BY 1, 2, 3, 4
+            """)
+
+    @staticmethod
+    def _stats_filter(start_day, end_day, payer, procedure_category):
+        clauses, params = [], []
+        for column, op, value in (('day', '>=', start_day), ('day', '<', end_day),
+                                  ('payer', '=', payer), ('procedure_category', '=', procedure_category)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        # Undated cases (day '') fall inside no date range, open-ended or not
+        if end_day is not None and start_day is None:
+            clauses.append("day <> ''")
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def approval_stats(self, by=None, start_day=None, end_day=None, payer=None, procedure_category=None):
+        """Case counts, approval rate and mean predicted probability, overall or per `by` value.
+
+        by is one of STAT_DIMENSIONS (or None for a single total). Days are
+        submission dates (YYYY-MM-DD), start inclusive and end exclusive.
+        """
+        if by is not None and by not in STAT_DIMENSIONS:
+            raise ValueError(f"by must be one of {sorted(STAT_DIMENSIONS)}")
+        where, params = self._stats_filter(start_day, end_day, payer, procedure_category)
+        key = f"{STAT_DIMENSIONS[by]} AS key, " if by else ""
+        group = "GROUP BY 1 ORDER BY 1" if by else ""
+        with self.lock:
+            rows = self.conn.execute(f"""
+                SELECT {key}coalesce(sum(cases), 0) AS cases, coalesce(sum(approved), 0) AS approved,
+                       coalesce(sum(denied), 0) AS denied, coalesce(sum(predicted), 0) AS predicted,
+                       coalesce(sum(probability_sum), 0) AS probability_sum
+                FROM case_stats {where} {group}
+            """, params).fetchall()
+
+        stats = []
+        for row in rows:
+            decided = row['approved'] + row['denied']
+            entry = {
+                'cases': row['cases'],
+                'approved': row['approved'],
+                'denied': row['denied'],
+                'pending': row['cases'] - decided,
+                'approval_rate': round(row['approved'] / decided, 4) if decided else None,
+                'predicted': row['predicted'],
+                'mean_predicted_probability': (
+                    round(row['probability_sum'] / row['predicted'], 4) if row['predicted'] else None
+                )
+            }
+            if by is not None:
+                if not row['cases']:
+                    continue
+                value = row['key']
+                if by == 'weekday':
+                    value = WEEKDAYS[value] if value >= 0 else None
+                elif by == 'day':
+                    # Undated cases aggregate under an empty day
+                    value = value or None
+                entry = {by: value, **entry}
+            stats.append(entry)
+        return stats if by is not None else stats[0]
+
+    def denial_stats(self, start_day=None, end_day=None, payer=None, procedure_category=None, limit=10):
+        """Most frequent denial reasons with their share of all recorded denial reasons"""
+        where, params = self._stats_filter(start_day, end_day, payer, procedure_category)
+        with self.lock:
+            rows = self.conn.execute(f"""
+                SELECT denial_reason, sum(cases) AS cases FROM denial_stats {where}
+                GROUP BY denial_reason HAVING sum(cases) > 0 ORDER BY cases DESC, denial_reason
+            """, params).fetchall()
+        total = sum(row['cases'] for row in rows)
+        return [
+            {'denial_reason': row['denial_reason'], 'cases': row['cases'], 'share': round(row['cases'] / total, 4)}
+            for row in rows[:limit]
+        ]
+
+    def dashboard(self, **filters):
+        """Everything the Dashboard screen shows, from the aggregates only"""
+        return {
+            'summary': self.approval_stats(**filters),
+            'by_payer': self.approval_stats('payer', **filters),
+            'by_procedure_category': self.approval_stats('procedure_category', **filters),
+            'by_weekday': self.approval_stats('weekday', **filters),
+            'top_denial_reasons': self.denial_stats(**filters)
+        }
+
+    def _to_dict(self, row, include_data=True):
+        record = dict(row)
+        data = record.pop('data_json')
+        if include_data:
+            record['data'] = json.loads(data) if data else None
+        return record
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', type=str, default='cases.db', help='Case store path')
+    parser.add_argument('--import', dest='import_path', type=str, default=None,
+                        help='CSV of cases to bulk import')
+    parser.add_argument('--benchmark', action='store_true', help='Time representative list queries')
+    args = parser.parse_args()
+
+    store = CaseStore(args.db)
+
+    if args.import_path:
+        start = time.perf_counter()
+        total = store.import_csv(args.import_path)
+        print(f"Imported {total} cases in {time.perf_counter() - start:.1f}s")
+
+    if args.benchmark:
+        count = store.conn.execute("SELECT COUNT(*) FROM cases").fetchone()[0]
+        print(f"\nList query latency over {count} cases:")
+        queries = {
+            'first page': {},
+            'payer': {'payer': 'UnitedHealth'},
+            'procedure_code': {'procedure_code': '72148'},
+            'status': {'status': 'denied'},
+            'payer + status': {'payer': 'Anthem', 'status': 'approved'}
+        }
+        for name, filters in queries.items():
+            page = store.list_cases(limit=50, **filters)
+            start = time.perf_counter()
+            for _ in range(20):
+                page = store.list_cases(limit=50, cursor=page['next_cursor'], **filters)
+                if page['next_cursor'] is None:
+                    break
+            print(f"  {name:20} {(time.perf_counter() - start) / 20 * 1000:6.2f} ms/page")
+        
+        groups = store.conn.execute("SELECT COUNT(*) FROM case_stats").fetchone()[0]
+        start = time.perf_counter()
+        for _ in range(20):
+            store.dashboard()
+        print(f"\nDashboard from {groups} aggregate rows: {(time.perf_counter() - start) / 20 * 1000:6.2f} ms")
+        # The same numbers by rescanning cases, as before the aggregates existed
+        start = time.perf_counter()
+        for column in ('payer', 'procedure_category', 'submission_weekday'):
+            store.conn.execute(
+                f"SELECT {column}, count(*), sum(status = 'approved'), sum(status = 'denied'), "
+                f"count(approval_probability), sum(approval_probability) FROM cases GROUP BY 1"
+            ).fetchall()
+        store.conn.execute("SELECT denial_reason, count(*) FROM cases GROUP BY 1").fetchall()
+        print(f"Dashboard by rescanning {count} cases: {(time.perf_counter() - start) * 1000:6.2f} ms")
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
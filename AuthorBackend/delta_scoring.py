@@ -0,0 +1,189 @@
+"""
+Incremental re-scoring for live form-editing sessions.
+
+`TreeIndex` flattens a LightGBM booster (from dump_model) into node arrays
+and records which trees and split nodes use each feature. A session keeps
+every node's split decision and the leaf value every tree produced for the
+current form. When fields change, only split nodes on changed features are
+re-compared and only trees that split on them are walked again (together,
+in one vectorized pass); every other tree's cached output is reused. The
+sum of leaf values is the booster's raw score, so results match
+Booster.predict.
+
+`ScoringSessions` is the bounded, expiring store of those per-session caches.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+ZERO_THRESHOLD = 1e-35
+
+
+class UnsupportedModel(ValueError):
+    pass
+
+
+class TreeIndex:
+    """Node arrays and per-feature tree lists for one booster"""
+
+    def __init__(self, booster, num_iteration=None):
+        dump = booster.dump_model(num_iteration=num_iteration)
+        self.num_class = dump.get('num_class', 1)
+        self.objective = dump.get('objective', '').split(' ')[0]
+        n_features = len(dump['feature_names'])
+
+        feature, threshold, default_left, missing, left, right, value = [], [], [], [], [], [], []
+        roots = []
+        max_depth = 0
+        feature_trees = [set() for _ in range(n_features)]
+
+        def add(node, tree_id, depth):
+            nonlocal max_depth
+            node_id = len(feature)
+            if 'leaf_value' in node or 'split_feature' not in node:
+                # Leaves point at themselves so a fixed number of steps is safe
+                max_depth = max(max_depth, depth)
+                feature.append(-1)
+                threshold.append(0.0)
+                default_left.append(False)
+                missing.append(MISSING_NONE)
+                left.append(node_id)
+                right.append(node_id)
+                value.append(node.get('leaf_value', 0.0))
+                return node_id
+            if node.get('decision_type', '<=') != '<=':
+                raise UnsupportedModel("Categorical splits are not supported for delta scoring")
+            feature.append(node['split_feature'])
+            threshold.append(float(node['threshold']))
+            default_left.append(bool(node.get('default_left', True)))
+            missing.append(MISSING_TYPES.get(node.get('missing_type', 'None'), MISSING_NONE))
+            left.append(-1)
+            right.append(-1)
+            value.append(0.0)
+            feature_trees[node['split_feature']].add(tree_id)
+            left[node_id] = add(node['left_child'], tree_id, depth + 1)
+            right[node_id] = add(node['right_child'], tree_id, depth + 1)
+            return node_id
+
+        for tree in dump['tree_info']:
+            roots.append(add(tree['tree_structure'], tree['tree_index'], 0))
+
+        feature = np.array(feature, dtype=np.int64)
+        self.split_nodes = np.flatnonzero(feature >= 0)
+        self.split_feature = feature[self.split_nodes]
+        self.threshold = np.array(threshold, dtype=np.float64)[self.split_nodes]
+        self.default_left = np.array(default_left, dtype=bool)[self.split_nodes]
+        self.missing = np.array(missing, dtype=np.int8)[self.split_nodes]
+        self.has_missing_rules = bool((self.missing != MISSING_NONE).any())
+        # child[node, True] is the left child, child[node, False] the right one
+        self.child = np.stack([np.array(right, dtype=np.int64), np.array(left, dtype=np.int64)], axis=1)
+        self.value = np.array(value, dtype=np.float64)
+        self.n_nodes = len(feature)
+        self.max_depth = max_depth
+        self.roots = np.array(roots, dtype=np.int64)
+        self.n_trees = len(roots)
+        self.tree_class = np.arange(self.n_trees) % self.num_class
+        self.feature_trees = [np.array(sorted(trees), dtype=np.int64) for trees in feature_trees]
+        # Positions in split_nodes whose decision depends on each feature
+        self.feature_splits = [np.flatnonzero(self.split_feature == f) for f in range(n_features)]
+
+    def decisions(self, x, splits=None, out=None):
+        """Go-left flag per node for one feature row (only `splits` positions if given)"""
+        if out is None:
+            out = np.zeros(self.n_nodes, dtype=bool)
+        splits = slice(None) if splits is None else splits
+        nodes = self.split_nodes[splits]
+        values = np.asarray(x, dtype=np.float64)[self.split_feature[splits]]
+        go_left = values <= self.threshold[splits]
+        if self.has_missing_rules or np.isnan(values).any():
+            # Same rules as LightGBM's NumericalDecision
+            missing = self.missing[splits]
+            is_nan = np.isnan(values)
+            values = np.where(is_nan & (missing != MISSING_NAN), 0.0, values)
+            use_default = (
+                ((missing == MISSING_ZERO) & (np.abs(values) <= ZERO_THRESHOLD)) |
+                ((missing == MISSING_NAN) & is_nan)
+            )
+            go_left = np.where(use_default, self.default_left[splits], values <= self.threshold[splits])
+        out[nodes] = go_left
+        return out
+
+    def leaf_values(self, go_left, trees=None):
+        """Leaf value reached in each of `trees` (default: all) given node decisions"""
+        nodes = self.roots if trees is None else self.roots[trees]
+        for _ in range(self.max_depth):
+            nodes = self.child[nodes, go_left[nodes].view(np.int8)]
+        return self.value[nodes]
+
+    def changed_splits(self, features):
+        """split_nodes positions whose decision can change with the given features"""
+        if len(features) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.feature_splits[f] for f in features])
+
+    def trees_using(self, features):
+        """Trees that split on any of the given feature indices"""
+        if len(features) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([self.feature_trees[f] for f in features]))
+
+    def output(self, tree_values):
+        """Booster.predict output (probabilities) from per-tree leaf values"""
+        raw = np.bincount(self.tree_class, weights=tree_values, minlength=self.num_class)
+        if self.objective == 'multiclass':
+            exp = np.exp(raw - raw.max())
+            return exp / exp.sum()
+        if self.objective in ('binary', 'cross_entropy'):
+            return 1.0 / (1.0 + np.exp(-raw[0]))
+        return raw[0]
+
+
+class ScoringSessions:
+    """Bounded LRU of per-session scoring state with idle expiry"""
+
+    def __init__(self, max_sessions=2000, ttl_seconds=1800):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def create(self, state):
+        session_id = uuid.uuid4().hex
+        self.put(session_id, state)
+        return session_id
+
+    def put(self, session_id, state):
+        state['touched'] = time.monotonic()
+        with self.lock:
+            self.sessions[session_id] = state
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+
+    def get(self, session_id):
+        with self.lock:
+            state = self.sessions.get(session_id)
+            if state is None:
+                return None
+            if time.monotonic() - state['touched'] > self.ttl_seconds:
+                del self.sessions[session_id]
+                self.evicted += 1
+                return None
+            self.sessions.move_to_end(session_id)
+            return state
+
+    def delete(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        with self.lock:
+            return {'active': len(self.sessions), 'evicted': self.evicted,
+                    'max_sessions': self.max_sessions, 'ttl_seconds': self.ttl_seconds}
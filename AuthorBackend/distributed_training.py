@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Distributed LightGBM training over several processes or hosts.
+
+The engineered training rows are split into one partition per worker
+(stratified, so every partition has both classes) and each worker runs
+`lgb.train` on its own partition with LightGBM's socket-based
+data-parallel or voting-parallel tree learner. All workers hold the same
+held-out rows, so they compute identical validation metrics and early
+stopping stops every worker at the same iteration. Rank 0 writes the
+model; `finalize` saves it through the same gate and artifact writer as
+train_advanced_model.py.
+
+On one machine (each worker count is a separate run on localhost ports;
+the last one is saved, and a time-vs-workers table is written to
+models/distributed_scaling.json):
+
+    python distributed_training.py local --workers 1 2 4 --tree-learner data
+
+Across hosts (copy or share the partition directory):
+
+    python distributed_training.py prepare --workers 2 --partition-dir parts
+    python distributed_training.py worker --partition-dir parts --rank 0 --machines 10.0.0.1:12400,10.0.0.2:12400
+    python distributed_training.py worker --partition-dir parts --rank 1 --machines 10.0.0.1:12400,10.0.0.2:12400
+    python distributed_training.py finalize --partition-dir parts
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import lightgbm as lgb
+import numpy as np
+
+HERE = os.path.abspath(__file__)
+META_FILE = 'meta.json'
+MODEL_FILE = 'model.txt'
+SCALING_REPORT_PATH = 'models/distributed_scaling.json'
+
+
+def partition_path(directory, name):
+    return os.path.join(directory, f'{name}.npy')
+
+
+def prepare_partitions(data_path, workers, directory, tree_learner='data', top_k=20, num_boost_round=500):
+    """Engineer features once, then write one training partition per worker plus the shared holdout"""
+    from sklearn.model_selection import StratifiedKFold, train_test_split
+    from train_advanced_model import MODEL_PARAMS, load_training_data, prepare_model_data
+
+    df, feature_cols, _ = prepare_model_data(load_training_data(data_path))
+    y = df['approved'].to_numpy()
+    # Same split as train_advanced_model so test AUCs are comparable
+    train_idx, test_idx = train_test_split(np.arange(len(df)), test_size=0.2, random_state=42, stratify=y)
+    X = df[feature_cols].to_numpy(dtype=np.float64)
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(partition_path(directory, 'X_valid'), X[test_idx])
+    np.save(partition_path(directory, 'y_valid'), y[test_idx])
+    if workers == 1:
+        parts = [train_idx]
+    else:
+        folds = StratifiedKFold(n_splits=workers, shuffle=True, random_state=42)
+        parts = [train_idx[fold] for _, fold in folds.split(train_idx, y[train_idx])]
+    for rank, rows in enumerate(parts):
+        np.save(partition_path(directory, f'X_{rank}'), X[rows])
+        np.save(partition_path(directory, f'y_{rank}'), y[rows])
+
+    meta = {
+        'data': os.path.abspath(data_path),
+        'workers': workers,
+        'tree_learner': tree_learner,
+        'top_k': top_k,
+        'num_boost_round': num_boost_round,
+        'params': MODEL_PARAMS,
+        'feature_cols': feature_cols,
+        'rows': {'train': len(train_idx), 'valid': len(test_idx), 'partitions': [len(rows) for rows in parts]}
+    }
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    print(f"{len(train_idx)} training rows in {workers} partitions, {len(test_idx)} holdout rows -> {directory}/")
+    return meta
+
+
+def worker_params(meta, rank, machines, threads):
+    params = {k: v for k, v in meta['params'].items() if k != 'n_jobs'}
+    params['num_threads'] = threads
+    if len(machines) > 1:
+        params.update({
+            'tree_learner': meta['tree_learner'],
+            'machines': ','.join(machines),
+            'num_machines': len(machines),
+            'local_listen_port': int(machines[rank].rsplit(':', 1)[1]),
+            'pre_partition': True,
+            'time_out': 10
+        })
+        if meta['tree_learner'] == 'voting':
+            params['top_k'] = meta['top_k']
+    return params
+
+
+def run_worker(directory, rank, machines, threads=0):
+    """Train on one partition; rank 0 writes the model. Returns this worker's timings"""
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    if len(machines) != meta['workers']:
+        raise SystemExit(f"{len(machines)} machines given for {meta['workers']} partitions")
+
+    start = time.perf_counter()
+    X = np.load(partition_path(directory, f'X_{rank}'))
+    y = np.load(partition_path(directory, f'y_{rank}'))
+    X_valid = np.load(partition_path(directory, 'X_valid'))
+    y_valid = np.load(partition_path(directory, 'y_valid'))
+    train_data = lgb.Dataset(X, label=y, feature_name=meta['feature_cols'])
+    valid_data = lgb.Dataset(X_valid, label=y_valid, reference=train_data)
+    loaded = time.perf_counter()
+
+    model = lgb.train(
+        worker_params(meta, rank, machines, threads),
+        train_data,
+        valid_sets=[valid_data],
+        num_boost_round=meta['num_boost_round'],
+        callbacks=[lgb.early_stopping(50, verbose=False)]
+    )
+    trained = time.perf_counter()
+    if len(machines) > 1:
+        model.free_network()
+
+    result = {
+        'rank': rank,
+        'rows': len(X),
+        'load_seconds': round(loaded - start, 3),
+        'train_seconds': round(trained - loaded, 3),
+        'best_iteration': model.best_iteration,
+        'trees': model.num_trees()
+    }
+    if rank == 0:
+        # Only the trees up to best_iteration are kept, as they are all that is served
+        model.save_model(os.path.join(directory, MODEL_FILE), num_iteration=model.best_iteration or None)
+    with open(os.path.join(directory, f'worker_{rank}.json'), 'w') as f:
+        json.dump(result, f)
+    print(f"  worker {rank}: {len(X)} rows, {result['train_seconds']:.2f}s training, "
+          f"best iteration {model.best_iteration}")
+    return result
+
+
+def free_ports(count):
+    """Ports the OS reports free right now (a previous run's may still be in TIME_WAIT)"""
+    sockets = [socket.socket() for _ in range(count)]
+    try:
+        for sock in sockets:
+            sock.bind(('127.0.0.1', 0))
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def launch_local(directory, workers, base_port=None, threads_per_worker=None, timeout=1800):
+    """Run every rank as a local process on localhost ports; returns the run's timings"""
+    ports = [base_port + rank for rank in range(workers)] if base_port else free_ports(workers)
+    machines = [f'127.0.0.1:{port}' for port in ports]
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    threads = threads_per_worker or max(1, cpus // workers)
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads))
+
+    start = time.perf_counter()
+    logs = [open(os.path.join(directory, f'worker_{rank}.log'), 'w') for rank in range(workers)]
+    processes = [
+        subprocess.Popen(
+            [sys.executable, HERE, 'worker', '--partition-dir', directory, '--rank', str(rank),
+             '--machines', ','.join(machines), '--threads', str(threads)],
+            env=env, stdout=logs[rank], stderr=subprocess.STDOUT
+        )
+        for rank in range(workers)
+    ]
+    failed = []
+    try:
+        while any(process.poll() is None for process in processes):
+            # One failed rank leaves the others waiting on the network, so stop them all
+            failed = [rank for rank, process in enumerate(processes) if process.poll() not in (None, 0)]
+            if failed or time.perf_counter() - start > timeout:
+                break
+            time.sleep(0.05)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        for log in logs:
+            log.close()
+    elapsed = time.perf_counter() - start
+
+    failed = failed or [rank for rank, process in enumerate(processes) if process.returncode != 0]
+    if failed:
+        with open(os.path.join(directory, f'worker_{failed[0]}.log')) as f:
+            raise RuntimeError(f"Worker(s) {failed} failed:\n{f.read()[-2000:]}")
+    for rank in range(workers):
+        with open(os.path.join(directory, f'worker_{rank}.log')) as f:
+            print(f.read().rstrip())
+
+    results = []
+    for rank in range(workers):
+        with open(os.path.join(directory, f'worker_{rank}.json')) as f:
+            results.append(json.load(f))
+    return {
+        'workers': workers,
+        'threads_per_worker': threads,
+        'wall_seconds': round(elapsed, 3),
+        'train_seconds': max(r['train_seconds'] for r in results),
+        'best_iteration': results[0]['best_iteration'],
+        'rows_per_worker': [r['rows'] for r in results]
+    }
+
+
+def finalize(directory, on_regression='stage', gate_budgets=None, run_info=None):
+    """Save rank 0's model like a full training run (denial model, gate, drift reference, config)"""
+    import pandas as pd
+    from drift_monitor import build_drift_reference, save_drift_reference
+    from similar_cases import SimilarCaseIndex
+    from sklearn.model_selection import train_test_split
+    from train_advanced_model import (
+        CATEGORICAL_COLUMNS, TRAINING_REPORT_FILE, RunReport, gate_target, load_deployed_artifacts,
+        load_training_data, performance_gate, prepare_model_data, save_model_artifacts,
+        train_denial_reason_model
+    )
+
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    report = RunReport('distributed', data=meta['data'], workers=meta['workers'], tree_learner=meta['tree_learner'])
+    with report.stage('features'):
+        df, feature_cols, label_encoders = prepare_model_data(load_training_data(meta['data']))
+    if feature_cols != meta['feature_cols']:
+        raise SystemExit(f"{meta['data']} no longer produces the partitioned feature set; prepare again")
+    model = lgb.Booster(model_file=os.path.join(directory, MODEL_FILE))
+    # The file holds exactly the trees up to the workers' best iteration
+    model.best_iteration = model.current_iteration()
+
+    importance_df = pd.DataFrame({
+        'feature': feature_cols,
+        'importance': model.feature_importance(importance_type='gain')
+    }).sort_values('importance', ascending=False)
+    with report.stage('denial model'):
+        denial_model, denial_reasons = train_denial_reason_model(df, feature_cols)
+
+    test_idx = train_test_split(np.arange(len(df)), test_size=0.2, random_state=42, stratify=df['approved'])[1]
+    with report.stage('performance gate', rows=len(test_idx)):
+        gate = performance_gate(model, feature_cols, df.iloc[test_idx], load_deployed_artifacts(),
+                                **(gate_budgets or {}))
+    target = gate_target(gate, on_regression)
+    report.meta['performance_gate'] = {'passed': gate['passed'], 'action': gate['action']}
+    if target is None:
+        report.save(None)
+        return gate
+
+    distributed = {'workers': meta['workers'], 'tree_learner': meta['tree_learner'], **(run_info or {})}
+    with report.stage('save'):
+        save_model_artifacts(
+            model, label_encoders, feature_cols, importance_df,
+            extra_config={'training_report': TRAINING_REPORT_FILE, 'performance_gate': gate,
+                          'distributed_training': distributed},
+            denial_model=denial_model, denial_reasons=denial_reasons, directory=target
+        )
+    with report.stage('drift reference', rows=len(df)):
+        save_drift_reference(build_drift_reference(df, feature_cols, CATEGORICAL_COLUMNS),
+                             path=os.path.join(target, 'drift_reference.json'))
+    with report.stage('similar cases', rows=int(df['approved'].sum())):
+        SimilarCaseIndex.build(df, importance_df).save(os.path.join(target, 'similar_cases'))
+    report.save(target)
+    return gate
+
+
+def test_auc(directory):
+    from sklearn.metrics import roc_auc_score
+
+    model = lgb.Booster(model_file=os.path.join(directory, MODEL_FILE))
+    X_valid = np.load(partition_path(directory, 'X_valid'))
+    return float(roc_auc_score(np.load(partition_path(directory, 'y_valid')), model.predict(X_valid)))
+
+
+def run_scaling(args):
+    """Train once per worker count on localhost, print time vs. workers, save the last model"""
+    print("="*60)
+    print(f"DISTRIBUTED TRAINING ({args.tree_learner}-parallel, localhost)")
+    print("="*60)
+
+    runs = []
+    base = args.partition_dir or tempfile.mkdtemp(prefix='lgb_parts_')
+    for workers in args.workers:
+        directory = os.path.join(base, f'{workers}_workers')
+        print(f"\n{workers} worker(s):")
+        prepare_partitions(args.data, workers, directory, args.tree_learner, args.top_k, args.rounds)
+        run = launch_local(directory, workers, args.base_port, args.threads_per_worker)
+        run['test_auc'] = round(test_auc(directory), 4)
+        runs.append(run)
+
+    baseline = runs[0]
+    for run in runs:
+        run['speedup'] = round(baseline['train_seconds'] / run['train_seconds'], 2) if run['train_seconds'] else None
+        run['efficiency'] = round(run['speedup'] * baseline['workers'] / run['workers'], 2) if run['speedup'] else None
+
+    print("\n" + "="*60)
+    print("SCALING")
+    print("="*60)
+    print(f"  {'workers':>7} {'threads':>7} {'wall s':>8} {'train s':>8} {'speedup':>8} {'effic.':>7} "
+          f"{'iters':>6} {'test AUC':>9}")
+    for run in runs:
+        print(f"  {run['workers']:>7} {run['threads_per_worker']:>7} {run['wall_seconds']:>8.2f} "
+              f"{run['train_seconds']:>8.2f} {run['speedup']:>7.2f}x {run['efficiency']:>7.2f} "
+              f"{run['best_iteration']:>6} {run['test_auc']:>9.4f}")
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    scaling = {
+        'tree_learner': args.tree_learner,
+        'data': os.path.abspath(args.data),
+        'cpus': cpus,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': runs
+    }
+    os.makedirs(os.path.dirname(SCALING_REPORT_PATH), exist_ok=True)
+    with open(SCALING_REPORT_PATH, 'w') as f:
+        json.dump(scaling, f, indent=2)
+    print(f"\nScaling report saved to {SCALING_REPORT_PATH}")
+
+    if not args.no_save:
+        gate = finalize(directory, args.on_regression, gate_budgets(args), run_info=runs[-1])
+        if gate['action'] == 'refused':
+            sys.exit(1)
+
+
+def gate_budgets(args):
+    return {
+        'max_latency_increase': args.max_latency_increase,
+        'max_size_increase': args.max_size_increase,
+        'max_auc_drop': args.max_auc_drop
+    }
+
+
+def add_gate_arguments(parser):
+    parser.add_argument('--on-regression', choices=['stage', 'refuse', 'force'], default='stage')
+    parser.add_argument('--max-latency-increase', type=float, default=0.25)
+    parser.add_argument('--max-size-increase', type=float, default=0.5)
+    parser.add_argument('--max-auc-drop', type=float, default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    local = commands.add_parser('local', help='Train with 1..N local worker processes and report scaling')
+    local.add_argument('--data', default='training_data_v2.csv', help='Training CSV path')
+    local.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Worker counts to run, in order')
+    local.add_argument('--tree-learner', choices=['data', 'voting'], default='data')
+    local.add_argument('--top-k', type=int, default=20, help='Features each worker votes for (voting-parallel)')
+    local.add_argument('--rounds', type=int, default=500, help='Maximum boosting rounds')
+    local.add_argument('--base-port', type=int, default=None,
+                       help='Rank r listens on base-port + r (default: free ports)')
+    local.add_argument('--threads-per-worker', type=int, default=None,
+                       help='LightGBM threads per worker (default: CPUs / workers)')
+    local.add_argument('--partition-dir', default=None, help='Keep partitions here instead of a temp dir')
+    local.add_argument('--no-save', action='store_true', help='Only report scaling; do not save artifacts')
+    add_gate_arguments(local)
+
+    prepare = commands.add_parser('prepare', help='Write per-worker partitions for a multi-host run')
+    prepare.add_argument('--data', default='training_data_v2.csv', help='Training CSV path')
+    prepare.add_argument('--workers', type=int, required=True)
+    prepare.add_argument('--partition-dir', required=True)
+    prepare.add_argument('--tree-learner', choices=['data', 'voting'], default='data')
+    prepare.add_argument('--top-k', type=int, default=20)
+    prepare.add_argument('--rounds', type=int, default=500)
+
+    worker = commands.add_parser('worker', help='Train one rank (run on every host)')
+    worker.add_argument('--partition-dir', required=True)
+    worker.add_argument('--rank', type=int, required=True)
+    worker.add_argument('--machines', required=True, help='host:port for every rank, in rank order')
+    worker.add_argument('--threads', type=int, default=0, help='LightGBM threads (0: OpenMP default)')
+
+    final = commands.add_parser('finalize', help="Save rank 0's model as the standard artifacts")
+    final.add_argument('--partition-dir', required=True)
+    add_gate_arguments(final)
+
+    args = parser.parse_args()
+    if args.command == 'local':
+        run_scaling(args)
+    elif args.command == 'prepare':
+        prepare_partitions(args.data, args.workers, args.partition_dir, args.tree_learner, args.top_k, args.rounds)
+    elif args.command == 'worker':
+        run_worker(args.partition_dir, args.rank, args.machines.split(','), args.threads)
+    elif args.command == 'finalize':
+        gate = finalize(args.partition_dir, args.on_regression, gate_budgets(args))
+        if gate['action'] == 'refused':
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
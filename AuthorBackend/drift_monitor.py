@@ -0,0 +1,212 @@
+"""
+Streaming input drift monitoring for the prediction API.
+
+At training time `build_drift_reference` stores fixed histogram bin edges and
+category frequencies for the model inputs the API computes from a request;
+inputs it fills with 0 (letter_word_count, pain_initial, ...) would only
+ever report drift against training. At serving time `DriftMonitor`
+keeps one count array per feature (constant memory, no per-request history)
+and compares the live distribution to the reference with PSI and KL scores.
+"""
+import json
+import threading
+from collections import Counter
+
+import numpy as np
+
+MAX_TRACKED_UNSEEN = 50
+EPSILON = 1e-4
+
+# Numeric inputs api_v2 sets from request fields (REQUEST_FEATURES) or derives from them.
+# documentation_quality_score is left out: training averages six letter flags while
+# serving averages the four DOCUMENTATION_FIELDS booleans, so the two never line up
+REQUEST_NUMERIC_FEATURES = frozenset([
+    'patient_age', 'diagnosis_months', 'pt_weeks_completed', 'pain_current', 'has_neurological_symptoms',
+    'uses_failed_conservative', 'uses_medical_necessity', 'total_treatments_tried',
+])
+
+
+def build_drift_reference(df, feature_cols, categorical_columns, n_bins=10):
+    """Summarize the training distribution of each model input"""
+    reference = {'rows': int(len(df)), 'numeric': {}, 'categorical': {}}
+
+    for col in feature_cols:
+        if col not in REQUEST_NUMERIC_FEATURES or col not in df.columns:
+            continue
+        values = df[col].to_numpy(dtype=float)
+        quantiles = np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1])
+        edges = np.unique(quantiles)
+        counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        reference['numeric'][col] = {
+            'edges': edges.tolist(),
+            'proportions': (counts / counts.sum()).tolist()
+        }
+
+    for col in categorical_columns:
+        if f'{col}_encoded' not in feature_cols or col not in df.columns:
+            continue
+        # Counting before str() keeps categorical columns from expanding per row
+        freq = df[col].value_counts(normalize=True, dropna=False)
+        freq = freq[freq > 0]
+        reference['categorical'][col] = {
+            'categories': [str(value) for value in freq.index],
+            'proportions': freq.tolist()
+        }
+
+    return reference
+
+
+def save_drift_reference(reference, path='models/drift_reference.json'):
+    with open(path, 'w') as f:
+        json.dump(reference, f)
+
+
+def psi(expected, actual):
+    """Population stability index between two proportion vectors"""
+    expected = np.clip(expected, EPSILON, None)
+    actual = np.clip(actual, EPSILON, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def kl_divergence(expected, actual):
+    """KL(actual || expected) with the same smoothing as `psi`"""
+    expected = np.clip(expected, EPSILON, None)
+    actual = np.clip(actual, EPSILON, None)
+    return float(np.sum(actual * np.log(actual / expected)))
+
+
+def drift_status(score):
+    # Conventional PSI reading: <0.1 stable, 0.1-0.25 moderate, >0.25 major
+    if score < 0.1:
+        return 'stable'
+    if score < 0.25:
+        return 'moderate'
+    return 'major'
+
+
+class DriftMonitor:
+    """Bounded-memory live histograms compared against a training reference"""
+
+    def __init__(self, reference, feature_cols):
+        self.reference = reference
+        self.lock = threading.Lock()
+
+        # Numeric features: one padded edge matrix so a whole request row is
+        # binned with a single vectorized comparison
+        # References saved before REQUEST_NUMERIC_FEATURES existed summarize every input
+        self.numeric_names = [c for c in feature_cols
+                              if c in reference['numeric'] and c in REQUEST_NUMERIC_FEATURES]
+        self.numeric_index = np.array([feature_cols.index(c) for c in self.numeric_names], dtype=int)
+        max_edges = max((len(reference['numeric'][c]['edges']) for c in self.numeric_names), default=0)
+        self.edge_matrix = np.full((len(self.numeric_names), max_edges), np.inf)
+        for i, col in enumerate(self.numeric_names):
+            edges = reference['numeric'][col]['edges']
+            self.edge_matrix[i, :len(edges)] = edges
+        self.numeric_counts = np.zeros((len(self.numeric_names), max_edges + 1), dtype=np.int64)
+
+        # Categorical features: reference categories plus one unknown slot
+        self.category_slots = {
+            col: {cat: i for i, cat in enumerate(spec['categories'])}
+            for col, spec in reference['categorical'].items()
+        }
+        self.category_counts = {
+            col: np.zeros(len(slots) + 1, dtype=np.int64)
+            for col, slots in self.category_slots.items()
+        }
+        self.unseen_values = {col: {} for col in self.category_slots}
+        self.observations = 0
+
+    @classmethod
+    def from_file(cls, path, feature_cols):
+        with open(path) as f:
+            return cls(json.load(f), feature_cols)
+
+    def observe(self, feature_row, categories):
+        """Record one request: its model feature vector and raw category values"""
+        self.observe_many(np.asarray(feature_row, dtype=float).reshape(1, -1), [categories])
+
+    def observe_many(self, feature_matrix, categories_list):
+        """Record a batch of requests with one vectorized binning pass"""
+        columns = {col: [categories[col] for categories in categories_list] for col in (categories_list[0] if categories_list else ())}
+        self.observe_columns(feature_matrix, columns)
+
+    def observe_columns(self, feature_matrix, category_columns):
+        """Like observe_many, with raw categorical values given as {column: values}"""
+        rows = np.asarray(feature_matrix, dtype=float)[:, self.numeric_index]
+        bins = (rows[:, :, None] >= self.edge_matrix[None, :, :]).sum(axis=2)
+        feature_ids = np.broadcast_to(np.arange(bins.shape[1]), bins.shape)
+
+        # Tally outside the lock, then apply each distinct value once
+        value_counts = {
+            col: Counter(map(str, values)).items()
+            for col, values in category_columns.items() if col in self.category_slots
+        }
+
+        with self.lock:
+            np.add.at(self.numeric_counts, (feature_ids.ravel(), bins.ravel()), 1)
+            for col, counts in value_counts.items():
+                slots = self.category_slots[col]
+                for value, count in counts:
+                    slot = slots.get(value)
+                    if slot is None:
+                        self.category_counts[col][-1] += count
+                        unseen = self.unseen_values[col]
+                        if value in unseen or len(unseen) < MAX_TRACKED_UNSEEN:
+                            unseen[value] = unseen.get(value, 0) + count
+                    else:
+                        self.category_counts[col][slot] += count
+            self.observations += len(rows)
+
+    def reset(self):
+        with self.lock:
+            self.numeric_counts[:] = 0
+            for counts in self.category_counts.values():
+                counts[:] = 0
+            for unseen in self.unseen_values.values():
+                unseen.clear()
+            self.observations = 0
+
+    def report(self):
+        """PSI/KL per feature, worst first"""
+        with self.lock:
+            numeric_counts = self.numeric_counts.copy()
+            category_counts = {col: c.copy() for col, c in self.category_counts.items()}
+            unseen_values = {col: dict(v) for col, v in self.unseen_values.items()}
+            observations = self.observations
+
+        features = []
+        if observations:
+            for i, col in enumerate(self.numeric_names):
+                expected = np.asarray(self.reference['numeric'][col]['proportions'])
+                actual = numeric_counts[i, :len(expected)] / observations
+                features.append({
+                    'feature': col,
+                    'type': 'numeric',
+                    'psi': psi(expected, actual),
+                    'kl': kl_divergence(expected, actual)
+                })
+
+            for col, counts in category_counts.items():
+                # Requests only carry some categoricals; skip the ones never seen
+                if not counts.sum():
+                    continue
+                expected = np.append(self.reference['categorical'][col]['proportions'], 0.0)
+                actual = counts / counts.sum()
+                features.append({
+                    'feature': col,
+                    'type': 'categorical',
+                    'psi': psi(expected, actual),
+                    'kl': kl_divergence(expected, actual),
+                    'unknown_share': float(actual[-1]),
+                    'unknown_values': unseen_values[col]
+                })
+
+        for item in features:
+            item['status'] = drift_status(item['psi'])
+        features.sort(key=lambda item: item['psi'], reverse=True)
+
+        return {
+            'observations': observations,
+            'reference_rows': self.reference['rows'],
+            'features': features
+        }
@@ -0,0 +1,811 @@
+#!/usr/bin/env python3
+"""
+Background jobs: retraining, dataset generation, case backfills and bulk scoring.
+
+Jobs are rows in a SQLite table (jobs.db, WAL mode). The API only inserts
+and reads rows, so submitting a retrain returns immediately and no heavy
+work ever runs on an API worker. The work runs in separate worker
+processes started by this module; each claims the oldest, highest-priority
+queued job in one IMMEDIATE transaction, so any number of workers (and API
+processes) can share the file. Jobs survive restarts: a job whose worker
+died is put back in the queue once, then marked failed.
+
+Concurrency is limited twice: by the number of workers, and per kind
+(--limit train=1 keeps two retrains from racing to write models/). Workers
+are sized from the CPUs this process may use (sched_getaffinity): by
+default they take the upper half, since run_smart_api.py --pin-cpus fills
+workers from the first CPU, and each worker is pinned to its own slice,
+runs at lower priority (nice) and gives LightGBM/OpenMP exactly that many
+threads, training subprocesses included.
+
+File parameters (training data, scoring input and output) are names
+relative to JOB_DATA_DIR; absolute paths and '..' are rejected, so a job
+submitted over HTTP can neither read nor overwrite anything outside it.
+Each worker leads its own process group, so killing a stuck worker also
+kills the training subprocess it started.
+
+Progress (0-1 plus a message) is written while a job runs, at most every
+PROGRESS_INTERVAL seconds. Cancelling a queued job removes it; a running
+job stops at its next progress update, and a subprocess job is terminated.
+
+    python job_queue.py run --workers 2
+    python job_queue.py submit train --param lean=true
+    python job_queue.py submit score_file --param input=cases.csv --param output=scores.ndjson  # in job_data/
+    python job_queue.py list
+    python job_queue.py cancel 12
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params_json TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    worker_pid INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    progress REAL,
+    message TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    result_json TEXT,
+    error TEXT,
+    log_path TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, priority DESC, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+"""
+
+STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+
+# Retrains and dataset writes replace files under models/ and the data CSVs
+DEFAULT_LIMITS = {'train': 1, 'generate_data': 1, 'backfill': 1}
+MAX_ATTEMPTS = 2
+PROGRESS_INTERVAL = 0.5
+POLL_INTERVAL = 1.0
+LOG_DIR = 'logs/jobs'
+JOB_DATA_DIR = os.environ.get('JOB_DATA_DIR', 'job_data')
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def now():
+    return datetime.utcnow().isoformat()
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def kill_group(pid):
+    """SIGKILL a worker's process group (the worker and any subprocess it started)"""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class DataPath(str):
+    """Job parameter type: a file name relative to JOB_DATA_DIR"""
+
+
+def data_path(name):
+    """Absolute path of a DataPath parameter; ValueError if it would leave JOB_DATA_DIR"""
+    parts = re.split(r'[\\/]', name)
+    if not name or os.path.isabs(name) or '..' in parts:
+        raise ValueError(f"'{name}' must be a relative path inside the job data directory")
+    root = os.path.realpath(JOB_DATA_DIR)
+    resolved = os.path.realpath(os.path.join(root, name))
+    # realpath also follows symlinks placed inside the directory
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"'{name}' resolves outside the job data directory")
+    return resolved
+
+
+def resolve_paths(options, params):
+    return {name: data_path(value) if options.get(name) is DataPath else value for name, value in params.items()}
+
+
+class JobQueue:
+    """The jobs table: submit/list/cancel for the API, claim/progress/finish for workers"""
+
+    def __init__(self, path='jobs.db'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def submit(self, kind, params=None, priority=0):
+        """Queue a job after checking its parameters; ValueError if the kind or a parameter is invalid"""
+        params = validate_params(kind, params or {})
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (kind, params_json, priority, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(params), int(priority), now())
+            )
+        return self.get(cursor.lastrowid)
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status=None, kind=None, limit=50):
+        """Newest jobs first, plus the number of jobs in each status"""
+        clauses, params = [], []
+        if status is not None:
+            if status not in STATUSES:
+                raise ValueError(f"status must be one of {list(STATUSES)}")
+            clauses.append("status = ?")
+            params.append(status)
+        if kind is not None:
+            clauses.append("kind = ?")
+            params.append(kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM jobs {where} ORDER BY id DESC LIMIT ?", params + [limit]
+            ).fetchall()
+            counts = dict(self.conn.execute("SELECT status, count(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            'counts': {status: counts.get(status, 0) for status in STATUSES},
+            'jobs': [self._to_dict(row) for row in rows]
+        }
+
+    def cancel(self, job_id):
+        """Cancel a queued job now, or ask a running one to stop; ValueError if it already finished"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, message = 'cancelled before start' "
+                "WHERE id = ? AND status = 'queued'", (now(), job_id)
+            )
+            self.conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        job = self.get(job_id)
+        if job is not None and job['status'] in ('succeeded', 'failed'):
+            raise ValueError(f"Job {job_id} already {job['status']}")
+        return job
+
+    def claim(self, pid, limits=None):
+        """Mark the next runnable job running for worker pid and return it (None if nothing is runnable)"""
+        limits = DEFAULT_LIMITS if limits is None else limits
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                running = dict(self.conn.execute(
+                    "SELECT kind, count(*) FROM jobs WHERE status = 'running' GROUP BY kind"
+                ).fetchall())
+                # Kinds at their limit are skipped, so a queued retrain does not hold up scoring
+                full = [kind for kind, limit in limits.items() if limit is not None and running.get(kind, 0) >= limit]
+                exclude = f"AND kind NOT IN ({','.join('?' * len(full))})" if full else ""
+                row = self.conn.execute(
+                    f"SELECT id FROM jobs WHERE status = 'queued' {exclude} ORDER BY priority DESC, id LIMIT 1", full
+                ).fetchone()
+                if row is not None:
+                    job_id = row['id']
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ?, worker_pid = ?, attempts = attempts + 1, "
+                        "progress = 0, message = NULL, log_path = ? WHERE id = ?",
+                        (now(), pid, os.path.join(LOG_DIR, f'{job_id}.log'), job_id)
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return self.get(row['id']) if row is not None else None
+
+    def update_progress(self, job_id, progress=None, message=None):
+        """Store progress; returns True if the job has been asked to cancel"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET progress = coalesce(?, progress), message = coalesce(?, message) WHERE id = ?",
+                (progress, message, job_id)
+            )
+            row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id, status, result=None, error=None, message=None):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result_json = ?, error = ?, "
+                "message = coalesce(?, message), progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END "
+                "WHERE id = ?",
+                (status, now(), json.dumps(result, default=str) if result is not None else None, error,
+                 message, status, job_id)
+            )
+
+    def recover(self):
+        """Requeue (or, after MAX_ATTEMPTS, fail) running jobs whose worker process is gone"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, worker_pid, attempts FROM jobs WHERE status = 'running'"
+            ).fetchall()
+        recovered = []
+        for row in rows:
+            if row['worker_pid'] and pid_alive(row['worker_pid']):
+                continue
+            if row['worker_pid']:
+                kill_group(row['worker_pid'])
+            with self.lock:
+                if row['attempts'] < MAX_ATTEMPTS:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'queued', worker_pid = NULL, message = 'requeued: worker exited' "
+                        "WHERE id = ? AND status = 'running' AND cancel_requested = 0", (row['id'],)
+                    )
+                self.conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'failed' END, "
+                    "finished_at = ?, error = 'worker exited while running the job' "
+                    "WHERE id = ? AND status = 'running'", (now(), row['id'])
+                )
+            recovered.append(row['id'])
+        return recovered
+
+    def _to_dict(self, row):
+        record = dict(row)
+        record['params'] = json.loads(record.pop('params_json'))
+        result = record.pop('result_json')
+        record['result'] = json.loads(result) if result else None
+        record['cancel_requested'] = bool(record['cancel_requested'])
+        return record
+
+
+class JobContext:
+    """What a running job sees: its parameters, its CPU budget and a progress callback"""
+
+    def __init__(self, queue, job, threads):
+        self.queue = queue
+        self.job = job
+        self.id = job['id']
+        self.params = job['params']
+        self.threads = threads
+        self.log_path = job['log_path']
+        self.last_update = 0.0
+        self.cancel_requested = False
+
+    def progress(self, fraction=None, message=None, force=False):
+        """Report progress (throttled); raises JobCancelled once a cancel was requested"""
+        if force or time.monotonic() - self.last_update >= PROGRESS_INTERVAL:
+            self.last_update = time.monotonic()
+            fraction = None if fraction is None else round(min(max(fraction, 0.0), 1.0), 4)
+            self.cancel_requested = self.queue.update_progress(self.id, fraction, message)
+        if self.cancel_requested:
+            raise JobCancelled()
+
+
+def run_command(ctx, argv, stages=None):
+    """Run a script in a subprocess, logging its output; progress counts top-level [stage] lines"""
+    os.makedirs(os.path.dirname(ctx.log_path), exist_ok=True)
+    env = {**os.environ, 'PYTHONUNBUFFERED': '1', 'OMP_NUM_THREADS': str(ctx.threads),
+           'LIGHTGBM_NUM_THREADS': str(ctx.threads)}
+    process = subprocess.Popen(
+        [sys.executable] + argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env
+    )
+    state = {'done': 0, 'last': ''}
+
+    def pump():
+        with open(ctx.log_path, 'a') as log:
+            for line in process.stdout:
+                log.write(line)
+                log.flush()
+                if line.strip():
+                    state['last'] = line.strip()[:200]
+                if stages and STAGE_LINE.match(line):
+                    state['done'] += 1
+
+    reader = threading.Thread(target=pump, name=f'job-{ctx.id}-output', daemon=True)
+    reader.start()
+    try:
+        while process.poll() is None:
+            time.sleep(PROGRESS_INTERVAL)
+            fraction = min(state['done'] / len(stages), 0.99) if stages else None
+            ctx.progress(fraction, state['last'] or None)
+    except JobCancelled:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        raise
+    finally:
+        reader.join(timeout=5)
+    if process.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(argv[0])} exited with status {process.returncode}: {state['last']}")
+    return {'exit_code': 0, 'last_output': state['last']}
+
+
+def script_args(options, params):
+    """argparse-style command line for the given parameters (booleans become bare flags)"""
+    args = []
+    for name in options:
+        if name not in params or params[name] is None or params[name] is False:
+            continue
+        flag = '--' + name.replace('_', '-')
+        args.extend([flag] if params[name] is True else [flag, str(params[name])])
+    return args
+
+
+# Top-level stages a full train_advanced_model.py run prints, in order
+STAGE_LINE = re.compile(r'^  \[stage\] \S')
+TRAIN_STAGES = ['load', 'features', 'train', 'insights', 'denial model', 'performance gate', 'save',
+                'drift reference', 'similar cases']
+INCREMENTAL_STAGES = ['load', 'train', 'performance gate', 'save']
+
+TRAIN_OPTIONS = {
+    'data': DataPath, 'incremental': DataPath, 'rounds': int, 'no_append': bool, 'lean': bool, 'distill': bool,
+    'max_auc_loss': float, 'shards': str, 'shard_min_rows': int, 'max_latency_increase': float,
+    'max_size_increase': float, 'max_auc_drop': float, 'on_regression': str, 'promote_staged': bool,
+}
+
+
+def run_train(ctx, params):
+    """train_advanced_model.py with the given options, in its own process"""
+    history = os.path.join('models', 'training_history.jsonl')
+    history_size = os.path.getsize(history) if os.path.exists(history) else 0
+    if params.get('promote_staged'):
+        stages = None
+    elif params.get('incremental'):
+        stages = INCREMENTAL_STAGES
+    else:
+        stages = TRAIN_STAGES + ['lean search'] * bool(params.get('lean')) + ['shards'] * bool(params.get('shards'))
+    result = run_command(ctx, [os.path.join(HERE, 'train_advanced_model.py')] + script_args(TRAIN_OPTIONS, params),
+                         stages)
+    # The run's report is the history line it appended
+    if os.path.exists(history) and os.path.getsize(history) > history_size:
+        with open(history) as f:
+            f.seek(history_size)
+            report = json.loads(f.readline())
+        result['report'] = {key: report.get(key) for key in ('mode', 'rows', 'total_wall_s', 'peak_rss_mb')}
+    # API workers serve the new model after a rolling restart (kill -HUP the run_smart_api.py
+    # parent, which reloads the artifacts before forking replacements)
+    return result
+
+
+GENERATE_OPTIONS = {'n': int, 'out': DataPath}
+
+
+def run_generate_data(ctx, params):
+    """generate_realistic_training_data.py in its own process"""
+    argv = [os.path.join(HERE, 'generate_realistic_training_data.py')] + script_args(GENERATE_OPTIONS, params)
+    return run_command(ctx, argv)
+
+
+_scoring = {'module': None, 'mtime': None}
+
+
+def scoring_api():
+    """api_v2 with the current model loaded in this worker (reloaded after a retrain replaces it)"""
+    import api_v2
+    mtime = os.path.getmtime(api_v2.MODEL_PATH) if os.path.exists(api_v2.MODEL_PATH) else None
+    if _scoring['module'] is not None and mtime != _scoring['mtime']:
+        api_v2.reload_artifacts()
+    else:
+        api_v2.load_artifacts()
+    _scoring.update(module=api_v2, mtime=mtime)
+    return api_v2
+
+
+BACKFILL_OPTIONS = {'batch_size': int}
+
+
+def run_backfill(ctx, params):
+    """Rescore every stored case with the current model and record the new probabilities"""
+    from pydantic import ValidationError
+    api = scoring_api()
+    store = api.case_store
+    batch_size = params.get('batch_size', 1000)
+    total = store.count_cases()
+    done = scored = skipped = 0
+    ctx.progress(0, f"0 / {total:,} cases", force=True)
+    for batch in store.case_data_batches(batch_size):
+        requests = []
+        for case_id, data in batch:
+            try:
+                requests.append(api.PriorAuthRequest.model_validate({**(data or {}), 'case_id': case_id}))
+            except ValidationError:
+                skipped += 1
+        if requests:
+            results = api.predict_batch(requests)
+            predicted_at = now()
+            store.record_predictions([
+                (request.case_id, result['approval_probability'], api.MODEL_VERSION, predicted_at)
+                for request, result in zip(requests, results)
+            ])
+            scored += len(requests)
+        done += len(batch)
+        ctx.progress(done / total if total else 1.0, f"{done:,} / {total:,} cases")
+    ctx.progress(1.0, f"{done:,} / {total:,} cases", force=True)
+    return {'cases': done, 'scored': scored, 'skipped_invalid': skipped, 'model_version': api.MODEL_VERSION}
+
+
+SCORE_FILE_OPTIONS = {'input': DataPath, 'output': DataPath, 'chunk_rows': int}
+
+
+def count_lines(path):
+    lines = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+    return lines
+
+
+def run_score_file(ctx, params):
+    """Score a CSV (one PriorAuthRequest field per column) or NDJSON file into NDJSON results.
+
+    Rows are read and scored chunk_rows at a time through the bulk scoring
+    path, so memory stays flat and every score is audited like /predict.
+    The output appears only when complete (written to a .tmp file first).
+    """
+    api = scoring_api()
+    source, target = params['input'], params['output']
+    chunk_rows = params.get('chunk_rows', 5000)
+    is_csv = source.lower().endswith('.csv')
+    total = max(count_lines(source) - is_csv, 0)
+    scored = invalid = 0
+    tmp = target + '.tmp'
+    try:
+        with open(tmp, 'w') as out:
+            for base, chunk in read_chunks(source, chunk_rows, is_csv):
+                if is_csv:
+                    result = api.predict_columns({col: chunk[col].to_numpy() for col in chunk.columns
+                                                  if col in api.REQUEST_SPECS})
+                    results, errors = result['results'], result['errors']
+                else:
+                    results, errors = score_json_lines(api, chunk)
+                for row in results:
+                    out.write(json.dumps({**row, 'index': base + row['index']}) + '\n')
+                for error in errors:
+                    out.write(json.dumps({'index': base + error['index'], 'error': error['error']}, default=str) + '\n')
+                scored += len(results)
+                invalid += len(errors)
+                ctx.progress((scored + invalid) / total if total else None, f"{scored + invalid:,} / {total:,} rows")
+        ctx.progress(1.0, f"{scored + invalid:,} / {total:,} rows", force=True)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {'rows': scored + invalid, 'scored': scored, 'invalid': invalid, 'output': target,
+            'model_version': api.MODEL_VERSION}
+
+
+def read_chunks(path, chunk_rows, is_csv):
+    """(index of first row, chunk) pairs: DataFrames for CSV, lists of lines for NDJSON"""
+    base = 0
+    if is_csv:
+        import pandas as pd
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype={'procedure_code': str}):
+            yield base, chunk.reset_index(drop=True)
+            base += len(chunk)
+        return
+    lines = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                lines.append(line)
+            if len(lines) >= chunk_rows:
+                yield base, lines
+                base += len(lines)
+                lines = []
+    if lines:
+        yield base, lines
+
+
+def score_json_lines(api, lines):
+    from pydantic import ValidationError
+    valid, errors = [], []
+    for i, line in enumerate(lines):
+        try:
+            valid.append((i, api.PriorAuthRequest.model_validate_json(line)))
+        except ValidationError as e:
+            errors.append({'index': i, 'error': e.errors(include_url=False)})
+    results = api.predict_batch([request for _, request in valid]) if valid else []
+    return [{'index': i, 'case_id': request.case_id, **result}
+            for (i, request), result in zip(valid, results)], errors
+
+
+# kind -> (runner, accepted parameters, required parameters)
+JOB_KINDS = {
+    'train': (run_train, TRAIN_OPTIONS, ()),
+    'generate_data': (run_generate_data, GENERATE_OPTIONS, ()),
+    'backfill': (run_backfill, BACKFILL_OPTIONS, ()),
+    'score_file': (run_score_file, SCORE_FILE_OPTIONS, ('input', 'output')),
+}
+
+
+def validate_params(kind, params):
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind '{kind}'; expected one of {sorted(JOB_KINDS)}")
+    _, options, required = JOB_KINDS[kind]
+    if not isinstance(params, dict):
+        raise ValueError("params must be an object")
+    unknown = sorted(set(params) - set(options))
+    if unknown:
+        raise ValueError(f"Unknown {kind} parameters {unknown}; accepted: {sorted(options)}")
+    missing = [name for name in required if params.get(name) is None]
+    if missing:
+        raise ValueError(f"{kind} requires parameters {missing}")
+    checked = {}
+    for name, value in params.items():
+        expected = options[name]
+        if value is None:
+            continue
+        if expected is DataPath:
+            if not isinstance(value, str):
+                raise ValueError(f"{kind} parameter '{name}' must be a file name")
+            data_path(value)
+            checked[name] = value
+            continue
+        # bool is an int subclass; only real booleans are accepted for flags and vice versa
+        valid = isinstance(value, expected) and (expected is bool or not isinstance(value, bool))
+        if expected is float and isinstance(value, int) and not isinstance(value, bool):
+            valid, value = True, float(value)
+        if not valid:
+            raise ValueError(f"{kind} parameter '{name}' must be {expected.__name__}")
+        checked[name] = value
+    return checked
+
+
+def execute(queue, job, threads):
+    """Run one claimed job to completion and record how it ended"""
+    ctx = JobContext(queue, job, threads)
+    started = time.perf_counter()
+    print(f"[jobs] pid {os.getpid()} running job {job['id']} ({job['kind']})", flush=True)
+    try:
+        run, options, _ = JOB_KINDS[job['kind']]
+        result = run(ctx, resolve_paths(options, job['params']))
+    except JobCancelled:
+        queue.finish(job['id'], 'cancelled', message='cancelled while running')
+        status = 'cancelled'
+    except Exception as e:
+        queue.finish(job['id'], 'failed', error=f"{type(e).__name__}: {e}",
+                     message=traceback.format_exc(limit=3).strip().splitlines()[-1])
+        status = 'failed'
+    else:
+        result['elapsed_s'] = round(time.perf_counter() - started, 3)
+        queue.finish(job['id'], 'succeeded', result=result)
+        status = 'succeeded'
+    print(f"[jobs] job {job['id']} {status} in {time.perf_counter() - started:.1f}s", flush=True)
+
+
+def run_worker(args, cpus, threads):
+    """Child process body: claim and run jobs until told to stop (the current job finishes first)"""
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    # Its own process group, which subprocesses inherit, so the runner can kill them together
+    os.setpgid(0, 0)
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    if args.nice:
+        os.nice(args.nice)
+    # Before anything loads LightGBM/OpenMP, in this process and its children
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['LIGHTGBM_NUM_THREADS'] = str(threads)
+
+    queue = JobQueue(args.db)
+    try:
+        while not stopping.is_set():
+            job = queue.claim(os.getpid(), args.limits)
+            if job is None:
+                stopping.wait(args.poll_interval)
+                continue
+            execute(queue, job, threads)
+    finally:
+        queue.close()
+        # Scoring jobs queue audit records; flush them before exiting
+        if _scoring['module'] is not None:
+            _scoring['module'].close_stores()
+
+
+class JobRunner:
+    """Parent process: forks the workers, respawns any that die and requeues their jobs"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workers = {}
+        self.shutting_down = False
+        cpus = available_cpus()
+        job_cpus = cpus[len(cpus) - args.cpus:] if args.cpus else cpus
+        size = max(1, len(job_cpus) // args.workers)
+        self.threads = size
+        self.cpu_sets = [job_cpus[(i * size) % len(job_cpus):][:size] or job_cpus[:1] for i in range(args.workers)]
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.args, self.cpu_sets[index], self.threads)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        # Also set here so the group exists before the child gets to run_worker
+        try:
+            os.setpgid(pid, pid)
+        except (PermissionError, ProcessLookupError):
+            pass
+        print(f"[jobs] worker {index} started (pid {pid}, CPUs {self.cpu_sets[index]})", flush=True)
+        return pid
+
+    def reap(self, queue):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            for index, worker_pid in list(self.workers.items()):
+                if worker_pid == pid and not self.shutting_down:
+                    print(f"[jobs] worker {index} (pid {pid}) exited with status {status}; respawning", flush=True)
+                    # A training subprocess outliving its worker would race the requeued job
+                    kill_group(pid)
+                    requeued = queue.recover()
+                    if requeued:
+                        print(f"[jobs] recovered jobs {requeued}", flush=True)
+                    time.sleep(1.0)
+                    self.workers[index] = self.spawn(index)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'shutting_down', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, 'shutting_down', True))
+        queue = JobQueue(self.args.db)
+        recovered = queue.recover()
+        if recovered:
+            print(f"[jobs] recovered jobs {recovered} left running by a previous run", flush=True)
+        print(f"[jobs] {self.args.workers} worker(s) x {self.threads} thread(s), limits {self.args.limits}",
+              flush=True)
+        for index in range(self.args.workers):
+            self.workers[index] = self.spawn(index)
+        while not self.shutting_down:
+            time.sleep(0.2)
+            self.reap(queue)
+
+        print("[jobs] shutting down; waiting for running jobs", flush=True)
+        for pid in self.workers.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout
+        remaining = set(self.workers.values())
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                        remaining.discard(pid)
+                except ChildProcessError:
+                    remaining.discard(pid)
+            time.sleep(0.2)
+        for pid in remaining:
+            print(f"[jobs] worker pid {pid} still busy after {self.args.graceful_timeout}s; killing", flush=True)
+            kill_group(pid)
+            os.waitpid(pid, 0)
+        # Killed jobs go back in the queue for the next start
+        queue.recover()
+        queue.close()
+
+
+def parse_limits(values):
+    limits = dict(DEFAULT_LIMITS)
+    for value in values or []:
+        kind, _, limit = value.partition('=')
+        if kind not in JOB_KINDS or not limit:
+            raise SystemExit(f"--limit expects KIND=N with KIND in {sorted(JOB_KINDS)}")
+        limits[kind] = None if limit == 'none' else int(limit)
+    return limits
+
+
+def parse_param(value):
+    name, _, raw = value.partition('=')
+    try:
+        return name, json.loads(raw)
+    except ValueError:
+        return name, raw
+
+
+def main():
+    cpus = len(available_cpus())
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=os.environ.get('JOB_DB_PATH', 'jobs.db'), help='Job database path')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Start worker processes')
+    run.add_argument('--cpus', type=int, default=max(1, cpus // 2),
+                     help='How many CPUs (the last ones available) the workers use; the rest are left to the API')
+    run.add_argument('--workers', type=int, default=None, help='Worker processes (default: 1 per 2 job CPUs, at least 1)')
+    run.add_argument('--limit', action='append', metavar='KIND=N',
+                     help=f'Running jobs allowed per kind (default {DEFAULT_LIMITS}; N may be "none")')
+    run.add_argument('--nice', type=int, default=10, help='Scheduling niceness added to workers')
+    run.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    run.add_argument('--graceful-timeout', type=float, default=60, help='Seconds running jobs get at shutdown')
+
+    submit = commands.add_parser('submit', help='Queue a job')
+    submit.add_argument('kind', choices=sorted(JOB_KINDS))
+    submit.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                        help='Job parameter (VALUE is parsed as JSON when possible)')
+    submit.add_argument('--priority', type=int, default=0)
+
+    listing = commands.add_parser('list', help='Recent jobs')
+    listing.add_argument('--status', choices=STATUSES, default=None)
+    listing.add_argument('--limit', type=int, default=20)
+
+    for name in ('status', 'cancel'):
+        command = commands.add_parser(name, help=f'{name.capitalize()} one job')
+        command.add_argument('job_id', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        args.cpus = max(1, min(args.cpus, cpus))
+        if args.workers is None:
+            args.workers = max(1, args.cpus // 2)
+        args.limits = parse_limits(args.limit)
+        JobRunner(args).run()
+        return
+
+    queue = JobQueue(args.db)
+    try:
+        if args.command == 'submit':
+            try:
+                job = queue.submit(args.kind, dict(map(parse_param, args.param)), args.priority)
+            except ValueError as e:
+                raise SystemExit(str(e))
+            print(json.dumps(job, indent=2))
+        elif args.command == 'list':
+            listing = queue.list(status=args.status, limit=args.limit)
+            print('  '.join(f"{status} {count}" for status, count in listing['counts'].items()))
+            for job in listing['jobs']:
+                progress = '' if job['progress'] is None else f"{job['progress']:.0%}"
+                print(f"{job['id']:>6}  {job['kind']:<14} {job['status']:<10} {progress:>5}  {job['message'] or ''}")
+        elif args.command == 'status':
+            job = queue.get(args.job_id)
+            print(json.dumps(job, indent=2) if job else f"Job {args.job_id} not found")
+        elif args.command == 'cancel':
+            try:
+                job = queue.cancel(args.job_id)
+            except ValueError as e:
+                raise SystemExit(str(e))
+            print(json.dumps(job, indent=2) if job else f"Job {args.job_id} not found")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Documentation features from a letter of medical necessity, in one pass.
+
+The letter is read as a stream of byte chunks. Each chunk is decoded
+incrementally, split into lower-case word tokens by one regex, and every
+token advances a word-level Aho-Corasick automaton over all phrase
+patterns at once (so "x-ray", "X ray" and "xray" normalize to tokens and
+a phrase like "failed conservative treatment" costs nothing extra). Word
+count, phrase hits and PT/NSAID durations ("6 weeks of physical therapy",
+"naproxen for two months") all come from that single linear scan. A phrase
+preceded within a few words by a negation in the same clause ("not
+medically necessary", "no NSAIDs") is counted as negated instead of found. Only
+the automaton, a partial trailing word and a few recent positions are
+kept, so memory does not grow with the document.
+
+    scanner = LetterScanner()
+    for chunk in chunks:
+        scanner.feed(chunk)
+    scanner.result()         # counts, durations, derived booleans
+    scanner.request_fields() # PriorAuthRequest overrides
+"""
+import codecs
+import re
+from collections import deque
+
+TOKEN = re.compile(r'[a-z]+|\d+(?:\.\d+)?')
+
+# Clause punctuation: ends a negation's scope and any partial phrase, but is not a word
+SCAN_TOKEN = re.compile(r'[a-z]+|\d+(?:\.\d+)?|[.;:!?]')
+
+# A chunk that never reaches whitespace is cut here rather than buffered whole
+MAX_CARRY = 1024
+
+# Phrases per label, written as plain text and tokenized like the letter
+PATTERNS = {
+    'failed_conservative': [
+        'failed conservative', 'failure of conservative', 'conservative treatment failed',
+        'conservative management failed', 'conservative care failed', 'refractory to conservative',
+        'despite conservative', 'without relief', 'no improvement with', 'did not improve with',
+        'failed physical therapy', 'failed pt',
+    ],
+    'medical_necessity': [
+        'medically necessary', 'medical necessity', 'medically indicated', 'clinically necessary',
+    ],
+    'work_impact': [
+        'unable to work', 'cannot work', 'can not work', 'missed work', 'off work', 'light duty',
+        'work restrictions', 'modified duty', 'out of work', 'return to work',
+    ],
+    'objective_findings': [
+        'physical exam', 'physical examination', 'range of motion', 'straight leg raise', 'positive slr',
+        'reflexes', 'motor strength', 'tenderness', 'neurological exam', 'emg',
+    ],
+    'imaging_results': [
+        'mri', 'x ray', 'xray', 'radiograph', 'ct scan', 'imaging shows', 'imaging showed',
+        'imaging demonstrates', 'disc herniation', 'stenosis',
+    ],
+    'quality_of_life': ['quality of life', 'sleep', 'depression', 'anxiety'],
+    'activities_daily_living': ['activities of daily living', 'adls', 'adl', 'dressing', 'bathing', 'walking'],
+    'medical_literature': ['guidelines', 'study', 'studies', 'evidence based', 'literature', 'acoem', 'odg'],
+    # Bare "pt" usually means "patient"; it only counts with therapy context around it
+    'physical_therapy': [
+        'physical therapy', 'physiotherapy', 'physical therapist', 'home exercise program',
+        'pt sessions', 'pt session', 'pt visits', 'pt program', 'course of pt', 'weeks of pt', 'months of pt',
+        'sessions of pt', 'failed pt', 'completed pt', 'attended pt',
+    ],
+    'nsaids': [
+        'nsaid', 'nsaids', 'anti inflammatory', 'anti inflammatories', 'ibuprofen', 'naproxen',
+        'meloxicam', 'diclofenac', 'celecoxib', 'motrin', 'advil', 'aleve', 'mobic', 'celebrex',
+    ],
+    'weeks': ['week', 'weeks', 'wk', 'wks'],
+    'months': ['month', 'months'],
+}
+
+TREATMENTS = ('physical_therapy', 'nsaids')
+UNIT_WEEKS = {'weeks': 1.0, 'months': 52 / 12}
+
+NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8,
+    'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'several': 3, 'few': 2, 'couple': 2,
+}
+
+# A duration is attributed to the nearest PT/NSAID mention within this many words
+DURATION_WINDOW = 8
+
+# A phrase starting within this many words after one of these is negated
+NEGATIONS = frozenset(['no', 'not', 'without', 'never', 'denies', 'non', 'isn', 'wasn', 'doesn', 'nor'])
+NEGATION_WINDOW = 3
+
+
+class PhraseAutomaton:
+    """Aho-Corasick automaton over word tokens; step() is amortized O(1) per token"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for label, phrases in patterns.items():
+            for phrase in phrases:
+                self._add(tuple(TOKEN.findall(phrase.lower())), label)
+        self._link()
+        # Most letter words are in no phrase at all and send any state back to the root
+        self.vocabulary = frozenset(word for edges in self.goto for word in edges)
+
+    def _add(self, words, label):
+        state = 0
+        for word in words:
+            if word not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][word] = len(self.goto) - 1
+            state = self.goto[state][word]
+        self.output[state].append((label, len(words)))
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self.goto[state].items():
+                queue.append(child)
+                if state:
+                    self.fail[child] = self.step(self.fail[state], word)
+                # Shorter phrases ending here ("physical therapy" inside "failed physical therapy") are reported too
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def step(self, state, word):
+        while state and word not in self.goto[state]:
+            state = self.fail[state]
+        return self.goto[state].get(word, 0)
+
+
+AUTOMATON = PhraseAutomaton(PATTERNS)
+
+
+def parse_number(token):
+    if token in NUMBER_WORDS:
+        return NUMBER_WORDS[token]
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+class LetterScanner:
+    """Incremental scan of one letter; feed() chunks, then read result()"""
+
+    def __init__(self, automaton=AUTOMATON, encoding='utf-8'):
+        self.automaton = automaton
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.carry = ''
+        self.state = 0
+        self.words = 0
+        self.bytes = 0
+        self.counts = {label: 0 for label in PATTERNS}
+        self.negated = {label: 0 for label in PATTERNS}
+        self.previous = None
+        self.last_negation = -NEGATION_WINDOW - 1
+        # Latest position of each treatment mention, and durations still looking for one
+        self.last_mention = {}
+        self.unassigned = deque()
+        self.weeks = {treatment: 0.0 for treatment in TREATMENTS}
+
+    def feed(self, chunk):
+        if isinstance(chunk, bytes):
+            self.bytes += len(chunk)
+            chunk = self.decoder.decode(chunk)
+        text = self.carry + chunk.lower()
+        # The last word may continue in the next chunk
+        cut = max(text.rfind(' '), text.rfind('\n'), text.rfind('\t'))
+        if cut < 0 and len(text) <= MAX_CARRY:
+            self.carry = text
+            return
+        if cut < 0:
+            cut = len(text)
+        self.carry = text[cut:]
+        self._scan(text[:cut])
+
+    def _scan(self, text):
+        automaton, counts = self.automaton, self.counts
+        vocabulary, step, output = automaton.vocabulary, automaton.step, automaton.output
+        state, previous, position, last_negation = self.state, self.previous, self.words, self.last_negation
+        for token in SCAN_TOKEN.findall(text):
+            if token in '.;:!?':
+                state = 0
+                previous = None
+                last_negation = -NEGATION_WINDOW - 1
+                # A negated mention only claims durations within its own clause
+                self.last_mention.pop(None, None)
+                continue
+            position += 1
+            if token in NEGATIONS:
+                last_negation = position
+            if token not in vocabulary:
+                state = 0
+                previous = token
+                continue
+            state = step(state, token)
+            for label, length in output[state]:
+                if label in UNIT_WEEKS:
+                    amount = None if previous is None else parse_number(previous)
+                    if amount is not None:
+                        self._duration(amount * UNIT_WEEKS[label], position)
+                    continue
+                start = position - length + 1
+                if 0 < start - last_negation <= NEGATION_WINDOW:
+                    self.negated[label] += 1
+                    if label in TREATMENTS:
+                        # "No NSAIDs for 6 weeks": the duration is claimed, and dropped, by the negated mention
+                        self._mention(None, position)
+                    continue
+                if start <= last_negation:
+                    # The negation belongs to this phrase ("did not improve with PT"), not to what follows
+                    last_negation = -NEGATION_WINDOW - 1
+                counts[label] += 1
+                if label in TREATMENTS:
+                    self._mention(label, position)
+            previous = token
+        self.state, self.previous, self.words, self.last_negation = state, previous, position, last_negation
+
+    def _mention(self, treatment, position):
+        """Record a treatment mention; treatment None is a negated one, whose durations are discarded"""
+        self.last_mention[treatment] = position
+        # "6 weeks of physical therapy": the duration came first
+        while self.unassigned and position - self.unassigned[0][1] > DURATION_WINDOW:
+            self.unassigned.popleft()
+        if self.unassigned:
+            weeks, _ = self.unassigned.pop()
+            if treatment is not None:
+                self.weeks[treatment] = max(self.weeks[treatment], weeks)
+            self.unassigned.clear()
+
+    def _duration(self, weeks, position):
+        recent = [(position - seen, treatment) for treatment, seen in self.last_mention.items()
+                  if position - seen <= DURATION_WINDOW]
+        if recent:
+            _, treatment = min(recent, key=lambda item: item[0])
+            if treatment is not None:
+                self.weeks[treatment] = max(self.weeks[treatment], weeks)
+        else:
+            self.unassigned.append((weeks, position))
+
+    def finish(self):
+        self.carry += self.decoder.decode(b'', final=True).lower()
+        if self.carry:
+            self._scan(self.carry)
+            self.carry = ''
+
+    def result(self):
+        self.finish()
+        found = {label: count > 0 for label, count in self.counts.items()}
+        return {
+            'bytes': self.bytes,
+            'letter_word_count': self.words,
+            'includes_failed_conservative': found['failed_conservative'],
+            'includes_medical_necessity': found['medical_necessity'],
+            'includes_work_impact': found['work_impact'],
+            # Complete: argues failed treatment and necessity, backed by exam and imaging
+            'documentation_complete': all(found[label] for label in (
+                'failed_conservative', 'medical_necessity', 'objective_findings', 'imaging_results'
+            )),
+            'pt_weeks': round(self.weeks['physical_therapy']),
+            'tried_pt': found['physical_therapy'],
+            'tried_nsaids': found['nsaids'],
+            'nsaid_weeks': round(self.weeks['nsaids']),
+            'mentions': {label: count for label, count in self.counts.items() if label not in UNIT_WEEKS},
+            'negated': {label: count for label, count in self.negated.items() if count}
+        }
+
+    def request_fields(self, form=None):
+        """PriorAuthRequest fields the letter determines, merged over an existing form.
+
+        Documentation flags come from the letter alone; PT weeks and NSAID
+        use only ever raise what the form already says.
+        """
+        result = self.result()
+        form = form or {}
+        return {
+            'includes_failed_conservative': result['includes_failed_conservative'],
+            'includes_medical_necessity': result['includes_medical_necessity'],
+            'includes_work_impact': result['includes_work_impact'],
+            'documentation_complete': result['documentation_complete'],
+            'pt_weeks': max(int(form.get('pt_weeks') or 0), result['pt_weeks']),
+            'tried_nsaids': bool(form.get('tried_nsaids')) or result['tried_nsaids'],
+        }
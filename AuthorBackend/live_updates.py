@@ -0,0 +1,169 @@
+"""
+Debounced real-time scoring over one WebSocket per form session.
+
+The client sends form fields as they change (the full form first, then
+only edited fields). `LiveChannel` merges every message into the
+connection's form and wakes a single scoring task. That task waits until
+the form has been quiet for `debounce` seconds (but never more than
+`max_wait` after the first pending edit), scores the latest form once, and
+pushes the result. A burst of keystrokes therefore costs one prediction.
+A result is dropped instead of sent if more edits arrived while it was
+being computed; the next round starts immediately without another wait,
+so only the latest form's prediction reaches the client.
+
+Messages (JSON):
+    client -> {"seq": 7, "fields": {"pt_weeks": 6, ...}}
+    server -> {"type": "prediction", "seq": 7, "coalesced": 3, ...}
+              {"type": "error", "seq": 7, "detail": ...}
+"""
+import asyncio
+import threading
+
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocketDisconnect
+
+
+class ScoringError(ValueError):
+    """The current form cannot be scored (detail is sent to the client)"""
+
+    def __init__(self, detail):
+        super().__init__(str(detail))
+        self.detail = detail
+
+
+class LiveStats:
+    """Counters across all live connections"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {
+            'connections': 0, 'active_connections': 0, 'updates_received': 0,
+            'predictions_computed': 0, 'predictions_sent': 0, 'superseded_dropped': 0, 'errors_sent': 0
+        }
+
+    def add(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.counts[key] += value
+
+    def report(self):
+        with self.lock:
+            counts = dict(self.counts)
+        received, computed = counts['updates_received'], counts['predictions_computed']
+        counts['updates_per_prediction'] = round(received / computed, 2) if computed else None
+        return counts
+
+
+class LiveChannel:
+    """One form session: receives edits, scores the latest form, pushes results.
+
+    `score(form, state)` runs in the threadpool and returns the new state
+    or raises ScoringError; `state` is whatever the previous call returned
+    (None at first), so scoring can be incremental. `publish(state,
+    last_sent)` runs only for results that are pushed and returns the
+    response dict (e.g. with a delta against the last pushed state).
+    """
+
+    def __init__(self, websocket, score, publish, allowed_fields, stats, debounce=0.15, max_wait=1.0):
+        self.websocket = websocket
+        self.score = score
+        self.publish = publish
+        self.allowed_fields = set(allowed_fields)
+        self.stats = stats
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.form = {}
+        self.state = None
+        self.last_sent = None
+        self.seq = None
+        self.generation = 0
+        self.pending = 0
+        self.updated = asyncio.Event()
+        self.send_lock = asyncio.Lock()
+
+    async def send(self, message):
+        async with self.send_lock:
+            await self.websocket.send_json(message)
+
+    async def send_error(self, seq, detail):
+        self.stats.add(errors_sent=1)
+        await self.send({'type': 'error', 'seq': seq, 'detail': detail})
+
+    async def run(self):
+        await self.websocket.accept()
+        self.stats.add(connections=1, active_connections=1)
+        scorer = asyncio.create_task(self._score_loop())
+        try:
+            while True:
+                try:
+                    message = await self.websocket.receive_json()
+                except (ValueError, KeyError):
+                    await self.send_error(None, "Message is not valid JSON")
+                    continue
+                await self._receive(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            scorer.cancel()
+            self.stats.add(active_connections=-1)
+
+    async def _receive(self, message):
+        seq = message.get('seq') if isinstance(message, dict) else None
+        fields = message.get('fields') if isinstance(message, dict) else None
+        if not isinstance(fields, dict):
+            await self.send_error(seq, "Expected {\"seq\": ..., \"fields\": {...}}")
+            return
+        unknown = sorted(set(fields) - self.allowed_fields)
+        if unknown:
+            await self.send_error(seq, f"Unknown fields: {unknown}")
+            return
+        self.form.update(fields)
+        self.seq = seq
+        self.generation += 1
+        self.pending += 1
+        self.stats.add(updates_received=1)
+        self.updated.set()
+
+    async def _settle(self):
+        """Wait until no edit arrives for `debounce`, capped at `max_wait`"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while True:
+            self.updated.clear()
+            timeout = min(self.debounce, deadline - loop.time())
+            if timeout <= 0:
+                return
+            try:
+                await asyncio.wait_for(self.updated.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
+
+    async def _score_loop(self):
+        immediate = False
+        while True:
+            if not immediate:
+                await self.updated.wait()
+                await self._settle()
+            self.updated.clear()
+            immediate = False
+
+            generation, seq, coalesced = self.generation, self.seq, self.pending
+            try:
+                state = await run_in_threadpool(self.score, dict(self.form), self.state)
+            except Exception as e:
+                if generation == self.generation:
+                    self.pending = 0
+                    await self.send_error(seq, e.detail if isinstance(e, ScoringError) else str(e))
+                continue
+            self.stats.add(predictions_computed=1)
+            # Keep the cache either way: it is still the right base for the next delta
+            self.state = state
+            if generation != self.generation:
+                self.stats.add(superseded_dropped=1)
+                immediate = True
+                continue
+            self.pending = 0
+            response = self.publish(state, self.last_sent)
+            self.last_sent = state
+            await self.send({'type': 'prediction', 'seq': seq, 'coalesced': coalesced, **response})
+            self.stats.add(predictions_sent=1)
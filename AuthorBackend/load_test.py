@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Open-loop load test for api_v2.
+
+Cases from generate_realistic_case (or a CSV the generator wrote) are turned
+into PriorAuthRequest payloads and replayed against /predict at each rate
+in --rates. Requests are sent on a fixed schedule whether or not earlier
+ones have finished (open loop), so a slow server builds a queue instead of
+quietly lowering the offered load. Latency is measured from each request's
+scheduled send time, which counts time spent waiting for a free connection
+(no coordinated omission); service time from the actual send is reported
+alongside.
+
+Per rate step the report has an HDR-style log-bucketed latency histogram,
+p50/p95/p99/p99.9, error and timeout rates and achieved throughput; the
+steps together form the saturation curve. The highest rate that keeps up
+with the offered load within the error and p99 budgets is reported as the
+max sustainable QPS.
+
+    python load_test.py --rates 25,50,100,200 --duration 15
+    python load_test.py --url http://localhost:8000 --cases training_data_v2.csv
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+import numpy as np
+import pandas as pd
+
+import generate_realistic_training_data as generator
+
+HISTOGRAM_SUB_BITS = 8  # 256 buckets per power of two: under 0.4% relative error
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class LatencyHistogram:
+    """HDR-style histogram of microsecond values: log buckets with linear sub-buckets"""
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def bucket(value):
+        value = max(int(value), 0)
+        shift = max(value.bit_length() - HISTOGRAM_SUB_BITS, 0)
+        return (value >> shift) << shift, 1 << shift
+
+    def record(self, value):
+        low, _ = self.bucket(value)
+        self.counts[low] = self.counts.get(low, 0) + 1
+        self.total += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        if not self.total:
+            return None
+        rank = p / 100 * self.total
+        seen = 0
+        for low in sorted(self.counts):
+            seen += self.counts[low]
+            if seen >= rank:
+                _, width = self.bucket(low)
+                return min(low + width / 2, self.max)
+        return self.max
+
+    def summary(self):
+        """Percentiles in milliseconds"""
+        result = {f'p{p:g}': None if not self.total else round(self.percentile(p) / 1000, 3) for p in PERCENTILES}
+        result['min'] = None if self.min is None else round(self.min / 1000, 3)
+        result['max'] = None if self.max is None else round(self.max / 1000, 3)
+        return result
+
+    def to_dict(self):
+        """Non-empty buckets as [lower bound us, count], for plotting or merging"""
+        return [[low, self.counts[low]] for low in sorted(self.counts)]
+
+
+def case_to_request(case):
+    """PriorAuthRequest payload for one generated (or CSV) case"""
+    history = case['treatment_history']
+    treatments = [] if not isinstance(history, str) or history == 'none' else history.split('|')
+    pt = re.search(r'physical_therapy_(\d+)w', history) if treatments else None
+    names = [re.sub(r'_(\d+w|x\d+)$', '', t) for t in treatments]
+    days_before_surgery = case.get('days_before_surgery')
+    return {
+        'case_id': case['case_id'],
+        'patient_age': int(case['patient_age']),
+        'patient_gender': case['patient_gender'],
+        'payer': case['payer'],
+        'procedure_category': case['procedure_category'],
+        'procedure_code': str(case['procedure_code']),
+        'primary_diagnosis': case['primary_diagnosis'],
+        'diagnosis_months': int(case['diagnosis_months']),
+        'pt_weeks': int(pt.group(1)) if pt else 0,
+        'tried_nsaids': any('nsaids' in n for n in names),
+        'tried_injections': any(n in ('steroid_injection', 'nerve_block') for n in names),
+        'other_treatments': [n for n in names if n != 'physical_therapy' and 'nsaids' not in n
+                             and n not in ('steroid_injection', 'nerve_block')],
+        'pain_current': int(case['pain_current']),
+        'pain_trend': case['pain_trend'],
+        'has_neurological_symptoms': bool(case['has_neurological_symptoms']),
+        'imaging_findings': case['imaging_findings'],
+        'work_status': case['work_status'],
+        'includes_failed_conservative': bool(case['uses_failed_conservative']),
+        'includes_medical_necessity': bool(case['uses_medical_necessity']),
+        'includes_work_impact': bool(case['uses_quality_of_life']),
+        'documentation_complete': float(case['documentation_completeness']) >= 0.8,
+        'submission_day': case['submission_day_of_week'],
+        'urgent': days_before_surgery is not None and not pd.isna(days_before_surgery) and days_before_surgery <= 14
+    }
+
+
+def build_payloads(n, seed, cases_path=None):
+    """Pre-serialized request bodies, so the client spends its time sending"""
+    if cases_path:
+        cases = pd.read_csv(cases_path, nrows=n).to_dict('records')
+    else:
+        random.seed(seed)
+        np.random.seed(seed)
+        cases = [generator.generate_realistic_case(i) for i in range(n)]
+    return [json.dumps(case_to_request(case)).encode() for case in cases]
+
+
+def start_server(port, workers, data_dir):
+    """api_v2 under uvicorn in a subprocess, with its own audit and case databases"""
+    env = dict(os.environ)
+    env.setdefault('AUDIT_DB_PATH', os.path.join(data_dir, 'audit_log.db'))
+    env.setdefault('CASE_DB_PATH', os.path.join(data_dir, 'cases.db'))
+    env.setdefault('JOB_DB_PATH', os.path.join(data_dir, 'jobs.db'))
+    command = [sys.executable, '-m', 'uvicorn', 'api_v2:app', '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+    server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 180
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"api_v2 exited with code {server.returncode} during startup")
+        try:
+            if httpx.get(url + '/ready', timeout=1).status_code == 200:
+                return server, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    server.terminate()
+    raise RuntimeError("api_v2 did not become ready (/ready) within 180s")
+
+
+class Step:
+    """Results of one constant-rate step"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.latency = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.sent = 0
+        self.ok = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.status_codes = {}
+        self.elapsed = 0.0
+
+    def report(self):
+        completed = self.ok + self.errors + self.timeouts
+        failed = self.errors + self.timeouts
+        return {
+            'offered_rps': self.rate,
+            'achieved_rps': round(self.ok / self.elapsed, 2) if self.elapsed else 0.0,
+            'sent': self.sent,
+            'ok': self.ok,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'error_rate': round(failed / completed, 5) if completed else None,
+            'status_codes': self.status_codes,
+            'latency_ms': self.latency.summary(),
+            'service_time_ms': self.service.summary(),
+            'latency_histogram_us': self.latency.to_dict()
+        }
+
+
+async def run_step(client, path, payloads, rate, duration, max_in_flight, arrival, rng, step=None):
+    """Send rate*duration requests on an open-loop schedule and wait for all of them"""
+    step = step or Step(rate)
+    in_flight = asyncio.Semaphore(max_in_flight)
+    n = max(1, int(rate * duration))
+    gaps = rng.exponential(1 / rate, n) if arrival == 'poisson' else np.full(n, 1 / rate)
+    offsets = np.cumsum(gaps) - gaps[0]
+    loop = asyncio.get_running_loop()
+
+    async def fire(body, intended):
+        async with in_flight:
+            sent = loop.time()
+            try:
+                response = await client.post(path, content=body, headers={'content-type': 'application/json'})
+            except httpx.TimeoutException:
+                step.timeouts += 1
+                return
+            except httpx.HTTPError:
+                step.errors += 1
+                return
+            done = loop.time()
+        code = str(response.status_code)
+        step.status_codes[code] = step.status_codes.get(code, 0) + 1
+        if response.status_code == 200:
+            step.ok += 1
+        else:
+            step.errors += 1
+        step.latency.record((done - intended) * 1e6)
+        step.service.record((done - sent) * 1e6)
+
+    start = loop.time()
+    tasks = []
+    for i, offset in enumerate(offsets.tolist()):
+        delay = start + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(fire(payloads[step.sent % len(payloads)], start + offset)))
+        step.sent += 1
+    await asyncio.gather(*tasks)
+    step.elapsed += loop.time() - start
+    return step
+
+
+def max_sustainable(steps, max_error_rate, slo_p99_ms, min_throughput_ratio=0.95):
+    """Highest offered rate that was kept up with inside the error and latency budgets"""
+    best = None
+    for step in steps:
+        p99 = step['latency_ms']['p99']
+        if (
+            step['achieved_rps'] >= min_throughput_ratio * step['offered_rps']
+            and (step['error_rate'] or 0) <= max_error_rate
+            and p99 is not None and p99 <= slo_p99_ms
+        ):
+            best = step['offered_rps'] if best is None else max(best, step['offered_rps'])
+    return best
+
+
+async def run(args, url, payloads):
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    rng = np.random.default_rng(args.seed)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+        if args.warmup > 0:
+            print(f"Warm-up: {args.warmup:g}s at {args.rates[0]:g} rps")
+            await run_step(client, args.path, payloads, args.rates[0], args.warmup, args.max_in_flight, args.arrival, rng)
+        steps = []
+        for rate in args.rates:
+            step = (await run_step(client, args.path, payloads, rate, args.duration, args.max_in_flight,
+                                   args.arrival, rng)).report()
+            steps.append(step)
+            latency = step['latency_ms']
+            print(f"  {rate:8g} rps offered -> {step['achieved_rps']:8.1f} ok/s  "
+                  f"p50 {latency['p50']} ms  p99 {latency['p99']} ms  errors {step['error_rate']:.2%}")
+            if args.stop_on_saturation and max_sustainable([step], args.max_error_rate, args.slo_p99_ms) is None:
+                print("  Saturated; skipping higher rates")
+                break
+    return steps
+
+
+def print_summary(report):
+    print("\n" + "="*78)
+    print("LOAD TEST SUMMARY")
+    print("="*78)
+    print(f"\n  Target: {report['url']}{report['path']}  ({report['payloads']} distinct payloads, "
+          f"{report['arrival']} arrivals, max {report['max_in_flight']} in flight)")
+    print(f"\n  {'offered':>9} {'ok/s':>9} {'err%':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'p99.9':>9}   (ms, from scheduled send)")
+    for step in report['steps']:
+        latency = step['latency_ms']
+        cells = [f"{latency[k]:9.2f}" if latency[k] is not None else f"{'-':>9}" for k in ('p50', 'p95', 'p99', 'p99.9')]
+        print(f"  {step['offered_rps']:9g} {step['achieved_rps']:9.1f} {(step['error_rate'] or 0) * 100:7.2f} {' '.join(cells)}")
+    best = report['max_sustainable_rps']
+    print(f"\n  Max sustainable rate (p99 <= {report['slo_p99_ms']:g} ms, errors <= {report['max_error_rate']:.1%}): "
+          f"{best if best is not None else 'none of the tested rates'}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=None, help='Running api_v2 to test; default starts one locally')
+    parser.add_argument('--port', type=int, default=8765, help='Port for the locally started server')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers for the local server')
+    parser.add_argument('--path', default='/predict')
+    parser.add_argument('--rates', default='25,50,100,200,400', help='Comma-separated offered request rates (rps)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per rate step')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Seconds of unrecorded traffic first')
+    parser.add_argument('--arrival', choices=['uniform', 'poisson'], default='poisson')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Concurrent requests (connections)')
+    parser.add_argument('--timeout', type=float, default=10.0, help='Per-request timeout in seconds')
+    parser.add_argument('--payloads', type=int, default=2000, help='Distinct cases replayed round-robin')
+    parser.add_argument('--cases', default=None, help='Replay cases from a generator CSV instead')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--slo-p99-ms', type=float, default=250.0)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--stop-on-saturation', action='store_true', help='Stop after the first failing rate')
+    parser.add_argument('--out', default='load_test_report.json')
+    args = parser.parse_args()
+    args.rates = [float(r) for r in args.rates.split(',')]
+
+    started_at = datetime.utcnow().isoformat()
+    payloads = build_payloads(args.payloads, args.seed, args.cases)
+    server = None
+    url = args.url
+    with tempfile.TemporaryDirectory() as data_dir:
+        if url is None:
+            print(f"Starting api_v2 on port {args.port} ({args.workers} worker(s))...")
+            server, url = start_server(args.port, args.workers, data_dir)
+        try:
+            steps = asyncio.run(run(args, url, payloads))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    report = {
+        'started_at': started_at,
+        'url': url,
+        'path': args.path,
+        'payloads': len(payloads),
+        'arrival': args.arrival,
+        'duration_s': args.duration,
+        'max_in_flight': args.max_in_flight,
+        'slo_p99_ms': args.slo_p99_ms,
+        'max_error_rate': args.max_error_rate,
+        'max_sustainable_rps': max_sustainable(steps, args.max_error_rate, args.slo_p99_ms),
+        'steps': steps
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_summary(report)
+    print(f"\n  Report: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Measure api_v2 startup: import-time breakdown, startup phases and the
+first /predict with and without warm-up.
+
+Each measurement runs in a fresh interpreter so nothing is cached:
+
+- `python -X importtime` of `import api_v2` and of load_artifacts(),
+  with self time summed per top-level package
+- startup phase timings (imports, load_artifacts, warm_up) from /ready
+- first and median /predict latency in-process when artifacts are loaded
+  but not warmed, versus after the full warm-up
+
+    python measure_startup.py --top 15
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_ONLY = "import api_v2"
+IMPORT_AND_LOAD = "import api_v2; api_v2.load_artifacts()"
+
+FIRST_REQUESTS = """
+import json, sys, time
+import api_v2
+from fastapi.testclient import TestClient
+
+warm = sys.argv[1] == 'warm'
+if warm:
+    api_v2.start_up()
+else:
+    api_v2.load_artifacts()
+    api_v2.startup.ready = True
+request = api_v2.warmup_requests()[-1].model_dump()
+request['case_id'] = None
+client = TestClient(api_v2.app)
+client.get('/health')  # the test client's own first-call setup is not the server's
+timings = []
+for _ in range(20):
+    start = time.perf_counter()
+    response = client.post('/predict', json=request)
+    timings.append((time.perf_counter() - start) * 1000)
+    assert response.status_code == 200, response.text
+print(json.dumps({'first_ms': timings[0], 'median_ms': sorted(timings)[len(timings) // 2],
+                  'startup': api_v2.startup.report()}))
+"""
+
+
+def run_python(args, env):
+    return subprocess.run([sys.executable, *args], cwd=HERE, env=env, capture_output=True, text=True, check=True)
+
+
+def import_breakdown(code, env):
+    """(total ms, {top-level package: self ms}) from -X importtime"""
+    stderr = run_python(['-X', 'importtime', '-c', code], env).stderr
+    packages = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1000
+        total += int(self_us) / 1000
+    return total, packages
+
+
+def first_requests(mode, env):
+    return json.loads(run_python(['-c', FIRST_REQUESTS, mode], env).stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top', type=int, default=12, help='Packages to list per breakdown')
+    parser.add_argument('--out', default=None, help='Also write the measurements as JSON')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.setdefault('AUDIT_DB_PATH', os.path.join(data_dir, 'audit_log.db'))
+    env.setdefault('CASE_DB_PATH', os.path.join(data_dir, 'cases.db'))
+    env.setdefault('JOB_DB_PATH', os.path.join(data_dir, 'jobs.db'))
+    results = {}
+
+    print("="*60)
+    print("API_V2 STARTUP")
+    print("="*60)
+    for label, code in (('import api_v2', IMPORT_ONLY), ('import + load_artifacts()', IMPORT_AND_LOAD)):
+        total, packages = import_breakdown(code, env)
+        top = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        results[label] = {'total_ms': round(total, 1), 'packages_ms': {k: round(v, 1) for k, v in top}}
+        print(f"\n  {label}: {total:7.1f} ms of imports")
+        for package, ms in top:
+            print(f"    {package:28} {ms:8.1f} ms")
+
+    cold = first_requests('cold', env)
+    warm = first_requests('warm', env)
+    results['first_requests'] = {'cold': cold, 'warm': warm}
+    phases = warm['startup']['phases_seconds']
+    print("\n  Startup phases (s): " + ", ".join(f"{name} {seconds:.3f}" for name, seconds in phases.items()))
+    print(f"\n  /predict without warm-up: first {cold['first_ms']:7.2f} ms, median {cold['median_ms']:6.2f} ms")
+    print(f"  /predict after warm-up:   first {warm['first_ms']:7.2f} ms, median {warm['median_ms']:6.2f} ms")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
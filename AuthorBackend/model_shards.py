@@ -0,0 +1,145 @@
+"""
+Per-shard model routing for the prediction API.
+
+`train_advanced_model.py --shards payer` writes one small booster per payer
+(or procedure_category) that beat the global model on its own held-out rows,
+plus models/shards/manifest.json. `ShardRouter` sends each row to its
+shard's booster and everything else to the global model. Shard files are
+loaded on first use and at most `max_loaded` stay in memory, least recently
+used first out. Live call counts and latency are kept per shard next to the
+offline accuracy from the manifest. The manifest records a fingerprint of
+the global model the shards were selected against; api_v2 ignores shards
+whose fingerprint does not match the model it serves (a later retrain
+without --shards, or an incremental update).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+
+GLOBAL = '__global__'
+
+
+def model_fingerprint(booster):
+    """Short hash of a booster's full model text (stable across pickling)"""
+    return hashlib.sha256(booster.model_to_string(num_iteration=-1).encode()).hexdigest()[:16]
+
+
+class ShardRouter:
+    """Routes feature rows to per-shard boosters with a global fallback"""
+
+    def __init__(self, manifest, directory, global_model, max_loaded=8, predict_params=None):
+        self.manifest = manifest
+        self.directory = directory
+        self.shard_by = manifest['shard_by']
+        self.feature_cols = manifest['feature_cols']
+        self.global_model = global_model
+        self.max_loaded = max(1, max_loaded)
+        self.predict_params = predict_params or {}
+        self.paths = {
+            value: os.path.join(directory, entry['path'])
+            for value, entry in manifest['shards'].items() if entry.get('selected')
+        }
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.stats = {key: self._empty_stats() for key in [*self.paths, GLOBAL]}
+
+    @classmethod
+    def from_file(cls, path, global_model, max_loaded=8, predict_params=None):
+        with open(path) as f:
+            return cls(json.load(f), os.path.dirname(path), global_model, max_loaded, predict_params)
+
+    @staticmethod
+    def _empty_stats():
+        return {'calls': 0, 'rows': 0, 'seconds': 0.0, 'loads': 0, 'evictions': 0}
+
+    def model_for(self, value):
+        """(stats key, booster) for a raw shard value; unknown values use the global model"""
+        if value not in self.paths:
+            return GLOBAL, self.global_model
+        with self.lock:
+            model = self.loaded.get(value)
+            if model is not None:
+                self.loaded.move_to_end(value)
+                return value, model
+        # Load outside the routing lock so cached shards keep serving meanwhile
+        with self.load_lock:
+            with self.lock:
+                model = self.loaded.get(value)
+            if model is None:
+                model = joblib.load(self.paths[value])['model']
+                with self.lock:
+                    self.loaded[value] = model
+                    self.stats[value]['loads'] += 1
+                    while len(self.loaded) > self.max_loaded:
+                        evicted, _ = self.loaded.popitem(last=False)
+                        self.stats[evicted]['evictions'] += 1
+        return value, model
+
+    def _predict(self, value, X):
+        key, model = self.model_for(value)
+        start = time.perf_counter()
+        probabilities = model.predict(X, num_iteration=model.best_iteration, **self.predict_params)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            stats = self.stats[key]
+            stats['calls'] += 1
+            stats['rows'] += len(X)
+            stats['seconds'] += elapsed
+        return probabilities
+
+    def predict(self, X, keys):
+        """Approval probabilities for feature rows X, routed by each row's shard value"""
+        if len(keys) == 1:
+            return self._predict(str(keys[0]), X)
+        values, inverse = np.unique(np.asarray(keys).astype(str), return_inverse=True)
+        inverse = inverse.ravel()
+        if len(values) == 1:
+            return self._predict(values[0], X)
+        probabilities = np.empty(len(X))
+        for i, value in enumerate(values.tolist()):
+            rows = np.flatnonzero(inverse == i)
+            probabilities[rows] = self._predict(value, X[rows])
+        return probabilities
+
+    def report(self):
+        """Offline accuracy from training plus live routing and latency per shard"""
+        with self.lock:
+            stats = {key: dict(value) for key, value in self.stats.items()}
+            loaded = list(self.loaded)
+
+        def live(key):
+            entry = stats[key]
+            return {
+                'calls': entry['calls'],
+                'rows': entry['rows'],
+                'mean_us_per_call': round(entry['seconds'] / entry['calls'] * 1e6, 1) if entry['calls'] else None,
+                'mean_us_per_row': round(entry['seconds'] / entry['rows'] * 1e6, 2) if entry['rows'] else None,
+            }
+
+        shards = {}
+        for value, entry in self.manifest['shards'].items():
+            shards[value] = {**entry, 'serves': 'shard' if value in self.paths else 'global'}
+            if value in self.paths:
+                shards[value].update({
+                    'loaded': value in loaded,
+                    'loads': stats[value]['loads'],
+                    'evictions': stats[value]['evictions'],
+                    'live': live(value)
+                })
+        return {
+            'shard_by': self.shard_by,
+            'training_date': self.manifest.get('training_date'),
+            'auc_global': self.manifest.get('auc_global'),
+            'auc_routed': self.manifest.get('auc_routed'),
+            'max_loaded': self.max_loaded,
+            'loaded': loaded,
+            'global_fallback': live(GLOBAL),
+            'shards': shards
+        }
@@ -0,0 +1,213 @@
+"""
+On-demand profiling of live API requests.
+
+`ProfilingMiddleware` is a plain ASGI middleware: while profiling is off it
+only checks the path and headers and passes the request straight through. When an
+admin enables it, a random `sample_rate` fraction of matching requests (plus
+any request sent with an `X-Profile: 1` header) is profiled with either
+
+- `sampling`: a helper thread snapshots the serving thread's stack every
+  `interval_ms` and aggregates collapsed stacks (flamegraph.pl/speedscope
+  input), or
+- `cprofile`: a deterministic cProfile run merged into one pstats profile.
+
+Only one request is profiled at a time; others pass through untouched.
+Async handlers share the event loop thread, so concurrently running
+requests can appear in the same samples.
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+MAX_DISTINCT_STACKS = 20000
+TRUNCATED_STACK = '[other stacks]'
+
+
+def frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame, skip_code=None):
+    """Root-first 'a;b;c' stack, or None if skip_code is on the stack"""
+    names = []
+    while frame is not None:
+        if frame.f_code is skip_code:
+            return None
+        names.append(frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples one thread's stack on a helper thread until stopped"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def _run(self):
+        skip = StackSampler.__exit__.__code__
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = collapse(frame, skip) if frame is not None else None
+            if stack is not None:
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def __enter__(self):
+        # The sampler can only run when the GIL is released, so shorten the
+        # switch interval (5ms by default) to the sampling interval meanwhile
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval))
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+
+
+class RequestProfiler:
+    """Profiling settings plus the traces aggregated so far"""
+
+    def __init__(self):
+        self.enabled = False
+        self.mode = 'sampling'
+        self.sample_rate = 0.01
+        self.interval = 0.001
+        self.busy = threading.Lock()
+        self.data_lock = threading.Lock()
+        self.reset()
+
+    def configure(self, enabled=None, mode=None, sample_rate=None, interval_ms=None):
+        if mode is not None:
+            if mode not in ('sampling', 'cprofile'):
+                raise ValueError("mode must be 'sampling' or 'cprofile'")
+            self.mode = mode
+        if sample_rate is not None:
+            if not 0 <= sample_rate <= 1:
+                raise ValueError("sample_rate must be between 0 and 1")
+            self.sample_rate = sample_rate
+        if interval_ms is not None:
+            if interval_ms <= 0:
+                raise ValueError("interval_ms must be positive")
+            self.interval = interval_ms / 1000
+        if enabled is not None:
+            self.enabled = enabled
+
+    def reset(self):
+        with self.data_lock:
+            self.stacks = {}
+            self.stats = None
+            self.profiled_requests = 0
+            self.profiled_seconds = 0.0
+
+    def should_profile(self, headers):
+        # Clients can only pick requests while an admin has profiling on, never turn it on
+        if not self.enabled:
+            return False
+        return (b'x-profile', b'1') in headers or random.random() < self.sample_rate
+
+    async def profile(self, call):
+        """Run one request coroutine under the configured profiler"""
+        if not self.busy.acquire(blocking=False):
+            return await call()
+        try:
+            start = time.perf_counter()
+            if self.mode == 'cprofile':
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    return await call()
+                finally:
+                    profile.disable()
+                    self._add_cprofile(profile, time.perf_counter() - start)
+            else:
+                sampler = StackSampler(threading.get_ident(), self.interval)
+                try:
+                    with sampler:
+                        return await call()
+                finally:
+                    self._add_stacks(sampler.stacks, time.perf_counter() - start)
+        finally:
+            self.busy.release()
+
+    def _add_stacks(self, stacks, seconds):
+        with self.data_lock:
+            for stack, count in stacks.items():
+                if stack not in self.stacks and len(self.stacks) >= MAX_DISTINCT_STACKS:
+                    stack = TRUNCATED_STACK
+                self.stacks[stack] = self.stacks.get(stack, 0) + count
+            self.profiled_requests += 1
+            self.profiled_seconds += seconds
+
+    def _add_cprofile(self, profile, seconds):
+        with self.data_lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+            self.profiled_requests += 1
+            self.profiled_seconds += seconds
+
+    def status(self):
+        with self.data_lock:
+            return {
+                'enabled': self.enabled,
+                'mode': self.mode,
+                'sample_rate': self.sample_rate,
+                'interval_ms': self.interval * 1000,
+                'profiled_requests': self.profiled_requests,
+                'profiled_seconds': round(self.profiled_seconds, 3),
+                'distinct_stacks': len(self.stacks),
+                'samples': sum(self.stacks.values())
+            }
+
+    def collapsed(self):
+        """Collapsed-stack text: 'frame;frame;frame count' per line"""
+        with self.data_lock:
+            items = sorted(self.stacks.items(), key=lambda item: -item[1])
+        return ''.join(f"{stack} {count}\n" for stack, count in items)
+
+    def pstats_text(self, limit=50):
+        with self.data_lock:
+            if self.stats is None:
+                return ''
+            out = io.StringIO()
+            self.stats.stream = out
+            self.stats.sort_stats('cumulative').print_stats(limit)
+            return out.getvalue()
+
+    def pstats_dump(self):
+        """Binary profile loadable with pstats.Stats(path) or snakeviz"""
+        with self.data_lock:
+            if self.stats is None:
+                return b''
+            return marshal.dumps(self.stats.stats)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that hands selected requests to a RequestProfiler"""
+
+    def __init__(self, app, profiler, path_prefixes=('/predict',)):
+        self.app = app
+        self.profiler = profiler
+        self.path_prefixes = tuple(path_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope['type'] != 'http'
+            or not scope['path'].startswith(self.path_prefixes)
+            or not self.profiler.should_profile(scope['headers'])
+        ):
+            return await self.app(scope, receive, send)
+        return await self.profiler.profile(lambda: self.app(scope, receive, send))
@@ -0,0 +1,378 @@
+"""
+Declarative payer rules for recommendations, risk/positive factors and
+decision timelines.
+
+Rules live in payer_rules.json. Each rule's `when` clauses are compiled once
+into functions that turn request columns into NumPy boolean masks, so a
+batch of any size is evaluated with one vectorized pass per rule; only the
+text of matching rules is formatted per row. The file is re-read when its
+modification time changes, and a broken edit keeps the previous rules live.
+"""
+import functools
+import json
+import operator
+import os
+import string
+import threading
+import time
+
+import numpy as np
+
+# Operator functions rather than ufuncs so string columns compare on any NumPy
+COMPARISONS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+ARITHMETIC = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+}
+
+
+class RuleError(ValueError):
+    pass
+
+
+def compile_clause(clause, fields):
+    """One clause -> (cache key, (batch check, single-row check))
+
+    The batch check maps column arrays to a boolean mask; the single-row
+    check does the same on plain Python values, avoiding NumPy call overhead
+    for one-off /predict requests.
+    """
+    field, op, value = clause.get('field'), clause.get('op'), clause.get('value')
+    if field not in fields:
+        raise RuleError(f"Unknown field '{field}'")
+    if op in COMPARISONS:
+        fn = COMPARISONS[op]
+        check = lambda columns: fn(columns[field], value)
+        check_row = check
+    elif op in ('in', 'not_in'):
+        if not isinstance(value, list):
+            raise RuleError(f"'{op}' needs a list value for field '{field}'")
+        negate = op == 'not_in'
+        check = lambda columns: np.isin(columns[field], value) != negate
+        check_row = lambda row: (row[field] in value) != negate
+    else:
+        raise RuleError(f"Unknown operator '{op}'")
+    return json.dumps([field, op, value]), (check, check_row)
+
+
+class Condition:
+    """AND of clauses; identical clauses across rules share one mask per batch"""
+
+    def __init__(self, clauses, fields, registry):
+        self.keys = []
+        for clause in clauses:
+            key, checks = compile_clause(clause, fields)
+            registry.setdefault(key, checks)
+            self.keys.append(key)
+
+    def __call__(self, masks):
+        if not self.keys:
+            return masks['__all__']
+        mask = masks[self.keys[0]]
+        for key in self.keys[1:]:
+            mask = mask & masks[key]
+        return mask
+
+
+@functools.lru_cache(maxsize=1024)
+def template_fields(template):
+    return tuple(name for _, name, _, _ in string.Formatter().parse(template) if name)
+
+
+class CompiledRules:
+    """One immutable compiled snapshot of the rule table"""
+
+    def __init__(self, table, request_fields):
+        self.variables = table.get('variables', {})
+        fields = set(request_fields) | {'probability'} | set(self.variables)
+        for name, spec in self.variables.items():
+            if spec.get('op') not in ARITHMETIC:
+                raise RuleError(f"Unknown operator '{spec.get('op')}' in variable '{name}'")
+
+        self.clauses = {}
+
+        def condition(clauses):
+            return Condition(clauses, fields, self.clauses)
+
+        def compile_value(spec):
+            # Plain template string, or {'when', 'then', 'else'} chosen per row
+            if isinstance(spec, dict):
+                return (condition(spec['when']), spec['then'], spec['else'])
+            return spec
+
+        self.priority_order = {p: i for i, p in enumerate(table['priority_order'])}
+        self.max_recommendations = table.get('max_recommendations', 5)
+
+        self.recommendations = []
+        for rule in table.get('recommendations', []):
+            compiled = {key: compile_value(rule[key]) for key in ('action', 'impact', 'effort', 'priority', 'category')}
+            priority = compiled['priority']
+            for value in (priority[1:] if isinstance(priority, tuple) else (priority,)):
+                if value not in self.priority_order:
+                    raise RuleError(f"Unknown priority '{value}' in rule '{rule.get('id')}'")
+            # Fully static rules are rendered once; the shared dict is read-only
+            if all(isinstance(v, str) and not template_fields(v) for v in compiled.values()):
+                compiled = dict(compiled)
+                self.recommendations.append((condition(rule['when']), compiled, compiled))
+            else:
+                self.recommendations.append((condition(rule['when']), compiled, None))
+
+        self.risk_factors = [
+            (condition(rule['when']), rule['message'])
+            for rule in table.get('risk_factors', [])
+        ]
+        self.positive_factors = [
+            (condition(rule['when']), rule['message'])
+            for rule in table.get('positive_factors', [])
+        ]
+
+        timeline = table['timeline']
+        self.base_days = timeline['base_days']
+        self.min_days = timeline.get('min_days', 1)
+        self.overrides = [(condition(o['when']), o['days']) for o in timeline.get('overrides', [])]
+        self.adjustments = [(condition(a['when']), a['days']) for a in timeline.get('adjustments', [])]
+
+        # Only pull the request attributes the rules actually reference
+        referenced = set()
+        for text in self._templates():
+            referenced.update(template_fields(text))
+        for spec in self.variables.values():
+            referenced.update(arg for arg in spec['args'] if isinstance(arg, str))
+        referenced.update(
+            clause['field']
+            for section in ('recommendations', 'risk_factors', 'positive_factors')
+            for rule in table.get(section, [])
+            for clause in rule['when']
+        )
+        for rule in table.get('recommendations', []):
+            for value in rule.values():
+                if isinstance(value, dict):
+                    referenced.update(clause['field'] for clause in value['when'])
+        for section in ('overrides', 'adjustments'):
+            for item in timeline.get(section, []):
+                referenced.update(clause['field'] for clause in item['when'])
+        unknown = referenced - fields
+        if unknown:
+            raise RuleError(f"Unknown fields in templates: {sorted(unknown)}")
+        self.request_fields = sorted(referenced & set(request_fields))
+
+    def _templates(self):
+        for _, compiled, _ in self.recommendations:
+            for value in compiled.values():
+                if isinstance(value, tuple):
+                    yield value[1]
+                    yield value[2]
+                else:
+                    yield value
+        for _, message in self.risk_factors + self.positive_factors:
+            yield message
+
+    def columns(self, requests, probabilities, request_columns=None):
+        """Rule inputs as arrays, from request objects or already-columnar requests"""
+        if request_columns is not None:
+            columns = {field: np.asarray(request_columns[field]) for field in self.request_fields}
+        else:
+            columns = {
+                field: np.array([getattr(r, field) for r in requests])
+                for field in self.request_fields
+            }
+        columns['probability'] = np.asarray(probabilities, dtype=float)
+        for name, spec in self.variables.items():
+            args = [columns[a] if isinstance(a, str) else a for a in spec['args']]
+            columns[name] = ARITHMETIC[spec['op']](*args)
+        return columns
+
+    def evaluate_one(self, request, probability):
+        """Same result as evaluate([request], [probability])[0] without NumPy"""
+        row = {field: getattr(request, field) for field in self.request_fields}
+        row['probability'] = float(probability)
+        for name, spec in self.variables.items():
+            row[name] = ARITHMETIC[spec['op']](*[row[a] if isinstance(a, str) else a for a in spec['args']])
+
+        masks = {key: bool(check_row(row)) for key, (_, check_row) in self.clauses.items()}
+        masks['__all__'] = True
+
+        def render(template):
+            names = template_fields(template)
+            if not names:
+                return template
+            return template.format(**{name: row[name] for name in names})
+
+        recommendations = []
+        for condition, compiled, static in self.recommendations:
+            if not condition(masks):
+                continue
+            if static is not None:
+                recommendations.append(static)
+                continue
+            item = {}
+            for key, value in compiled.items():
+                if isinstance(value, tuple):
+                    value = value[1] if value[0](masks) else value[2]
+                item[key] = render(value)
+            recommendations.append(item)
+        recommendations.sort(key=lambda item: self.priority_order[item['priority']])
+
+        days = self.base_days
+        for condition, override in self.overrides:
+            if condition(masks):
+                days = override
+                break
+        for condition, delta in self.adjustments:
+            if condition(masks):
+                days += delta
+
+        return {
+            'recommendations': recommendations[:self.max_recommendations],
+            'risk_factors': [render(m) for condition, m in self.risk_factors if condition(masks)],
+            'positive_factors': [render(m) for condition, m in self.positive_factors if condition(masks)],
+            'estimated_days_to_decision': int(max(self.min_days, days))
+        }
+
+    def evaluate(self, requests, probabilities, request_columns=None):
+        """Insights for a batch: one dict per request, in input order
+
+        Pass request_columns ({field: array}) instead of request objects to
+        skip gathering attributes row by row.
+        """
+        n = len(probabilities)
+        if n == 1 and request_columns is None:
+            return [self.evaluate_one(requests[0], probabilities[0])]
+        columns = self.columns(requests, probabilities, request_columns)
+
+        # Every distinct clause is evaluated once over the whole batch
+        masks = {key: np.asarray(check(columns), dtype=bool) for key, (check, _) in self.clauses.items()}
+        masks['__all__'] = np.ones(n, dtype=bool)
+
+        def render(template, i):
+            names = template_fields(template)
+            if not names:
+                return template
+            return template.format(**{name: columns[name][i] for name in names})
+
+        recommendations = [[] for _ in range(n)]
+        for condition, compiled, static in self.recommendations:
+            rows = condition(masks).nonzero()[0].tolist()
+            if not rows:
+                continue
+            if static is not None:
+                for i in rows:
+                    recommendations[i].append(static)
+                continue
+            choices = {}
+            for key, value in compiled.items():
+                if isinstance(value, tuple):
+                    choices[key] = (value[0](masks).tolist(), value[1], value[2])
+            for i in rows:
+                item = {}
+                for key, value in compiled.items():
+                    if key in choices:
+                        mask, then, other = choices[key]
+                        value = then if mask[i] else other
+                    item[key] = render(value, i)
+                recommendations[i].append(item)
+
+        # Stable sort keeps rule order within a priority
+        for i in range(n):
+            recommendations[i].sort(key=lambda item: self.priority_order[item['priority']])
+            recommendations[i] = recommendations[i][:self.max_recommendations]
+
+        risk_factors = self._messages(self.risk_factors, masks, n, render)
+        positive_factors = self._messages(self.positive_factors, masks, n, render)
+
+        # First matching override wins, adjustments all stack
+        days = np.full(n, self.base_days)
+        if self.overrides:
+            days = np.select(
+                [condition(masks) for condition, _ in self.overrides],
+                [d for _, d in self.overrides],
+                default=self.base_days
+            )
+        for condition, delta in self.adjustments:
+            days = days + delta * condition(masks)
+        days = np.maximum(self.min_days, days)
+
+        return [
+            {
+                'recommendations': recommendations[i],
+                'risk_factors': risk_factors[i],
+                'positive_factors': positive_factors[i],
+                'estimated_days_to_decision': int(days[i])
+            }
+            for i in range(n)
+        ]
+
+    def _messages(self, rules, masks, n, render):
+        messages = [[] for _ in range(n)]
+        for condition, template in rules:
+            for i in condition(masks).nonzero()[0].tolist():
+                messages[i].append(render(template, i))
+        return messages
+
+
+class RulesEngine:
+    """Hot-reloading holder for the compiled rule table"""
+
+    def __init__(self, path, request_fields, check_interval=1.0):
+        self.path = path
+        self.request_fields = list(request_fields)
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.last_error = None
+        self.rules = self._load()
+        self.mtime = os.path.getmtime(path)
+        self.last_check = time.monotonic()
+
+    def _load(self):
+        with open(self.path) as f:
+            return CompiledRules(json.load(f), self.request_fields)
+
+    def reload(self):
+        """Recompile the rule file; on error keep serving the previous rules"""
+        with self.lock:
+            try:
+                # Remember the attempted version so a broken file is not retried every check
+                self.mtime = os.path.getmtime(self.path)
+                self.rules = self._load()
+                self.last_error = None
+                return True
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Rule reload failed, keeping previous rules: {self.last_error}")
+                return False
+
+    def maybe_reload(self):
+        """Cheap mtime check, at most once per check_interval"""
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        try:
+            changed = os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return
+        if changed:
+            self.reload()
+
+    def evaluate(self, requests, probabilities, request_columns=None):
+        self.maybe_reload()
+        return self.rules.evaluate(requests, probabilities, request_columns)
+
+    def status(self):
+        return {
+            'path': self.path,
+            'loaded_mtime': self.mtime,
+            'recommendation_rules': len(self.rules.recommendations),
+            'risk_rules': len(self.rules.risk_factors),
+            'positive_rules': len(self.rules.positive_factors),
+            'last_error': self.last_error
+        }
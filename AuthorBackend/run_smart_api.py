@@ -1,21 +1,383 @@
 #!/usr/bin/env python3
 """
-Run the smart simulation API server
+Production launcher for the prediction API (api_v2).
+
+The parent process imports api_v2, loads the model artifacts once and binds
+the listening socket, then forks --workers uvicorn workers that all accept
+on that socket. Workers start from the parent's memory, so the boosters,
+encoders and rules are shared copy-on-write instead of being loaded N times
+(gc.freeze() before forking keeps the garbage collector from touching, and
+so copying, those pages). Each worker then runs the normal lifespan
+startup: load_artifacts() is already done, so only the warm-up runs.
+
+LightGBM uses OpenMP, whose thread pool does not survive fork(): a worker
+forked from a parent that ever ran a multi-threaded OpenMP region hangs on
+its first prediction. The parent therefore loads with OMP_NUM_THREADS=1,
+and every prediction in a worker passes num_threads=--threads-per-worker
+(LIGHTGBM_NUM_THREADS), which also keeps N workers from oversubscribing the
+CPUs. --pin-cpus additionally gives each worker its own CPU set.
+
+Signals to the parent:
+    HUP       rolling restart: the parent reloads the model artifacts from
+              disk (e.g. after a retrain), then replaces one worker at a
+              time; each replacement must be ready (warm) before the old
+              one is stopped gracefully
+    USR1      print the per-worker memory report now
+    TERM/INT  graceful shutdown of all workers
+
+Per-worker RSS, PSS (RSS with shared pages split between sharers), shared
+and private memory are logged every --report-interval seconds and written
+to --status-file.
+
+/sessions state lives in the worker that created it; clients that edit a
+form over several requests should use /ws/predict (one connection, one
+worker) when running more than one worker.
+
+    python run_smart_api.py --workers 4 --port 8000
+    python run_smart_api.py --dev            # single process with auto-reload
 """
-import uvicorn
-from test_api_v0 import app
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
 
-if __name__ == "__main__":
-    print("🚀 Starting AuthAI Smart Simulation API...")
-    print("📊 This API provides realistic approval rates based on form completeness")
-    print("🔗 API will be available at: http://localhost:8000")
-    print("📖 API docs at: http://localhost:8000/docs")
-    print("=" * 50)
-    
-    uvicorn.run(
-        "test_api_v0:app", 
-        host="0.0.0.0", 
-        port=8000, 
-        reload=True,
-        log_level="info"
+RESTART_BACKOFF_SECONDS = 1.0
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def process_memory(pid):
+    """RSS/PSS/shared/private MB for a process from /proc (None where unavailable)"""
+    fields = {}
+    for path in (f'/proc/{pid}/smaps_rollup', f'/proc/{pid}/status'):
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    parts = value.split()
+                    if len(parts) == 2 and parts[1] == 'kB':
+                        fields.setdefault(key, int(parts[0]))
+        except OSError:
+            continue
+    if 'Rss' not in fields and 'VmRSS' not in fields:
+        return None
+
+    def mb(*keys):
+        if not any(k in fields for k in keys):
+            return None
+        return round(sum(fields.get(k, 0) for k in keys) / 1024, 1)
+
+    return {
+        'rss_mb': mb('Rss') if 'Rss' in fields else mb('VmRSS'),
+        'pss_mb': mb('Pss'),
+        'shared_mb': mb('Shared_Clean', 'Shared_Dirty'),
+        'private_mb': mb('Private_Clean', 'Private_Dirty'),
+    }
+
+
+class Worker:
+    def __init__(self, index, pid, ready_fd, cpus):
+        self.index = index
+        self.pid = pid
+        self.ready_fd = ready_fd
+        self.cpus = cpus
+        self.started = time.time()
+        self.ready = False
+        self.failed = False
+        self.stopping = False
+
+    def poll_ready(self):
+        """Read the worker's startup result from its pipe without blocking"""
+        if self.ready or self.failed or self.ready_fd is None:
+            return self.ready
+        try:
+            data = os.read(self.ready_fd, 1)
+        except BlockingIOError:
+            return False
+        self.ready = data == b'1'
+        self.failed = not self.ready
+        os.close(self.ready_fd)
+        self.ready_fd = None
+        return self.ready
+
+
+def run_worker(args, sock, ready_fd, cpus):
+    """Child process body: serve api_v2.app on the shared socket until told to stop"""
+    for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+        signal.signal(sig, signal.SIG_DFL)
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+    import uvicorn
+    import api_v2
+
+    # The parent's SQLite connections and audit writer thread do not carry over a fork
+    api_v2.open_stores()
+    api_v2.startup.started = time.time()
+
+    def report_ready():
+        os.write(ready_fd, b'1' if api_v2.startup.wait() else b'0')
+        os.close(ready_fd)
+
+    threading.Thread(target=report_ready, name='ready-notifier', daemon=True).start()
+    config = uvicorn.Config(
+        api_v2.app, log_level=args.log_level, access_log=False,
+        timeout_graceful_shutdown=args.graceful_timeout, timeout_keep_alive=args.keep_alive
     )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Launcher:
+    def __init__(self, args, sock):
+        self.args = args
+        self.sock = sock
+        self.workers = {}
+        self.retired = {}
+        self.restarts = 0
+        self.crashes = 0
+        self.shutting_down = False
+        self.pending_restart = False
+        self.pending_report = False
+        cpus = available_cpus()
+        self.cpu_sets = [
+            cpus[(i * args.threads_per_worker) % len(cpus):][:args.threads_per_worker] or cpus[:1]
+            for i in range(args.workers)
+        ] if args.pin_cpus else [None] * args.workers
+
+    def spawn(self, index):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                run_worker(self.args, self.sock, write_fd, self.cpu_sets[index])
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        worker = Worker(index, pid, read_fd, self.cpu_sets[index])
+        print(f"[launcher] worker {index} started (pid {pid})", flush=True)
+        return worker
+
+    def wait_ready(self, worker, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if worker.poll_ready():
+                return True
+            if worker.failed or self.reap_one(worker.pid, block=False):
+                return False
+            time.sleep(0.05)
+        return False
+
+    def reap_one(self, pid, block):
+        try:
+            done, _ = os.waitpid(pid, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            return True
+        return done == pid
+
+    def stop(self, worker, timeout=None):
+        """SIGTERM (uvicorn finishes in-flight requests), SIGKILL after the timeout"""
+        timeout = self.args.graceful_timeout + 5 if timeout is None else timeout
+        worker.stopping = True
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.reap_one(worker.pid, block=False):
+                return
+            time.sleep(0.05)
+        print(f"[launcher] worker {worker.index} (pid {worker.pid}) did not stop in {timeout}s; killing", flush=True)
+        os.kill(worker.pid, signal.SIGKILL)
+        self.reap_one(worker.pid, block=True)
+
+    def rolling_restart(self):
+        """Reload the artifacts, then replace workers one by one; capacity never drops below --workers"""
+        print("[launcher] rolling restart", flush=True)
+        import api_v2
+        # Replacements are forked from this process, so it must hold the new model first
+        start = time.perf_counter()
+        try:
+            gc.unfreeze()
+            api_v2.reload_artifacts()
+        except Exception as e:
+            print(f"[launcher] reloading the model failed ({e}); keeping the running workers", flush=True)
+            return
+        finally:
+            gc.collect()
+            gc.freeze()
+        print(f"[launcher] model reloaded in {time.perf_counter() - start:.2f}s ({api_v2.MODEL_VERSION})", flush=True)
+        for index in sorted(self.workers):
+            if self.shutting_down:
+                return
+            old = self.workers[index]
+            new = self.spawn(index)
+            if not self.wait_ready(new, self.args.ready_timeout):
+                print(f"[launcher] replacement for worker {index} did not become ready; keeping pid {old.pid}",
+                      flush=True)
+                self.stop(new, timeout=5)
+                return
+            self.workers[index] = new
+            self.stop(old)
+            self.restarts += 1
+            print(f"[launcher] worker {index}: pid {old.pid} -> {new.pid}", flush=True)
+
+    def reap(self):
+        """Respawn workers that exited on their own"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            for index, worker in list(self.workers.items()):
+                if worker.pid == pid and not worker.stopping and not self.shutting_down:
+                    self.crashes += 1
+                    print(f"[launcher] worker {index} (pid {pid}) exited with status {status}; respawning",
+                          flush=True)
+                    if time.time() - worker.started < RESTART_BACKOFF_SECONDS * 5:
+                        time.sleep(RESTART_BACKOFF_SECONDS)
+                    self.workers[index] = self.spawn(index)
+
+    def status(self):
+        workers = []
+        for index in sorted(self.workers):
+            worker = self.workers[index]
+            worker.poll_ready()
+            workers.append({
+                'index': index,
+                'pid': worker.pid,
+                'ready': worker.ready,
+                'uptime_s': round(time.time() - worker.started, 1),
+                'cpus': worker.cpus,
+                **(process_memory(worker.pid) or {})
+            })
+        return {
+            'parent': {'pid': os.getpid(), **(process_memory(os.getpid()) or {})},
+            'threads_per_worker': self.args.threads_per_worker,
+            'rolling_restarts': self.restarts,
+            'crash_restarts': self.crashes,
+            'workers': workers,
+        }
+
+    def report(self):
+        status = self.status()
+        lines = [f"[launcher] memory: parent {status['parent'].get('rss_mb')} MB RSS"]
+        for w in status['workers']:
+            lines.append(
+                f"[launcher]   worker {w['index']} pid {w['pid']:>7} {'ready' if w['ready'] else 'warming':7} "
+                f"RSS {w.get('rss_mb')} MB  PSS {w.get('pss_mb')} MB  "
+                f"shared {w.get('shared_mb')} MB  private {w.get('private_mb')} MB"
+            )
+        print('\n'.join(lines), flush=True)
+        if self.args.status_file:
+            tmp = self.args.status_file + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'updated_at': time.time(), **status}, f, indent=2)
+            os.replace(tmp, self.args.status_file)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, 'pending_restart', True))
+        signal.signal(signal.SIGUSR1, lambda *_: setattr(self, 'pending_report', True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'shutting_down', True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, 'shutting_down', True))
+
+        for index in range(self.args.workers):
+            self.workers[index] = self.spawn(index)
+        next_report = time.monotonic() + self.args.report_interval
+        while not self.shutting_down:
+            time.sleep(0.2)
+            self.reap()
+            if self.pending_restart:
+                self.pending_restart = False
+                self.rolling_restart()
+            if self.pending_report or time.monotonic() >= next_report:
+                self.pending_report = False
+                next_report = time.monotonic() + self.args.report_interval
+                self.report()
+
+        print("[launcher] shutting down", flush=True)
+        for worker in self.workers.values():
+            worker.stopping = True
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for worker in self.workers.values():
+            self.stop(worker)
+
+
+def main():
+    cpus = len(available_cpus())
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=max(1, min(cpus, 4)))
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help='LightGBM threads per prediction (default: CPUs / workers, at least 1)')
+    parser.add_argument('--pin-cpus', action='store_true', help='Give each worker its own CPU set')
+    parser.add_argument('--graceful-timeout', type=int, default=30, help='Seconds to finish in-flight requests')
+    parser.add_argument('--ready-timeout', type=float, default=180, help='Seconds a new worker may take to warm up')
+    parser.add_argument('--keep-alive', type=int, default=5)
+    parser.add_argument('--report-interval', type=float, default=60, help='Seconds between memory reports')
+    parser.add_argument('--status-file', default=None, help='Write per-worker status JSON here')
+    parser.add_argument('--log-level', default='info')
+    parser.add_argument('--dev', action='store_true', help='Single process with auto-reload (development)')
+    args = parser.parse_args()
+    if args.threads_per_worker is None:
+        args.threads_per_worker = max(1, cpus // args.workers)
+
+    if args.dev:
+        import uvicorn
+        uvicorn.run("api_v2:app", host=args.host, port=args.port, reload=True, log_level=args.log_level)
+        return
+
+    print("🚀 Starting AuthAI prediction API...")
+    print(f"📊 {args.workers} worker(s) x {args.threads_per_worker} LightGBM thread(s) on {cpus} CPU(s)")
+    print(f"🔗 API will be available at: http://{args.host}:{args.port}")
+    print(f"📖 API docs at: http://{args.host}:{args.port}/docs")
+    print("=" * 50)
+
+    # Both must be set before LightGBM (and its OpenMP runtime) is loaded
+    os.environ['OMP_NUM_THREADS'] = '1'
+    os.environ['LIGHTGBM_NUM_THREADS'] = str(args.threads_per_worker)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import api_v2
+
+    start = time.perf_counter()
+    api_v2.load_artifacts()
+    print(f"[launcher] model loaded once in the parent in {time.perf_counter() - start:.2f}s ({api_v2.MODEL_VERSION})")
+    # Children open their own SQLite connections and audit writer
+    api_v2.close_stores()
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    Launcher(args, sock).run()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
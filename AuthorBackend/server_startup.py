@@ -0,0 +1,113 @@
+"""
+Startup phases and readiness for the prediction API.
+
+api_v2 imports only what routing needs; model artifacts (and with them
+LightGBM, scikit-learn and pandas) are loaded in the lifespan startup,
+followed by a warm-up that runs representative predictions through every
+scoring path. `StartupState` records how long each phase took and whether
+the server is ready. `ReadinessGate` answers 503 (with Retry-After) for
+every route except liveness/readiness/docs until warm-up is done, so no
+client request is served cold or against half-loaded globals.
+"""
+import json
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+ALWAYS_OPEN_PATHS = ('/health', '/ready', '/docs', '/redoc', '/openapi.json')
+
+
+class StartupState:
+    """Phase timings and the ready flag, shared by the loader and the endpoints"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.phase = 'importing'
+        self.ready = False
+        self.error = None
+        self.started = time.time()
+        self.ready_at = None
+        self.details = {}
+        self.done = threading.Event()
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.phases[name] = round(self.phases.get(name, 0.0) + seconds, 4)
+
+    @contextmanager
+    def stage(self, name):
+        with self.lock:
+            self.phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def run(self, *stages):
+        """Run (name, fn) stages in order, then mark ready; failures are kept for /ready"""
+        try:
+            for name, fn in stages:
+                with self.stage(name):
+                    result = fn()
+                if result is not None:
+                    self.details[name] = result
+        except Exception:
+            with self.lock:
+                self.phase = 'failed'
+                self.error = traceback.format_exc()
+            print(f"Startup failed:\n{self.error}")
+            self.done.set()
+            return False
+        with self.lock:
+            self.phase = 'ready'
+            self.ready = True
+            self.ready_at = time.time()
+        self.done.set()
+        return True
+
+    def wait(self, timeout=None):
+        """Block until startup finished; True if it ended ready"""
+        self.done.wait(timeout)
+        return self.ready
+
+    def report(self):
+        with self.lock:
+            return {
+                'ready': self.ready,
+                'phase': self.phase,
+                'phases_seconds': dict(self.phases),
+                'seconds_to_ready': None if self.ready_at is None else round(self.ready_at - self.started, 3),
+                'details': dict(self.details),
+                'error': self.error
+            }
+
+
+class ReadinessGate:
+    """ASGI middleware: 503 for application routes until StartupState is ready"""
+
+    def __init__(self, app, state, open_paths=ALWAYS_OPEN_PATHS):
+        self.app = app
+        self.state = state
+        self.open_paths = tuple(open_paths)
+
+    async def __call__(self, scope, receive, send):
+        if self.state.ready or scope['type'] not in ('http', 'websocket') or scope['path'] in self.open_paths:
+            return await self.app(scope, receive, send)
+        if scope['type'] == 'websocket':
+            # 1013: try again later
+            await send({'type': 'websocket.close', 'code': 1013})
+            return
+        body = json.dumps({'detail': 'Model is loading', 'phase': self.state.phase}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 503,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', b'1'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,301 @@
+"""
+Similar past cases for the DenialFighter screen.
+
+At training time `SimilarCaseIndex.build` takes the approved cases from the
+engineered training frame and stores one float32 vector per case: each
+feature standardized and weighted by the model's gain importance, so cases
+are close when they agree on what drives approval. Rows are sorted by
+(payer, procedure_category, procedure_code), which makes every payer and
+procedure filter a handful of contiguous row ranges. A search is a blocked
+brute-force scan of those ranges only (one float32 matrix-vector product
+per block, ||x||^2 - 2 x.q kept via argpartition), so memory stays bounded
+and a filtered query touches a small slice of the index. Vectors are stored
+feature-major (one array row per feature): with a few features per case
+the product then streams long contiguous runs, about 2.5x faster than
+case-major rows.
+
+The index is saved as .npy files plus meta.json and loaded memory-mapped,
+so pre-forked API workers share one copy through the page cache.
+
+    python similar_cases.py --build training_data_v2.csv
+    python similar_cases.py --benchmark --rows 2000000
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+INDEX_DIR = 'models/similar_cases'
+
+# Features a prior-auth request actually determines (see api_v2.request_feature_dict);
+# the other model inputs are imputed at serving time and would only add noise.
+# documentation_quality_score is computed differently in training and serving
+# (see drift_monitor.REQUEST_NUMERIC_FEATURES), so distances on it are meaningless
+SIMILARITY_FEATURES = [
+    'patient_age', 'diagnosis_months', 'pt_weeks_completed', 'pain_current',
+    'has_neurological_symptoms', 'uses_failed_conservative', 'uses_medical_necessity',
+    'total_treatments_tried'
+]
+
+GROUP_FIELDS = ['payer', 'procedure_category', 'procedure_code']
+
+# Rows per matrix-vector product; bounds the scratch memory of one search
+BLOCK_ROWS = 1 << 16
+
+
+class SimilarCaseIndex:
+    """Weighted-euclidean k-NN over one outcome's cases with payer/procedure pre-filtering"""
+
+    def __init__(self, vectors, sq_norms, case_ids, meta):
+        self.vectors = vectors
+        self.sq_norms = sq_norms
+        self.case_ids = case_ids
+        self.meta = meta
+        self.features = meta['features']
+        self.mean = np.asarray(meta['mean'], dtype=np.float32)
+        self.scale = np.asarray(meta['scale'], dtype=np.float32)
+        self.weights = np.asarray(meta['weights'], dtype=np.float32)
+        groups = meta['groups']
+        self.group_keys = {field: np.asarray(groups[field], dtype=object) for field in GROUP_FIELDS}
+        self.group_start = np.asarray(groups['start'], dtype=np.int64)
+        self.group_end = np.asarray(groups['end'], dtype=np.int64)
+
+    @classmethod
+    def build(cls, df, importance=None, features=SIMILARITY_FEATURES, outcome=1):
+        """Index the rows of an engineered frame with approved == outcome.
+
+        `importance` is the feature-importance frame from training
+        (feature, importance); without it every feature weighs the same.
+        """
+        features = [col for col in features if col in df.columns]
+        cases = df[df['approved'] == outcome]
+        keys = cases[GROUP_FIELDS].astype(str)
+        order = np.lexsort([keys[field].to_numpy() for field in reversed(GROUP_FIELDS)])
+        keys = keys.iloc[order]
+        X = cases[features].to_numpy(dtype=np.float64)[order]
+
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        weights = np.ones(len(features))
+        if importance is not None:
+            gain = importance.set_index('feature')['importance'].reindex(features).fillna(0).to_numpy()
+            if gain.sum() > 0:
+                # sqrt keeps a dominant feature from drowning out the rest; floor keeps every feature
+                weights = np.sqrt(np.maximum(gain / gain.sum(), 0.01))
+                weights = weights / weights.mean()
+
+        case_ids = cases['case_id'].astype(str).to_numpy()[order]
+        vectors = np.ascontiguousarray(((X - mean) / scale * weights).astype(np.float32).T)
+        starts = np.flatnonzero(np.r_[True, (keys.to_numpy()[1:] != keys.to_numpy()[:-1]).any(axis=1)])
+        ends = np.r_[starts[1:], len(keys)]
+        meta = {
+            'features': features,
+            'mean': mean.tolist(),
+            'scale': scale.tolist(),
+            'weights': weights.tolist(),
+            'outcome': int(outcome),
+            'rows': int(len(case_ids)),
+            'groups': {
+                **{field: keys[field].to_numpy()[starts].tolist() for field in GROUP_FIELDS},
+                'start': starts.tolist(),
+                'end': ends.tolist()
+            }
+        }
+        return cls(vectors, np.einsum('ij,ij->j', vectors, vectors), case_ids.astype(str), meta)
+
+    def save(self, directory=INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'vectors.npy'), self.vectors)
+        np.save(os.path.join(directory, 'sq_norms.npy'), self.sq_norms)
+        np.save(os.path.join(directory, 'case_ids.npy'), self.case_ids)
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f)
+        print(f"Similar-case index ({self.meta['rows']} cases) saved to {directory}/")
+
+    @classmethod
+    def load(cls, directory=INDEX_DIR, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(
+            np.load(os.path.join(directory, 'vectors.npy'), mmap_mode=mode),
+            np.load(os.path.join(directory, 'sq_norms.npy'), mmap_mode=mode),
+            np.load(os.path.join(directory, 'case_ids.npy'), mmap_mode=mode),
+            meta
+        )
+
+    def transform(self, row):
+        """Raw feature values (in self.features order) -> index space"""
+        return ((np.asarray(row, dtype=np.float32) - self.mean) / self.scale * self.weights).astype(np.float32)
+
+    def ranges(self, **filters):
+        """Merged (start, end) row ranges matching the non-None group filters"""
+        mask = np.ones(len(self.group_start), dtype=bool)
+        for field, value in filters.items():
+            if value is not None:
+                mask &= self.group_keys[field] == str(value)
+        starts, ends = self.group_start[mask], self.group_end[mask]
+        merged = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if merged and merged[-1][1] == start:
+                merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        return merged
+
+    def _scan(self, q, ranges, k):
+        """Top-k (row, squared distance - ||q||^2) over row ranges, nearest first"""
+        best_rows = np.empty(0, dtype=np.int64)
+        best_dist = np.empty(0, dtype=np.float32)
+        bound = np.inf
+        for start, end in ranges:
+            for block in range(start, end, BLOCK_ROWS):
+                stop = min(block + BLOCK_ROWS, end)
+                dist = self.sq_norms[block:stop] - 2 * (q @ self.vectors[:, block:stop])
+                # Once k neighbours are known, only rows closer than the k-th can enter
+                top = np.flatnonzero(dist < bound) if bound < np.inf else np.arange(len(dist))
+                if len(top) > k:
+                    top = top[np.argpartition(dist[top], k - 1)[:k]]
+                best_rows = np.r_[best_rows, top + block]
+                best_dist = np.r_[best_dist, dist[top]]
+                if len(best_rows) > k:
+                    keep = np.argpartition(best_dist, k - 1)[:k]
+                    best_rows, best_dist = best_rows[keep], best_dist[keep]
+                if len(best_rows) == k:
+                    bound = best_dist.max()
+        order = np.argsort(best_dist, kind='stable')
+        return best_rows[order], best_dist[order]
+
+    def search(self, row, k=5, payer=None, procedure_category=None, procedure_code=None,
+               exclude_case_id=None, relax=True):
+        """Nearest cases to one raw feature row, filtered by payer and procedure.
+
+        With `relax`, filters are dropped most-specific first (procedure_code,
+        then procedure_category, then payer) until k cases are found; the
+        filters actually applied are returned with the matches.
+        """
+        q = self.transform(row)
+        filters = {'payer': payer, 'procedure_category': procedure_category, 'procedure_code': procedure_code}
+        steps = [dict(filters)]
+        if relax:
+            for field in reversed(GROUP_FIELDS):
+                if filters[field] is not None:
+                    filters[field] = None
+                    steps.append(dict(filters))
+
+        for applied in steps:
+            ranges = self.ranges(**applied)
+            # One extra neighbour in case the query case itself is indexed
+            rows, dist = self._scan(q, ranges, k + (exclude_case_id is not None))
+            if exclude_case_id is not None:
+                keep = self.case_ids[rows] != exclude_case_id
+                rows, dist = rows[keep][:k], dist[keep][:k]
+            if len(rows) >= k or applied is steps[-1]:
+                break
+        distances = np.sqrt(np.maximum(dist + q @ q, 0))
+        return {
+            'filters': {field: value for field, value in applied.items() if value is not None},
+            'relaxed': applied != steps[0],
+            'scanned': int(sum(end - start for start, end in ranges)),
+            'matches': [self._match(row_id, distance, q) for row_id, distance in zip(rows.tolist(), distances.tolist())]
+        }
+
+    def _match(self, row_id, distance, q):
+        group = int(np.searchsorted(self.group_start, row_id, side='right') - 1)
+        vector = np.asarray(self.vectors[:, row_id])
+        values = vector / self.weights * self.scale + self.mean
+        query_values = q / self.weights * self.scale + self.mean
+        # Largest weighted gaps first: what this approved case had that the query lacks
+        gaps = np.argsort(-np.abs(vector - q))[:3]
+        return {
+            'case_id': str(self.case_ids[row_id]),
+            **{field: self.group_keys[field][group] for field in GROUP_FIELDS},
+            'distance': round(distance, 4),
+            'similarity': round(1 / (1 + distance), 4),
+            'features': {name: round(float(value), 2) + 0.0 for name, value in zip(self.features, values)},
+            'differences': [
+                {'feature': self.features[i], 'case': round(float(values[i]), 2) + 0.0,
+                 'query': round(float(query_values[i]), 2) + 0.0}
+                for i in gaps.tolist() if abs(values[i] - query_values[i]) > 1e-6
+            ]
+        }
+
+    def report(self):
+        return {
+            'rows': self.meta['rows'],
+            'features': self.features,
+            'weights': {name: round(w, 3) for name, w in zip(self.features, self.meta['weights'])},
+            'groups': len(self.group_start),
+            'payers': sorted(set(self.group_keys['payer'].tolist()))
+        }
+
+
+def build_from_csv(path, directory=INDEX_DIR):
+    """Rebuild the index from a training CSV with the saved model's feature importance"""
+    import pandas as pd
+    from train_advanced_model import engineer_features, load_training_data
+
+    df = engineer_features(load_training_data(path))
+    importance_path = os.path.join(os.path.dirname(directory), 'feature_importance.csv')
+    importance = pd.read_csv(importance_path) if os.path.exists(importance_path) else None
+    index = SimilarCaseIndex.build(df, importance)
+    index.save(directory)
+    return index
+
+
+def synthetic_index(index, rows, seed=0):
+    """`rows` cases resampled from an index with small jitter, regrouped, for benchmarking"""
+    rng = np.random.default_rng(seed)
+    sample = rng.integers(0, index.meta['rows'], rows)
+    sample.sort()
+    vectors = np.asarray(index.vectors)[:, sample] + rng.normal(0, 0.05, (len(index.features), rows)).astype(np.float32)
+    group_of = np.searchsorted(index.group_start, sample, side='right') - 1
+    starts = np.flatnonzero(np.r_[True, group_of[1:] != group_of[:-1]])
+    meta = dict(index.meta, rows=rows, groups={
+        **{field: [index.group_keys[field][g] for g in group_of[starts].tolist()] for field in GROUP_FIELDS},
+        'start': starts.tolist(),
+        'end': np.r_[starts[1:], rows].tolist()
+    })
+    case_ids = np.char.add('SYN_', np.arange(rows).astype(str))
+    return SimilarCaseIndex(vectors, np.einsum('ij,ij->j', vectors, vectors), case_ids, meta)
+
+
+def benchmark(index, rows, queries=200, k=10):
+    if rows:
+        index = synthetic_index(index, rows)
+    rng = np.random.default_rng(1)
+    print(f"\nTop-{k} search over {index.meta['rows']:,} cases ({len(index.group_start)} payer/procedure groups):")
+    for name, filtered in (('no filter', ()), ('payer', ('payer',)),
+                           ('payer + procedure', ('payer', 'procedure_category', 'procedure_code'))):
+        timings = []
+        for _ in range(queries):
+            row_id = int(rng.integers(0, index.meta['rows']))
+            group = int(np.searchsorted(index.group_start, row_id, side='right') - 1)
+            filters = {field: index.group_keys[field][group] for field in filtered}
+            row = np.asarray(index.vectors[:, row_id]) / index.weights * index.scale + index.mean
+            start = time.perf_counter()
+            result = index.search(row, k=k, relax=False, **filters)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"  {name:20} p50 {np.median(timings):7.2f} ms  p99 {np.percentile(timings, 99):7.2f} ms  "
+              f"(last scanned {result['scanned']:,} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--build', type=str, default=None, help='Training CSV to (re)build the index from')
+    parser.add_argument('--dir', type=str, default=INDEX_DIR, help='Index directory')
+    parser.add_argument('--benchmark', action='store_true', help='Time top-k searches')
+    parser.add_argument('--rows', type=int, default=0,
+                        help='Benchmark on this many synthetic cases resampled from the index')
+    args = parser.parse_args()
+
+    index = build_from_csv(args.build, args.dir) if args.build else SimilarCaseIndex.load(args.dir)
+    if args.benchmark:
+        benchmark(index, args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,231 @@ import json
 import os
 import matplotlib.pyplot as plt
 import seaborn as sns
+import argparse
+import copy
+import re
+import shutil
+import sys
+import time
+import platform
+from contextlib import contextmanager, nullcontext
+from drift_monitor import build_drift_reference, save_drift_reference
+from similar_cases import SimilarCaseIndex
+from model_shards import model_fingerprint
+
+CATEGORICAL_COLUMNS = [
+    'payer', 'procedure_category', 'procedure_code',
+    'primary_diagnosis', 'pain_severity', 'pain_trend',
+    'imaging_findings', 'functional_limitations',
+    'work_status', 'provider_specialty', 'age_category',
+    'submission_day_of_week', 'quarter'
+]
+
+BOOLEAN_FEATURES = [
+    'pain_documented_consistently', 'has_neurological_symptoms',
+    'uses_medical_necessity', 'uses_failed_conservative',
+    'uses_quality_of_life', 'uses_activities_daily_living',
+    'cites_medical_literature', 'includes_objective_findings',
+    'includes_imaging_results'
+]
+
+# Compact dtypes for the training CSV; unlisted columns keep pandas defaults
+TRAINING_DTYPES = {
+    'patient_age': np.int8,
+    'diagnosis_months': np.uint16,
+    'pain_initial': np.int8,
+    'pain_current': np.int8,
+    'pain_average': np.float32,
+    'pain_max': np.int8,
+    'letter_word_count': np.uint16,
+    'documentation_completeness': np.float32,
+    'previous_denials': np.int8,
+    'appeals_attempted': np.int8,
+    'days_since_symptom_onset': np.uint16,
+    'days_since_last_treatment': np.uint16,
+    'days_before_surgery': np.float32,
+    'approved': np.int8,
+    'patient_gender': 'category',
+    'payer': 'category',
+    'procedure_category': 'category',
+    'procedure_code': 'category',
+    'primary_diagnosis': 'category',
+    'pain_trend': 'category',
+    'imaging_findings': 'category',
+    'functional_limitations': 'category',
+    'work_status': 'category',
+    'submission_day_of_week': 'category',
+    'submission_time_of_day': 'category',
+    'quarter': 'category',
+    'provider_specialty': 'category',
+    'denial_reason': 'category',
+    # Few distinct histories, so the text parsing below runs once per category
+    'treatment_history': 'category',
+    **{col: bool for col in BOOLEAN_FEATURES}
+}
+
+# Per-run stage timings/memory, written next to model_config.json
+TRAINING_REPORT_FILE = 'training_report.json'
+TRAINING_HISTORY_FILE = 'training_history.jsonl'
+
+# Advanced LightGBM parameters (shared with distributed_training)
+MODEL_PARAMS = {
+    'objective': 'binary',
+    'metric': 'binary_logloss',
+    'boosting_type': 'gbdt',
+    'num_leaves': 63,
+    'max_depth': 8,
+    'learning_rate': 0.02,
+    'feature_fraction': 0.7,
+    'bagging_fraction': 0.7,
+    'bagging_freq': 5,
+    'min_data_in_leaf': 20,
+    'min_gain_to_split': 0.001,
+    'lambda_l1': 0.1,
+    'lambda_l2': 0.1,
+    'verbose': -1,
+    'random_state': 42,
+    'n_jobs': -1
+}
+
+# api_v2 serves from MODELS_DIR; a candidate that fails the performance gate goes to STAGING_DIR
+MODELS_DIR = 'models'
+STAGING_DIR = 'models/staging'
+DEPLOYED_MODEL_PATH = os.path.join(MODELS_DIR, 'advanced_approval_model.pkl')
+
+def rss_mb(field):
+    """VmRSS/VmHWM from /proc in MB (None where unavailable)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss():
+    """Start a new VmHWM measurement (Linux; a no-op elsewhere)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+class RunReport:
+    """Wall time, CPU time, peak RSS and rows/sec per pipeline stage.
+
+    Stages can nest (e.g. 'dataset' and 'train' inside 'model'); the peak
+    RSS of an outer stage includes its inner stages even though each stage
+    resets the kernel's high-water mark when it starts.
+    """
+
+    def __init__(self, mode, **meta):
+        self.meta = {
+            'mode': mode,
+            'started_at': pd.Timestamp.now().isoformat(),
+            'python': platform.python_version(),
+            'lightgbm': lgb.__version__,
+            'pandas': pd.__version__,
+            'cpus': len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count(),
+            **meta
+        }
+        self.stages = []
+        self.stack = []
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    @contextmanager
+    def stage(self, name, rows=None, df=None):
+        """Measure one stage; the yielded dict takes 'rows' (or extra fields) set inside"""
+        if self.stack:
+            parent = self.stack[-1]
+            parent['_peak'] = max(parent['_peak'], rss_mb('VmHWM') or 0)
+        reset_peak_rss()
+        entry = {'stage': name, 'depth': len(self.stack), 'rows': rows, '_peak': 0}
+        self.stages.append(entry)
+        self.stack.append(entry)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield entry
+        finally:
+            entry['wall_s'] = round(time.perf_counter() - wall, 3)
+            entry['cpu_s'] = round(time.process_time() - cpu, 3)
+            peak = max(entry.pop('_peak'), rss_mb('VmHWM') or 0)
+            entry['peak_rss_mb'] = round(peak, 1) if peak else None
+            if df is not None:
+                entry['frame_mb'] = round(df.memory_usage(deep=True).sum() / 2**20, 1)
+            if entry['rows']:
+                entry['rows_per_s'] = round(entry['rows'] / entry['wall_s']) if entry['wall_s'] else None
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1]['_peak'] = max(self.stack[-1]['_peak'], peak)
+            self._print(entry)
+
+    def _print(self, entry):
+        parts = [f"{entry['wall_s']:.1f}s wall", f"{entry['cpu_s']:.1f}s CPU"]
+        if entry['peak_rss_mb'] is not None:
+            parts.append(f"peak RSS {entry['peak_rss_mb']:,.0f} MB")
+        if 'frame_mb' in entry:
+            parts.append(f"frame {entry['frame_mb']:,.0f} MB")
+        if entry.get('rows_per_s'):
+            parts.append(f"{entry['rows_per_s']:,} rows/s")
+        print(f"  [stage] {'  ' * entry['depth']}{entry['stage']}: {', '.join(parts)}")
+
+    def to_dict(self):
+        top = [e for e in self.stages if e['depth'] == 0]
+        peaks = [e['peak_rss_mb'] for e in top if e.get('peak_rss_mb') is not None]
+        return {
+            **self.meta,
+            'total_wall_s': round(time.perf_counter() - self.wall_start, 3),
+            'total_cpu_s': round(time.process_time() - self.cpu_start, 3),
+            'peak_rss_mb': max(peaks) if peaks else None,
+            'stages': self.stages
+        }
+
+    def save(self, directory=MODELS_DIR):
+        """training_report.json next to this run's artifacts, plus one line in models/training_history.jsonl.
+
+        A run that saved no artifacts (directory None) is only logged to the history.
+        """
+        os.makedirs(MODELS_DIR, exist_ok=True)
+        report = self.to_dict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, TRAINING_REPORT_FILE), 'w') as f:
+                json.dump(report, f, indent=2, default=str)
+        # Staged and refused runs are logged too, so the history stays in one place
+        with open(os.path.join(MODELS_DIR, TRAINING_HISTORY_FILE), 'a') as f:
+            f.write(json.dumps(report, default=str) + '\n')
+        saved_to = os.path.join(directory, TRAINING_REPORT_FILE) if directory else os.path.join(MODELS_DIR, TRAINING_HISTORY_FILE)
+        print(f"Run report saved to {saved_to}")
+        return report
+
+def report_stage(report, name, **kwargs):
+    """report.stage(...) or, without a report, a context that measures nothing"""
+    return report.stage(name, **kwargs) if report is not None else nullcontext({})
+
+def load_training_data(path):
+    """Read a training CSV straight into compact dtypes"""
+    header = pd.read_csv(path, nrows=0).columns
+    return pd.read_csv(path, dtype={col: dtype for col, dtype in TRAINING_DTYPES.items() if col in header})
+
+def encode_categorical(values):
+    """LabelEncoder fit_transform over the column's categories, not every row
+
+    Produces the same classes_ and codes as fitting on values.astype(str).
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype('category')
+    names = np.asarray(values.cat.categories.astype(str), dtype=object)
+    codes = values.cat.codes.to_numpy()
+    if (codes < 0).any():
+        names = np.append(names, 'nan')
+        codes = np.where(codes < 0, len(names) - 1, codes)
+    classes, remap = np.unique(names, return_inverse=True)
+    le = LabelEncoder()
+    le.classes_ = classes
+    return le, remap.astype(np.int16)[codes]
 
 def extract_treatment_features(df):
     """Extract features from treatment history text"""
@@ -23,7 +248,7 @@ def extract_treatment_features(df):
     ]
     
     for treatment in treatment_types:
-        df[f'tried_{treatment}'] = df['treatment_history'].str.contains(treatment).astype(int)
+        df[f'tried_{treatment}'] = df['treatment_history'].str.contains(treatment).astype(np.int8)
     
     # Extract PT weeks specifically
     def get_pt_weeks(history):
@@ -37,17 +262,17 @@ def extract_treatment_features(df):
         except:
             return 0
     
-    df['pt_weeks_completed'] = df['treatment_history'].apply(get_pt_weeks)
+    df['pt_weeks_completed'] = df['treatment_history'].apply(get_pt_weeks).astype(np.int8)
     
     # Count total treatments
     df['total_treatments_tried'] = df['treatment_history'].apply(
         lambda x: len(x.split('|')) if x != 'none' else 0
-    )
+    ).astype(np.int8)
     
     # Treatment diversity
     df['treatment_diversity'] = df['treatment_history'].apply(
         lambda x: len(set([t.split('_')[0] for t in x.split('|')])) if x != 'none' else 0
-    )
+    ).astype(np.int8)
     
     return df
 
@@ -64,7 +289,7 @@ def engineer_features(df):
         'uses_quality_of_life', 'uses_activities_daily_living',
         'cites_medical_literature', 'includes_objective_findings'
     ]
-    df['documentation_quality_score'] = df[doc_features].sum(axis=1) / len(doc_features)
+    df['documentation_quality_score'] = (df[doc_features].sum(axis=1) / len(doc_features)).astype(np.float32)
     
     # Pain severity category
     df['pain_severity'] = pd.cut(
@@ -74,14 +299,14 @@ def engineer_features(df):
     )
     
     # Chronicity flag
-    df['is_chronic'] = (df['diagnosis_months'] >= 3).astype(int)
+    df['is_chronic'] = (df['diagnosis_months'] >= 3).astype(np.int8)
     
     # Complete conservative treatment flag
     df['complete_conservative'] = (
         (df['pt_weeks_completed'] >= 6) &
         (df['tried_prescription_nsaids'] == 1) &
         (df['total_treatments_tried'] >= 3)
-    ).astype(int)
+    ).astype(np.int8)
     
     # Work impact severity
     work_impact_map = {
@@ -91,27 +316,28 @@ def engineer_features(df):
         'retired': 0,
         'unemployed': 0
     }
-    df['work_impact_score'] = df['work_status'].map(work_impact_map)
+    # Unknown statuses stay NaN, as before
+    df['work_impact_score'] = df['work_status'].astype(object).map(work_impact_map).astype(np.float32)
     
     # Imaging-clinical correlation
     df['imaging_symptoms_match'] = (
         ((df['imaging_findings'] == 'severe') & (df['pain_current'] >= 8)) |
         ((df['imaging_findings'] == 'moderate') & (df['pain_current'] >= 6)) |
         ((df['imaging_findings'] == 'mild') & (df['pain_current'] >= 4))
-    ).astype(int)
+    ).astype(np.int8)
     
     # Red flags combination
     df['red_flags'] = (
-        df['has_neurological_symptoms'].astype(int) +
-        (df['pain_trend'] == 'worsening').astype(int) +
-        (df['functional_limitations'] == 'severe').astype(int)
+        df['has_neurological_symptoms'].astype(np.int8) +
+        (df['pain_trend'] == 'worsening').astype(np.int8) +
+        (df['functional_limitations'] == 'severe').astype(np.int8)
     )
     
     # Friday submission flag
-    df['is_friday'] = (df['submission_day_of_week'] == 'Friday').astype(int)
+    df['is_friday'] = (df['submission_day_of_week'] == 'Friday').astype(np.int8)
     
     # End of year flag
-    df['is_q4'] = (df['quarter'] == 'Q4').astype(int)
+    df['is_q4'] = (df['quarter'] == 'Q4').astype(np.int8)
     
     # Age categories
     df['age_category'] = pd.cut(
@@ -120,41 +346,34 @@ def engineer_features(df):
         labels=['young', 'middle', 'elderly']
     )
     
-    # Interaction features
-    df['pt_weeks_x_pain'] = df['pt_weeks_completed'] * df['pain_current']
+    # Interaction features (int16 so int8 products cannot overflow)
+    df['pt_weeks_x_pain'] = df['pt_weeks_completed'].astype(np.int16) * df['pain_current']
     df['documentation_x_treatments'] = df['documentation_quality_score'] * df['total_treatments_tried']
-    df['chronic_x_severe'] = df['is_chronic'] * (df['pain_current'] >= 7).astype(int)
+    df['chronic_x_severe'] = df['is_chronic'] * (df['pain_current'] >= 7).astype(np.int8)
     
     return df
 
-def prepare_model_data(df):
+def prepare_model_data(df, report=None):
     """Prepare data for model training"""
     print("Preparing data for model...")
     
     # Engineer features
-    df = engineer_features(df)
+    with report_stage(report, 'engineer_features', rows=len(df)):
+        df = engineer_features(df)
     
     # Encode categorical variables
     label_encoders = {}
-    categorical_columns = [
-        'payer', 'procedure_category', 'procedure_code',
-        'primary_diagnosis', 'pain_severity', 'pain_trend',
-        'imaging_findings', 'functional_limitations',
-        'work_status', 'provider_specialty', 'age_category',
-        'submission_day_of_week', 'quarter'
-    ]
     
-    for col in categorical_columns:
-        if col in df.columns:
-            le = LabelEncoder()
-            df[f'{col}_encoded'] = le.fit_transform(df[col].astype(str))
-            label_encoders[col] = le
+    with report_stage(report, 'encoding', rows=len(df)):
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                label_encoders[col], df[f'{col}_encoded'] = encode_categorical(df[col])
     
     # Select features for model
     feature_cols = []
     
     # Encoded categorical features
-    for col in categorical_columns:
+    for col in CATEGORICAL_COLUMNS:
         if f'{col}_encoded' in df.columns:
             feature_cols.append(f'{col}_encoded')
     
@@ -172,13 +391,7 @@ def prepare_model_data(df):
     ]
     
     # Boolean features
-    boolean_features = [
-        'pain_documented_consistently', 'has_neurological_symptoms',
-        'uses_medical_necessity', 'uses_failed_conservative',
-        'uses_quality_of_life', 'uses_activities_daily_living',
-        'cites_medical_literature', 'includes_objective_findings',
-        'includes_imaging_results'
-    ]
+    boolean_features = BOOLEAN_FEATURES
     
     # Treatment flags
     treatment_flags = [col for col in df.columns if col.startswith('tried_')]
@@ -191,73 +404,60 @@ def prepare_model_data(df):
     # Convert booleans to int
     for col in boolean_features:
         if col in df.columns:
-            df[col] = df[col].astype(int)
+            df[col] = df[col].astype(np.int8)
     
     # Remove any features not in dataframe
     feature_cols = [col for col in feature_cols if col in df.columns]
     
     return df, feature_cols, label_encoders
 
-def train_advanced_model(df, feature_cols):
+def train_advanced_model(df, feature_cols, report=None):
     """Train the advanced LightGBM model"""
     print("\n" + "="*60)
     print("TRAINING ADVANCED ML MODEL")
     print("="*60)
     
-    # Prepare data
-    X = df[feature_cols]
+    # Split row positions, then gather only the feature columns for each side
     y = df['approved']
-    
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
+    train_idx, test_idx = train_test_split(
+        np.arange(len(df)), test_size=0.2, random_state=42, stratify=y
     )
+    cols = df.columns.get_indexer(feature_cols)
+    X_train, X_test = df.iloc[train_idx, cols], df.iloc[test_idx, cols]
+    y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
     
     print(f"\nData Split:")
     print(f"  Training: {len(X_train)} cases")
     print(f"  Testing: {len(X_test)} cases")
     print(f"  Features: {len(feature_cols)}")
     
-    # Advanced LightGBM parameters
-    params = {
-        'objective': 'binary',
-        'metric': 'binary_logloss',
-        'boosting_type': 'gbdt',
-        'num_leaves': 63,
-        'max_depth': 8,
-        'learning_rate': 0.02,
-        'feature_fraction': 0.7,
-        'bagging_fraction': 0.7,
-        'bagging_freq': 5,
-        'min_data_in_leaf': 20,
-        'min_gain_to_split': 0.001,
-        'lambda_l1': 0.1,
-        'lambda_l2': 0.1,
-        'verbose': -1,
-        'random_state': 42,
-        'n_jobs': -1
-    }
+    params = dict(MODEL_PARAMS)
     
-    # Create datasets
-    train_data = lgb.Dataset(X_train, label=y_train)
-    valid_data = lgb.Dataset(X_test, label=y_test, reference=train_data)
+    # Create datasets (binned here rather than lazily inside lgb.train, so it is timed on its own)
+    with report_stage(report, 'dataset', rows=len(df)):
+        train_data = lgb.Dataset(X_train, label=y_train, params=params).construct()
+        valid_data = lgb.Dataset(X_test, label=y_test, reference=train_data).construct()
     
     # Train model
     print("\nTraining model...")
-    model = lgb.train(
-        params,
-        train_data,
-        valid_sets=[valid_data],
-        num_boost_round=500,
-        callbacks=[
-            lgb.early_stopping(50),
-            lgb.log_evaluation(100)
-        ]
-    )
+    with report_stage(report, 'boosting', rows=len(X_train)) as stage:
+        model = lgb.train(
+            params,
+            train_data,
+            valid_sets=[valid_data],
+            num_boost_round=500,
+            callbacks=[
+                lgb.early_stopping(50),
+                lgb.log_evaluation(100)
+            ]
+        )
+        stage['trees'] = model.num_trees()
+        stage['best_iteration'] = model.best_iteration
     
     # Make predictions
-    train_pred = model.predict(X_train, num_iteration=model.best_iteration)
-    test_pred = model.predict(X_test, num_iteration=model.best_iteration)
+    with report_stage(report, 'predict', rows=len(df)):
+        train_pred = model.predict(X_train, num_iteration=model.best_iteration)
+        test_pred = model.predict(X_test, num_iteration=model.best_iteration)
     
     # Calculate metrics
     train_auc = roc_auc_score(y_train, train_pred)
@@ -267,6 +467,8 @@ def train_advanced_model(df, feature_cols):
     print(f"  Training AUC: {train_auc:.4f}")
     print(f"  Test AUC: {test_auc:.4f}")
     print(f"  Overfitting: {(train_auc - test_auc):.4f}")
+    if report is not None:
+        report.meta.update({'train_auc': round(train_auc, 4), 'test_auc': round(test_auc, 4)})
     
     # Classification report
     test_pred_binary = (test_pred >= 0.5).astype(int)
@@ -284,6 +486,66 @@ def train_advanced_model(df, feature_cols):
     
     return model, X_train, X_test, y_test, test_pred
 
+def train_denial_reason_model(df, feature_cols):
+    """Train a multiclass model of why denied cases were denied"""
+    print("\n" + "="*60)
+    print("TRAINING DENIAL REASON MODEL")
+    print("="*60)
+    
+    denied_mask = ((df['approved'] == 0) & (df['denial_reason'] != 'none')).to_numpy()
+    reason_encoder = LabelEncoder()
+    y = reason_encoder.fit_transform(df['denial_reason'].to_numpy()[denied_mask].astype(str))
+    denial_reasons = reason_encoder.classes_.tolist()
+    
+    X_train, X_test, y_train, y_test = train_test_split(
+        df.loc[denied_mask, feature_cols], y, test_size=0.2, random_state=42, stratify=y
+    )
+    
+    print(f"\n  Denied cases: {len(y)} ({len(denial_reasons)} reasons)")
+    
+    params = {
+        'objective': 'multiclass',
+        'num_class': len(denial_reasons),
+        'metric': 'multi_logloss',
+        'num_leaves': 15,
+        'max_depth': 6,
+        'learning_rate': 0.05,
+        'feature_fraction': 0.7,
+        'bagging_fraction': 0.8,
+        'bagging_freq': 5,
+        'min_data_in_leaf': 20,
+        'lambda_l2': 1.0,
+        'verbose': -1,
+        'random_state': 42,
+        'n_jobs': -1
+    }
+    
+    train_data = lgb.Dataset(X_train, label=y_train)
+    valid_data = lgb.Dataset(X_test, label=y_test, reference=train_data)
+    
+    model = lgb.train(
+        params,
+        train_data,
+        valid_sets=[valid_data],
+        num_boost_round=300,
+        callbacks=[
+            lgb.early_stopping(30),
+            lgb.log_evaluation(100)
+        ]
+    )
+    
+    test_pred = model.predict(X_test, num_iteration=model.best_iteration)
+    ranked = np.argsort(-test_pred, axis=1)
+    top1 = (ranked[:, 0] == y_test).mean()
+    top2 = (ranked[:, :2] == y_test[:, None]).any(axis=1).mean()
+    baseline = np.bincount(y_train).max() / len(y_train)
+    
+    print(f"\nDenial Reason Model Performance:")
+    print(f"  Top-1 accuracy: {top1:.2%} (majority baseline {baseline:.2%})")
+    print(f"  Top-2 accuracy: {top2:.2%}")
+    
+    return model, denial_reasons
+
 def analyze_model_insights(model, feature_cols, df, label_encoders):
     """Analyze what the model learned"""
     print("\n" + "="*60)
@@ -401,9 +663,10 @@ def analyze_model_insights(model, feature_cols, df, label_encoders):
     
     return importance_df
 
-def save_model_artifacts(model, label_encoders, feature_cols, importance_df):
+def save_model_artifacts(model, label_encoders, feature_cols, importance_df, extra_config=None,
+                         denial_model=None, denial_reasons=None, directory=MODELS_DIR):
     """Save all model artifacts"""
-    os.makedirs('models', exist_ok=True)
+    os.makedirs(directory, exist_ok=True)
     
     artifacts = {
         'model': model,
@@ -412,10 +675,15 @@ def save_model_artifacts(model, label_encoders, feature_cols, importance_df):
         'feature_importance': importance_df.to_dict()
     }
     
-    joblib.dump(artifacts, 'models/advanced_approval_model.pkl')
+    # Denial-reason model shares feature_cols so serving builds features once
+    if denial_model is not None:
+        artifacts['denial_model'] = denial_model
+        artifacts['denial_reasons'] = denial_reasons
+    
+    joblib.dump(artifacts, os.path.join(directory, 'advanced_approval_model.pkl'))
     
     # Save feature importance separately
-    importance_df.to_csv('models/feature_importance.csv', index=False)
+    importance_df.to_csv(os.path.join(directory, 'feature_importance.csv'), index=False)
     
     # Save model config
     config = {
@@ -425,37 +693,836 @@ def save_model_artifacts(model, label_encoders, feature_cols, importance_df):
         'n_features': len(feature_cols),
         'training_date': pd.Timestamp.now().isoformat()
     }
+    if denial_model is not None:
+        config['denial_reasons'] = denial_reasons
+    if extra_config:
+        config.update(extra_config)
     
-    with open('models/model_config.json', 'w') as f:
+    with open(os.path.join(directory, 'model_config.json'), 'w') as f:
         json.dump(config, f, indent=2)
     
-    print("\nModel artifacts saved to models/")
+    print(f"\nModel artifacts saved to {directory}/")
 
-if __name__ == "__main__":
+def measure_latency(model, X, single_rows=200, batch_rows=10000):
+    """Median single-row and per-row batch prediction latency in microseconds"""
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    num_iteration = model.best_iteration or None
+    
+    timings = []
+    for i in range(single_rows):
+        row = X[i % len(X)].reshape(1, -1)
+        start = time.perf_counter()
+        model.predict(row, num_iteration=num_iteration)
+        timings.append(time.perf_counter() - start)
+    
+    batch = np.resize(X, (batch_rows, X.shape[1]))
+    start = time.perf_counter()
+    model.predict(batch, num_iteration=num_iteration)
+    batch_seconds = time.perf_counter() - start
+    
+    return float(np.median(timings) * 1e6), batch_seconds / batch_rows * 1e6
+
+def paired_latency_ratio(model, X, reference, X_reference, calls=2000, batch_rows=2000, batches=20):
+    """Median single-row and batch latency of `model` relative to `reference`.
+
+    The two models are timed back to back on the same row index, in an order
+    that alternates every call, and the ratio of each pair is kept, so drift
+    in machine load affects both sides of a pair alike.
+    """
+    sides = [(booster, np.ascontiguousarray(rows, dtype=np.float64), booster.best_iteration or None)
+             for booster, rows in ((model, X), (reference, X_reference))]
+    
+    def median_ratio(n, take):
+        ratios = []
+        for i in range(n):
+            seconds = [0.0, 0.0]
+            for side in ((0, 1) if i % 2 == 0 else (1, 0)):
+                booster, rows, num_iteration = sides[side]
+                rows = take(rows, i)
+                start = time.perf_counter()
+                booster.predict(rows, num_iteration=num_iteration)
+                seconds[side] = time.perf_counter() - start
+            ratios.append(seconds[0] / seconds[1])
+        return float(np.median(ratios))
+    
+    single = median_ratio(calls, lambda rows, i: rows[i % len(rows)].reshape(1, -1))
+    batch = median_ratio(batches, lambda rows, i: np.resize(np.roll(rows, -i, axis=0), (batch_rows, rows.shape[1])))
+    return single, batch
+
+def describe_candidate(name, model, features, X_test, y_test):
+    """AUC, latency and size for one serving candidate"""
+    X = X_test[features].to_numpy(dtype=np.float64)
+    pred = model.predict(X, num_iteration=model.best_iteration or None)
+    single_us, batch_us = measure_latency(model, X)
+    return {
+        'name': name,
+        'auc': float(roc_auc_score(y_test, pred)),
+        'n_features': len(features),
+        'n_trees': model.best_iteration or model.num_trees(),
+        'num_leaves': model.params.get('num_leaves'),
+        'size_bytes': len(model.model_to_string(num_iteration=model.best_iteration or None).encode()),
+        'single_row_us': round(single_us, 1),
+        'batch_us_per_row': round(batch_us, 3),
+        'features': list(features)
+    }
+
+def serving_profile(model, features, df):
+    """AUC, trees, size and latency of one model on prepared, labelled rows"""
+    X = df[features].to_numpy(dtype=np.float64)
+    _, auc, logloss = score_validation(model, df[features], df['approved'])
+    single_us, batch_us = measure_latency(model, X)
+    return {
+        'auc': None if auc is None else round(float(auc), 4),
+        'logloss': round(logloss, 4),
+        'n_features': len(features),
+        # Boosters loaded from a model file report best_iteration -1
+        'n_trees': model.best_iteration if model.best_iteration > 0 else model.num_trees(),
+        'size_bytes': len(model.model_to_string(num_iteration=model.best_iteration or None).encode()),
+        'single_row_us': round(single_us, 1),
+        'batch_us_per_row': round(batch_us, 3)
+    }
+
+def load_deployed_artifacts(path=DEPLOYED_MODEL_PATH):
+    return joblib.load(path) if os.path.exists(path) else None
+
+def performance_gate(model, feature_cols, df_eval, deployed, max_latency_increase=0.25,
+                     max_size_increase=0.5, max_auc_drop=None, latency_calls=2000):
+    """Compare a candidate with the deployed artifact against latency, size and AUC budgets.
+
+    Both models are profiled on the same rows. Latency changes are the median
+    of `latency_calls` paired candidate/deployed timings, and only count as a
+    regression beyond the budget plus the noise floor, measured by pairing
+    the deployed model with itself. Increases are relative to the deployed
+    model and a budget of None only reports the metric.
+    The deployed model sees the rows re-encoded with its own label encoders,
+    since a retrain may assign different codes to the same categories.
+    """
+    print("\n" + "="*60)
+    print("PERFORMANCE GATE")
+    print("="*60)
+    
+    gate = {
+        'budgets': {
+            'max_latency_increase': max_latency_increase,
+            'max_size_increase': max_size_increase,
+            'max_auc_drop': max_auc_drop
+        },
+        'eval_rows': len(df_eval),
+        'candidate': None,
+        'deployed': None,
+        'changes': {},
+        'regressions': [],
+        'passed': True,
+        'date': pd.Timestamp.now().isoformat()
+    }
+    
+    entries = [('candidate', model, feature_cols, df_eval)]
+    if deployed is None:
+        gate['note'] = 'No deployed model to compare against'
+    elif any(col not in df_eval.columns for col in deployed['feature_cols']):
+        gate['note'] = 'Deployed model uses features these rows do not have'
+    else:
+        # Encoders are copied: unseen categories would otherwise be appended to the deployed ones
+        deployed_eval, _ = encode_with_saved_encoders(df_eval.copy(), copy.deepcopy(deployed['label_encoders']))
+        entries.append(('deployed', deployed['model'], deployed['feature_cols'], deployed_eval))
+    
+    for name, booster, features, rows in entries:
+        gate[name] = serving_profile(booster, features, rows)
+    
+    candidate, previous = gate['candidate'], gate['deployed']
+    if previous is None:
+        print(f"  {gate['note']}; candidate: {candidate['n_trees']} trees, {candidate['size_bytes'] / 1024:.0f} KB, "
+              f"{candidate['single_row_us']:.0f} us/row single")
+        return gate
+    
+    (_, cand_model, cand_features, cand_rows), (_, dep_model, dep_features, dep_rows) = entries
+    X_cand = cand_rows[cand_features].to_numpy(dtype=np.float64)
+    X_dep = dep_rows[dep_features].to_numpy(dtype=np.float64)
+    latency = paired_latency_ratio(cand_model, X_cand, dep_model, X_dep, calls=latency_calls)
+    self_latency = paired_latency_ratio(dep_model, X_dep, dep_model, X_dep, calls=latency_calls)
+    noise = {'single_row_us': abs(self_latency[0] - 1), 'batch_us_per_row': abs(self_latency[1] - 1)}
+    gate['latency_noise'] = {metric: round(value, 4) for metric, value in noise.items()}
+    
+    print(f"  {'':18} {'deployed':>12} {'candidate':>12} {'change':>9}")
+    budgets = {'single_row_us': max_latency_increase, 'batch_us_per_row': max_latency_increase,
+               'size_bytes': max_size_increase, 'n_trees': None}
+    paired = {'single_row_us': latency[0] - 1, 'batch_us_per_row': latency[1] - 1}
+    for metric, budget in budgets.items():
+        before, after = previous[metric], candidate[metric]
+        change = paired[metric] if metric in paired else (after / before - 1 if before else 0.0)
+        gate['changes'][metric] = round(change, 4)
+        limit = None if budget is None else budget + noise.get(metric, 0.0)
+        exceeded = limit is not None and change > limit
+        if exceeded:
+            gate['regressions'].append(f"{metric} {before} -> {after} ({change:+.0%}, budget {budget:+.0%}"
+                                       + (f" + noise {noise[metric]:.0%})" if metric in noise else ")"))
+        print(f"  {metric:18} {before:>12,} {after:>12,} {change:>+8.1%}{'  OVER BUDGET' if exceeded else ''}")
+    print(f"  Latency changes are paired medians over {latency_calls} calls; noise floor "
+          f"{noise['single_row_us']:.1%} single, {noise['batch_us_per_row']:.1%} batch")
+    
+    if candidate['auc'] is not None and previous['auc'] is not None:
+        drop = previous['auc'] - candidate['auc']
+        gate['changes']['auc'] = round(-drop, 4)
+        exceeded = max_auc_drop is not None and drop > max_auc_drop
+        if exceeded:
+            gate['regressions'].append(f"auc {previous['auc']} -> {candidate['auc']} (budget -{max_auc_drop})")
+        print(f"  {'auc':18} {previous['auc']:>12.4f} {candidate['auc']:>12.4f} {-drop:>+9.4f}"
+              f"{'  OVER BUDGET' if exceeded else ''}")
+    
+    gate['passed'] = not gate['regressions']
+    print(f"\n  Gate {'passed' if gate['passed'] else 'FAILED: ' + '; '.join(gate['regressions'])}")
+    return gate
+
+def gate_target(gate, on_regression):
+    """Where to save a gated candidate: MODELS_DIR, STAGING_DIR, or None when it is refused"""
+    if gate['passed']:
+        gate['action'] = 'deployed'
+    elif on_regression == 'force':
+        gate['action'] = 'forced'
+    elif on_regression == 'stage':
+        gate['action'] = 'staged'
+    else:
+        gate['action'] = 'refused'
+    if gate['action'] == 'staged':
+        # Do not leave artifacts of an earlier staged candidate mixed in with this one
+        shutil.rmtree(STAGING_DIR, ignore_errors=True)
+        print(f"  Candidate written to {STAGING_DIR}/ instead of {MODELS_DIR}/ (promote with --promote-staged)")
+        return STAGING_DIR
+    if gate['action'] == 'refused':
+        print(f"  Candidate refused; {MODELS_DIR}/ left unchanged")
+        return None
+    return MODELS_DIR
+
+def promote_staged():
+    """Move a staged candidate into MODELS_DIR, replacing the deployed artifacts"""
+    if not os.path.exists(os.path.join(STAGING_DIR, 'model_config.json')):
+        raise SystemExit(f"No staged model in {STAGING_DIR}/")
+    for name in os.listdir(STAGING_DIR):
+        target = os.path.join(MODELS_DIR, name)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.replace(os.path.join(STAGING_DIR, name), target)
+    os.rmdir(STAGING_DIR)
+    
+    config_path = os.path.join(MODELS_DIR, 'model_config.json')
+    with open(config_path) as f:
+        config = json.load(f)
+    if config.get('performance_gate'):
+        config['performance_gate']['promoted_at'] = pd.Timestamp.now().isoformat()
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"Staged model promoted to {MODELS_DIR}/")
+
+def fit_candidate(params, X_train, y_train, X_test, y_test, num_boost_round):
+    train_data = lgb.Dataset(X_train, label=y_train)
+    valid_data = lgb.Dataset(X_test, label=y_test, reference=train_data)
+    return lgb.train(
+        params,
+        train_data,
+        valid_sets=[valid_data],
+        num_boost_round=num_boost_round,
+        callbacks=[lgb.early_stopping(30, verbose=False)]
+    )
+
+def selection_split(y, test_idx):
+    """Halve the held-out rows: (rows for early stopping and model selection, rows for the reported metrics)"""
+    select_idx, report_idx = train_test_split(
+        test_idx, test_size=0.5, random_state=42, stratify=y.iloc[test_idx]
+    )
+    return np.sort(select_idx), np.sort(report_idx)
+
+def build_lean_model(df, feature_cols, base_model, max_auc_loss=0.005, min_gain_share=0.01,
+                     min_features=8, distill=False):
+    """Search for a compact serving model and report its accuracy/latency trade-off
+
+    Candidates early-stop on, and are pruned and selected by, one half of
+    the held-out rows ('select_auc'); 'auc' in the report comes from the
+    other half, which no candidate has seen.
+    """
+    print("\n" + "="*60)
+    print("LEAN SERVING MODEL SEARCH")
+    print("="*60)
+    
+    y = df['approved']
+    # Same split as train_advanced_model so AUCs are comparable
+    train_idx, test_idx = train_test_split(
+        np.arange(len(df)), test_size=0.2, random_state=42, stratify=y
+    )
+    select_idx, report_idx = selection_split(y, test_idx)
+    cols = df.columns.get_indexer(feature_cols)
+    X_train, X_select, X_test = df.iloc[train_idx, cols], df.iloc[select_idx, cols], df.iloc[report_idx, cols]
+    y_train, y_select, y_test = y.iloc[train_idx], y.iloc[select_idx], y.iloc[report_idx]
+    base_params = {k: v for k, v in base_model.params.items() if k not in ('num_iterations', 'early_stopping_round')}
+    
+    def evaluate(name, model, features):
+        info = describe_candidate(name, model, features, X_test, y_test)
+        select_pred = model.predict(X_select[features].to_numpy(dtype=np.float64),
+                                    num_iteration=model.best_iteration or None)
+        info['select_auc'] = float(roc_auc_score(y_select, select_pred))
+        return info
+    
+    candidates = [(evaluate('full', base_model, feature_cols), base_model)]
+    base_auc = candidates[0][0]['auc']
+    base_select_auc = candidates[0][0]['select_auc']
+    
+    # 1. Iteratively drop features contributing less than min_gain_share of total gain
+    features = list(feature_cols)
+    model = base_model
+    round_num = 0
+    while True:
+        gain = pd.Series(model.feature_importance(importance_type='gain'), index=features)
+        share = gain / gain.sum()
+        keep = share[share >= min_gain_share].sort_values(ascending=False).index.tolist()
+        if len(keep) < min_features:
+            keep = share.sort_values(ascending=False).index[:min_features].tolist()
+        if len(keep) == len(features):
+            break
+        round_num += 1
+        features = [col for col in feature_cols if col in keep]
+        model = fit_candidate(base_params, X_train[features], y_train, X_select[features], y_select, 500)
+        info = evaluate(f'pruned_{round_num}', model, features)
+        candidates.append((info, model))
+        print(f"  Pruning round {round_num}: {len(features)} features, selection AUC {info['select_auc']:.4f}")
+        if info['select_auc'] < base_select_auc - max_auc_loss or len(features) <= min_features:
+            break
+    
+    # Tree and leaf caps are applied to the smallest feature set still within budget
+    within_budget = [info for info, _ in candidates if info['select_auc'] >= base_select_auc - max_auc_loss]
+    pruned_features = min(within_budget, key=lambda info: info['n_features'])['features']
+    
+    # 2. Smaller trees and fewer rounds on the pruned feature set
+    for num_leaves, max_depth, rounds in [(31, 6, 200), (15, 5, 150), (7, 4, 100)]:
+        params = dict(base_params, num_leaves=num_leaves, max_depth=max_depth, learning_rate=0.05)
+        model = fit_candidate(params, X_train[pruned_features], y_train, X_select[pruned_features], y_select, rounds)
+        info = evaluate(f'capped_{num_leaves}leaves_{rounds}rounds', model, pruned_features)
+        candidates.append((info, model))
+    
+    # 3. Optional distillation: a small booster fit to the full model's probabilities,
+    #    early-stopped on the true labels of the selection rows like every other candidate
+    if distill:
+        teacher = base_model.predict(X_train, num_iteration=base_model.best_iteration)
+        params = dict(base_params, objective='cross_entropy', metric='auc', num_leaves=7, max_depth=4,
+                      learning_rate=0.1, bagging_fraction=1.0, bagging_freq=0)
+        model = fit_candidate(params, X_train[pruned_features], teacher, X_select[pruned_features], y_select, 100)
+        info = evaluate('distilled_7leaves_100rounds', model, pruned_features)
+        candidates.append((info, model))
+    
+    print(f"\n  {'candidate':32} {'sel AUC':>7} {'AUC':>7} {'feats':>5} {'trees':>5} {'KB':>7} {'1-row us':>9} "
+          f"{'batch us/row':>12}")
+    for info, _ in candidates:
+        print(f"  {info['name']:32} {info['select_auc']:7.4f} {info['auc']:7.4f} {info['n_features']:5} {info['n_trees']:5} "
+              f"{info['size_bytes'] / 1024:7.1f} {info['single_row_us']:9.1f} {info['batch_us_per_row']:12.3f}")
+    
+    # Fastest single-row candidate that stays within the AUC budget
+    eligible = [(info, model) for info, model in candidates if info['select_auc'] >= base_select_auc - max_auc_loss]
+    chosen_info, chosen_model = min(eligible, key=lambda item: item[0]['single_row_us'])
+    full_info = candidates[0][0]
+    print(f"\n  Selected {chosen_info['name']}: AUC {chosen_info['auc']:.4f} "
+          f"({chosen_info['auc'] - base_auc:+.4f}), {full_info['single_row_us'] / chosen_info['single_row_us']:.1f}x faster "
+          f"single-row, {full_info['batch_us_per_row'] / chosen_info['batch_us_per_row']:.1f}x faster batch, "
+          f"{full_info['size_bytes'] / chosen_info['size_bytes']:.1f}x smaller")
+    
+    report = {
+        'base_auc': base_auc,
+        'base_select_auc': base_select_auc,
+        'select_rows': len(select_idx),
+        'report_rows': len(report_idx),
+        'max_auc_loss': max_auc_loss,
+        'selected': chosen_info['name'],
+        'candidates': [info for info, _ in candidates]
+    }
+    return chosen_model, chosen_info['features'], report
+
+def save_lean_artifacts(model, features, label_encoders, df, report, directory=MODELS_DIR):
+    """Save the lean model in the standard artifact format (MODEL_PATH for api_v2)"""
+    # The denial-reason model must read the same pruned feature matrix
+    denial_model, denial_reasons = train_denial_reason_model(df, features)
+    
+    importance_df = pd.DataFrame({
+        'feature': features,
+        'importance': model.feature_importance(importance_type='gain')
+    }).sort_values('importance', ascending=False)
+    
+    joblib.dump({
+        'model': model,
+        'label_encoders': label_encoders,
+        'feature_cols': features,
+        'feature_importance': importance_df.to_dict(),
+        'denial_model': denial_model,
+        'denial_reasons': denial_reasons
+    }, os.path.join(directory, 'lean_approval_model.pkl'))
+    
+    with open(os.path.join(directory, 'lean_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"\nLean model saved to {directory}/lean_approval_model.pkl (report: {directory}/lean_report.json)")
+
+def shard_file_name(shard_by, value):
+    return f"{shard_by}_{re.sub(r'[^A-Za-z0-9_.-]', '_', str(value))}.pkl"
+
+def train_shards(df, feature_cols, base_model, shard_by='payer', min_rows=500):
+    """Smaller per-shard boosters, kept only where they beat the global model"""
+    print("\n" + "="*60)
+    print(f"PER-{shard_by.upper()} MODEL SHARDS")
+    print("="*60)
+    
+    y = df['approved']
+    # Same split as train_advanced_model, so the global model has not trained on the held-out rows;
+    # shards early-stop and are selected on one half of them and reported on the other
+    train_idx, test_idx = train_test_split(
+        np.arange(len(df)), test_size=0.2, random_state=42, stratify=y
+    )
+    select_idx, test_idx = selection_split(y, test_idx)
+    cols = df.columns.get_indexer(feature_cols)
+    values = df[shard_by].astype(str).to_numpy()
+    params = {
+        'objective': 'binary',
+        'metric': 'binary_logloss',
+        'num_leaves': 15,
+        'max_depth': 5,
+        'learning_rate': 0.05,
+        'feature_fraction': 0.8,
+        'bagging_fraction': 0.8,
+        'bagging_freq': 5,
+        'min_data_in_leaf': 20,
+        'lambda_l2': 1.0,
+        'verbose': -1,
+        'random_state': 42,
+        'n_jobs': -1
+    }
+    
+    X_select = df.iloc[select_idx, cols].to_numpy(dtype=np.float64)
+    y_select = y.iloc[select_idx].to_numpy()
+    X_test = df.iloc[test_idx, cols].to_numpy(dtype=np.float64)
+    y_test = y.iloc[test_idx].to_numpy()
+    global_select = base_model.predict(X_select, num_iteration=base_model.best_iteration)
+    global_pred = base_model.predict(X_test, num_iteration=base_model.best_iteration)
+    routed_pred = global_pred.copy()
+    
+    shards, report = {}, {}
+    for value in sorted(pd.unique(values)):
+        shard_train = train_idx[values[train_idx] == value]
+        in_select = values[select_idx] == value
+        in_test = values[test_idx] == value
+        entry = {'train_rows': int(len(shard_train)), 'select_rows': int(in_select.sum()),
+                 'test_rows': int(in_test.sum()), 'selected': False}
+        report[value] = entry
+        if (len(shard_train) < min_rows or len(np.unique(y_select[in_select])) < 2
+                or len(np.unique(y_test[in_test])) < 2):
+            entry['skipped'] = f"needs {min_rows} training rows and both outcomes in its selection and test rows"
+            continue
+        
+        X_shard_test = X_test[in_test]
+        model = fit_candidate(
+            params, df.iloc[shard_train, cols], y.iloc[shard_train],
+            X_select[in_select], y_select[in_select], 400
+        )
+        shard_select = model.predict(X_select[in_select], num_iteration=model.best_iteration)
+        shard_pred = model.predict(X_shard_test, num_iteration=model.best_iteration)
+        shard_us, _ = measure_latency(model, X_shard_test, batch_rows=1000)
+        global_us, _ = measure_latency(base_model, X_shard_test, batch_rows=1000)
+        entry.update({
+            'select_auc_shard': float(roc_auc_score(y_select[in_select], shard_select)),
+            'select_auc_global': float(roc_auc_score(y_select[in_select], global_select[in_select])),
+            'auc_shard': float(roc_auc_score(y_test[in_test], shard_pred)),
+            'auc_global': float(roc_auc_score(y_test[in_test], global_pred[in_test])),
+            'single_row_us_shard': round(shard_us, 1),
+            'single_row_us_global': round(global_us, 1),
+            'n_trees': model.best_iteration or model.num_trees(),
+            'size_bytes': len(model.model_to_string(num_iteration=model.best_iteration or None).encode())
+        })
+        # A shard only serves traffic when it is at least as accurate as the fallback on the
+        # selection rows; the test rows it is reported on played no part in that choice
+        if entry['select_auc_shard'] >= entry['select_auc_global']:
+            entry['selected'] = True
+            entry['path'] = shard_file_name(shard_by, value)
+            shards[value] = model
+            routed_pred[in_test] = shard_pred
+    
+    print(f"\n  {shard_by:16} {'train':>6} {'AUC shard':>9} {'AUC global':>10} {'1-row us':>14} {'serves':>6}")
+    for value, entry in report.items():
+        if 'auc_shard' not in entry:
+            print(f"  {value:16} {entry['train_rows']:6}  (global fallback: too few rows)")
+            continue
+        print(f"  {value:16} {entry['train_rows']:6} {entry['auc_shard']:9.4f} {entry['auc_global']:10.4f} "
+              f"{entry['single_row_us_shard']:6.1f} vs {entry['single_row_us_global']:5.1f} "
+              f"{'shard' if entry['selected'] else 'global':>6}")
+    
+    summary = {
+        'shard_by': shard_by,
+        'feature_cols': list(feature_cols),
+        # api_v2 only routes to these shards next to this exact global model
+        'global_model': model_fingerprint(base_model),
+        'training_date': pd.Timestamp.now().isoformat(),
+        'auc_global': float(roc_auc_score(y_test, global_pred)),
+        'auc_routed': float(roc_auc_score(y_test, routed_pred)),
+        'shards': report
+    }
+    print(f"\n  Test AUC global {summary['auc_global']:.4f}, routed through shards {summary['auc_routed']:.4f}")
+    return shards, summary
+
+def save_shard_artifacts(shards, manifest, directory='models/shards'):
+    """One joblib file per selected shard plus manifest.json (read by api_v2)"""
+    os.makedirs(directory, exist_ok=True)
+    for value, model in shards.items():
+        entry = manifest['shards'][value]
+        joblib.dump({'model': model, 'shard_by': manifest['shard_by'], 'value': value},
+                    os.path.join(directory, entry['path']))
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"\n{len(shards)} shard models saved to {directory}/ (manifest: {directory}/manifest.json)")
+
+def encode_with_saved_encoders(df, label_encoders):
+    """Encode categoricals with existing encoders, appending unseen categories.
+
+    New values get the next free integer code, so codes already used by the
+    trees stay stable and no re-encode of historical data is needed.
+    """
+    added = {}
+    for col, le in label_encoders.items():
+        if col not in df.columns:
+            continue
+        values = df[col].astype(str)
+        known = set(le.classes_)
+        unseen = [v for v in pd.unique(values) if v not in known]
+        if unseen:
+            le.classes_ = np.concatenate([le.classes_, np.array(unseen, dtype=le.classes_.dtype)])
+            added[col] = unseen
+        mapping = {cls: code for code, cls in enumerate(le.classes_)}
+        df[f'{col}_encoded'] = values.map(mapping).astype(int)
+    return df, added
+
+def prepare_incremental_data(df, label_encoders, feature_cols):
+    """Engineer and encode new cases exactly like the saved model expects"""
+    df = engineer_features(df)
+    df, added = encode_with_saved_encoders(df, label_encoders)
+    
+    for col in BOOLEAN_FEATURES:
+        if col in df.columns:
+            df[col] = df[col].astype(int)
+    
+    # Older artifacts may reference columns the new batch cannot produce
+    for col in feature_cols:
+        if col not in df.columns:
+            df[col] = 0
+    
+    return df, added
+
+def score_validation(model, X, y):
+    """AUC and log loss for a validation split (AUC is None for single-class splits)"""
+    pred = model.predict(X, num_iteration=model.best_iteration or None)
+    auc = roc_auc_score(y, pred) if y.nunique() > 1 else None
+    eps = 1e-15
+    clipped = np.clip(pred, eps, 1 - eps)
+    logloss = float(-np.mean(y * np.log(clipped) + (1 - y) * np.log(1 - clipped)))
+    return pred, auc, logloss
+
+def served_trees(model):
+    """Iterations the API predicts with: up to best_iteration (-1 or 0 when a loaded booster has none)"""
+    return model.best_iteration if model.best_iteration > 0 else model.current_iteration()
+
+def continue_training(new_df, artifacts, num_boost_round=100):
+    """Continue boosting the saved model on newly labelled cases"""
+    print("\n" + "="*60)
+    print("INCREMENTAL TRAINING")
+    print("="*60)
+    
+    start = time.perf_counter()
+    previous_model = artifacts['model']
+    label_encoders = artifacts['label_encoders']
+    feature_cols = artifacts['feature_cols']
+    previous_trees = served_trees(previous_model)
+    
+    df, added_categories = prepare_incremental_data(new_df, label_encoders, feature_cols)
+    for col, values in added_categories.items():
+        print(f"  New {col} categories: {', '.join(values)}")
+    
+    X = df[feature_cols]
+    y = df['approved']
+    stratify = y if y.value_counts().min() >= 2 else None
+    X_train, X_valid, y_train, y_valid = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=stratify
+    )
+    
+    # Reuse the stored parameters so new trees match the existing ensemble
+    params = {k: v for k, v in previous_model.params.items() if k not in ('num_iterations', 'early_stopping_round')}
+    train_data = lgb.Dataset(X_train, label=y_train)
+    valid_data = lgb.Dataset(X_valid, label=y_valid, reference=train_data)
+    
+    # Only the trees up to best_iteration are served, so continue from there
+    previous_model.free_dataset()
+    init_model = previous_model
+    if previous_model.best_iteration and previous_model.best_iteration < previous_model.current_iteration():
+        init_model = lgb.Booster(model_str=previous_model.model_to_string(num_iteration=previous_model.best_iteration))
+    
+    model = lgb.train(
+        params,
+        train_data,
+        valid_sets=[valid_data],
+        num_boost_round=num_boost_round,
+        init_model=init_model,
+        callbacks=[
+            lgb.early_stopping(max(5, num_boost_round // 10), verbose=False),
+            lgb.log_evaluation(0)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+    
+    previous_pred, previous_auc, previous_logloss = score_validation(previous_model, X_valid, y_valid)
+    new_pred, new_auc, new_logloss = score_validation(model, X_valid, y_valid)
+    
+    report = {
+        'new_cases': len(df),
+        'previous_trees': previous_trees,
+        'total_trees': served_trees(model),
+        'trees_added': served_trees(model) - previous_trees,
+        'seconds': round(elapsed, 3),
+        'new_categories': added_categories,
+        'validation': {
+            'cases': len(y_valid),
+            'previous_auc': previous_auc,
+            'new_auc': new_auc,
+            'previous_logloss': previous_logloss,
+            'new_logloss': new_logloss,
+            'mean_abs_prediction_shift': float(np.mean(np.abs(new_pred - previous_pred)))
+        },
+        'date': pd.Timestamp.now().isoformat()
+    }
+    
+    def fmt(value):
+        return f"{value:.4f}" if value is not None else "n/a"
+    
+    print(f"\n  Trees: {previous_trees} -> {report['total_trees']} (+{report['trees_added']})")
+    print(f"  Time: {elapsed:.2f}s on {len(df)} new cases")
+    print(f"  Validation AUC: {fmt(previous_auc)} -> {fmt(new_auc)}")
+    print(f"  Validation log loss: {previous_logloss:.4f} -> {new_logloss:.4f}")
+    print(f"  Mean prediction shift: {report['validation']['mean_abs_prediction_shift']:.4f}")
+    
+    # The candidate never trained on these rows, so the performance gate scores on them
+    return model, label_encoders, feature_cols, report, df.loc[X_valid.index]
+
+def run_incremental(new_cases_path, data_path, num_boost_round, append=True, gate_budgets=None,
+                    on_regression='stage'):
+    """Continue training from a CSV of new cases and save the updated artifacts"""
+    run_report = RunReport('incremental', data=new_cases_path, rounds=num_boost_round)
+    with run_report.stage('load') as stage:
+        new_df = pd.read_csv(new_cases_path)
+        artifacts = joblib.load(DEPLOYED_MODEL_PATH)
+        stage['rows'] = len(new_df)
+    print(f"Loaded {len(new_df)} newly labelled cases from {new_cases_path}")
+    
+    with run_report.stage('train', rows=len(new_df)):
+        model, label_encoders, feature_cols, report, valid_df = continue_training(
+            new_df.copy(), artifacts, num_boost_round=num_boost_round
+        )
+    
+    importance_df = pd.DataFrame({
+        'feature': feature_cols,
+        'importance': model.feature_importance(importance_type='gain')
+    }).sort_values('importance', ascending=False)
+    
+    history = []
+    if os.path.exists(os.path.join(MODELS_DIR, 'model_config.json')):
+        with open(os.path.join(MODELS_DIR, 'model_config.json')) as f:
+            history = json.load(f).get('incremental_updates', [])
+    history.append(report)
+    
+    # Added trees cost serving latency, so the updated model is gated like a full retrain
+    with run_report.stage('performance gate', rows=len(valid_df)):
+        gate = performance_gate(model, feature_cols, valid_df, artifacts, **(gate_budgets or {}))
+    directory = gate_target(gate, on_regression)
+    run_report.meta['performance_gate'] = {'passed': gate['passed'], 'action': gate['action']}
+    
+    # The denial-reason model is carried over unchanged
+    if directory:
+        with run_report.stage('save'):
+            save_model_artifacts(
+                model, label_encoders, feature_cols, importance_df,
+                extra_config={
+                    'incremental_updates': history,
+                    'training_report': TRAINING_REPORT_FILE,
+                    'performance_gate': gate
+                },
+                denial_model=artifacts.get('denial_model'),
+                denial_reasons=artifacts.get('denial_reasons'),
+                directory=directory
+            )
+        
+        # Drift reference and similar cases describe everything the model has now seen,
+        # so new payers or procedures are neither flagged as unseen nor missing from search
+        combined = pd.concat([load_training_data(data_path), new_df], ignore_index=True) \
+            if os.path.exists(data_path) else new_df.copy()
+        combined, _ = prepare_incremental_data(combined, copy.deepcopy(label_encoders), feature_cols)
+        with run_report.stage('drift reference', rows=len(combined)):
+            save_drift_reference(build_drift_reference(combined, feature_cols, CATEGORICAL_COLUMNS),
+                                 path=os.path.join(directory, 'drift_reference.json'))
+        with run_report.stage('similar cases', rows=int(combined['approved'].sum())):
+            SimilarCaseIndex.build(combined, importance_df).save(os.path.join(directory, 'similar_cases'))
+        
+        if os.path.exists(os.path.join(MODELS_DIR, 'shards', 'manifest.json')):
+            print(f"  Shards in {MODELS_DIR}/shards/ were selected against the previous model and no longer "
+                  f"match its fingerprint; api_v2 serves the global model until they are retrained with --shards")
+    
+    # Keep the master CSV complete so the next full retrain sees these cases
+    if append:
+        if os.path.exists(data_path):
+            # Appended rows are read back by position, so they must follow the existing header
+            header = pd.read_csv(data_path, nrows=0).columns
+            missing = [col for col in header if col not in new_df.columns]
+            extra = [col for col in new_df.columns if col not in header]
+            if missing:
+                print(f"  New cases lack {', '.join(missing)}; appended as empty")
+            if extra:
+                print(f"  {data_path} has no column for {', '.join(extra)}; not appended")
+            new_df.reindex(columns=header).to_csv(data_path, mode='a', header=False, index=False)
+        else:
+            new_df.to_csv(data_path, index=False)
+        print(f"Appended {len(new_df)} cases to {data_path}")
+    
+    run_report.save(directory)
+    report['performance_gate'] = gate
+    return report
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default='training_data_v2.csv', help='Training CSV path')
+    parser.add_argument('--incremental', type=str, default=None,
+                        help='CSV of newly labelled cases to continue boosting the saved model with')
+    parser.add_argument('--rounds', type=int, default=100, help='Maximum boosting rounds added in incremental mode')
+    parser.add_argument('--no-append', action='store_true',
+                        help='Do not append incremental cases to the training CSV')
+    parser.add_argument('--lean', action='store_true',
+                        help='Also search for a compact serving model (pruned features, capped trees)')
+    parser.add_argument('--distill', action='store_true',
+                        help='Include a distilled student booster in the lean search')
+    parser.add_argument('--max-auc-loss', type=float, default=0.005,
+                        help='Largest AUC drop accepted for the lean model')
+    parser.add_argument('--shards', choices=['payer', 'procedure_category'], default=None,
+                        help='Also train per-payer or per-procedure-category shard models')
+    parser.add_argument('--shard-min-rows', type=int, default=500,
+                        help='Minimum training rows for a shard to get its own model')
+    parser.add_argument('--max-latency-increase', type=float, default=0.25,
+                        help='Largest relative single-row or batch latency increase over the deployed model')
+    parser.add_argument('--max-size-increase', type=float, default=0.5,
+                        help='Largest relative model size increase over the deployed model')
+    parser.add_argument('--max-auc-drop', type=float, default=None,
+                        help='Largest AUC drop against the deployed model (default: report only)')
+    parser.add_argument('--on-regression', choices=['stage', 'refuse', 'force'], default='stage',
+                        help=f'When a budget is exceeded: write to {STAGING_DIR}/, save nothing, or deploy anyway')
+    parser.add_argument('--promote-staged', action='store_true',
+                        help=f'Move the candidate in {STAGING_DIR}/ into {MODELS_DIR}/ and exit')
+    args = parser.parse_args()
+    gate_budgets = {
+        'max_latency_increase': args.max_latency_increase,
+        'max_size_increase': args.max_size_increase,
+        'max_auc_drop': args.max_auc_drop
+    }
+    
+    if args.promote_staged:
+        promote_staged()
+        return
+    
+    if args.incremental:
+        report = run_incremental(args.incremental, args.data, args.rounds, append=not args.no_append,
+                                 gate_budgets=gate_budgets, on_regression=args.on_regression)
+        if report['performance_gate']['action'] == 'refused':
+            sys.exit(1)
+        return
+    
+    report = RunReport('full', data=args.data, lean=args.lean, shards=args.shards)
+    
     # Load the new training data
     print("Loading training data...")
-    df = pd.read_csv('training_data_v2.csv')
+    with report.stage('load') as stage:
+        df = load_training_data(args.data)
+        stage['rows'] = len(df)
     
     print(f"Loaded {len(df)} cases with {len(df.columns)} raw features")
+    report.meta.update({'rows': len(df), 'raw_columns': len(df.columns)})
     
     # Prepare data
-    df_prepared, feature_cols, label_encoders = prepare_model_data(df)
+    with report.stage('features', rows=len(df), df=df):
+        df_prepared, feature_cols, label_encoders = prepare_model_data(df, report)
+    report.meta['features'] = len(feature_cols)
     
     # Train model
-    model, X_train, X_test, y_test, test_pred = train_advanced_model(
-        df_prepared, feature_cols
-    )
+    with report.stage('train', rows=len(df_prepared)):
+        model, X_train, X_test, y_test, test_pred = train_advanced_model(
+            df_prepared, feature_cols, report
+        )
+        # Split copies are not needed past evaluation
+        del X_train, X_test
     
     # Analyze insights
-    importance_df = analyze_model_insights(
-        model, feature_cols, df_prepared, label_encoders
-    )
+    with report.stage('insights', rows=len(df_prepared)):
+        importance_df = analyze_model_insights(
+            model, feature_cols, df_prepared, label_encoders
+        )
+    
+    # Denial reasons, trained on the same engineered features
+    with report.stage('denial model', rows=int((df_prepared['approved'] == 0).sum())):
+        denial_model, denial_reasons = train_denial_reason_model(df_prepared, feature_cols)
+    
+    # Benchmark against the deployed model on the same held-out rows before overwriting it
+    test_idx = train_test_split(
+        np.arange(len(df_prepared)), test_size=0.2, random_state=42, stratify=df_prepared['approved']
+    )[1]
+    with report.stage('performance gate', rows=len(test_idx)):
+        gate = performance_gate(
+            model, feature_cols, df_prepared.iloc[test_idx], load_deployed_artifacts(), **gate_budgets
+        )
+    directory = gate_target(gate, args.on_regression)
+    report.meta['performance_gate'] = {'passed': gate['passed'], 'action': gate['action']}
+    if directory is None:
+        report.save(None)
+        sys.exit(1)
     
     # Save everything
-    save_model_artifacts(model, label_encoders, feature_cols, importance_df)
+    with report.stage('save'):
+        save_model_artifacts(
+            model, label_encoders, feature_cols, importance_df,
+            extra_config={'training_report': TRAINING_REPORT_FILE, 'performance_gate': gate},
+            denial_model=denial_model, denial_reasons=denial_reasons, directory=directory
+        )
+    
+    if args.lean:
+        with report.stage('lean search', rows=len(df_prepared)):
+            lean_model, lean_features, lean_report = build_lean_model(
+                df_prepared, feature_cols, model,
+                max_auc_loss=args.max_auc_loss, distill=args.distill
+            )
+            save_lean_artifacts(lean_model, lean_features, label_encoders, df_prepared, lean_report,
+                                directory=directory)
+    
+    if args.shards:
+        with report.stage('shards', rows=len(df_prepared)):
+            shards, manifest = train_shards(
+                df_prepared, feature_cols, model, shard_by=args.shards, min_rows=args.shard_min_rows
+            )
+            if manifest['auc_routed'] < manifest['auc_global']:
+                # Shards only exist to beat the global model; api_v2 ignores any older manifest
+                # since it names a different global model
+                print(f"  Shards not saved: routed test AUC {manifest['auc_routed']:.4f} is below "
+                      f"the global model's {manifest['auc_global']:.4f}")
+            else:
+                save_shard_artifacts(shards, manifest, directory=os.path.join(directory, 'shards'))
+    
+    # Reference distributions for live drift monitoring
+    with report.stage('drift reference', rows=len(df_prepared)):
+        save_drift_reference(build_drift_reference(df_prepared, feature_cols, CATEGORICAL_COLUMNS),
+                             path=os.path.join(directory, 'drift_reference.json'))
+    
+    # Approved cases the DenialFighter screen searches for the nearest match
+    with report.stage('similar cases', rows=int(df_prepared['approved'].sum())):
+        SimilarCaseIndex.build(df_prepared, importance_df).save(os.path.join(directory, 'similar_cases'))
+    
+    report.save(directory)
     
     print("\n" + "="*60)
     print("ADVANCED MODEL TRAINING COMPLETE!")
     print("="*60)
     print("\nThe model discovered complex patterns from noisy, realistic data.")
-    print("It can now make actionable recommendations for doctors!")
\ No newline at end of file
+    print("It can now make actionable recommendations for doctors!")
+
+if __name__ == "__main__":
+    main()